@@ -0,0 +1,51 @@
+"""Compares two result files written by `invoke_bench.py` and reports regressions.
+
+A case regresses if its p50 or p99 latency, or its allocated bytes, grew by more than
+`--threshold` (default 0.2, that is 20%). The exit status is 1 if any case regressed.
+
+    python3 bench/compare.py bench/results/invoke-1.0.3-py3.11.json bench/results/invoke-1.0.4-py3.11.json
+"""
+import argparse
+import json
+import sys
+
+METRICS = ("p50_ns", "p99_ns", "alloc_bytes")
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+def compare(old, new, threshold):
+    """Returns `(rows, regressed)` where each row is `(case, metric, old, new, ratio)`."""
+    rows = []
+    regressed = False
+    for case, before in old["results"].items():
+        after = new["results"].get(case)
+        if after is None:
+            continue
+        for metric in METRICS:
+            a, b = before[metric], after[metric]
+            ratio = b / a if a else (1.0 if b == a else float("inf"))
+            rows.append((case, metric, a, b, ratio))
+            if ratio > 1 + threshold:
+                regressed = True
+    return rows, regressed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=.2)
+    args = parser.parse_args(argv)
+
+    old, new = load(args.old), load(args.new)
+    print(f"{old['version']} (python {old['python']}) -> {new['version']} (python {new['python']})")
+    rows, regressed = compare(old, new, args.threshold)
+    print(f"{'case':<24}{'metric':<14}{'old':>12}{'new':>12}{'ratio':>8}")
+    for case, metric, a, b, ratio in rows:
+        flag = "  !" if ratio > 1 + args.threshold else ""
+        print(f"{case:<24}{metric:<14}{a:>12.0f}{b:>12.0f}{ratio:>8.2f}{flag}")
+    return 1 if regressed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
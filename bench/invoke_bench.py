@@ -0,0 +1,175 @@
+"""Measures the per-call cost of `invoke()` in each of the SDK's modes.
+
+Cases:
+
+    disabled    FAILURE_FLAGS_ENABLED is unset
+    empty       enabled, the sidecar returns no experiments
+    rate-miss   enabled, the only experiment has a rate of 0 and never impacts
+    impacted    enabled, the only experiment has a rate of 1 and a latency effect
+
+Every enabled case runs once per lookup path: `fetch` (one sidecar round trip per call),
+`cache` (see `enable_cache()`), and `subscription` (see `subscribe()`). The sidecar is a
+`failureflags.testing.SidecarSimulator` in this process. `time.sleep` is replaced with a
+no-op so that the `impacted` cases show the SDK's work rather than the injected delay.
+
+For each case the latency of individual calls is sampled for p50, p99 and mean, less
+the overhead of reading the clock. A second pass under tracemalloc reports the peak
+bytes allocated by a call and the bytes still held afterwards. In the `fetch` cases both include the simulator's own allocations.
+
+Results are printed and written as JSON. Run with `make bench` or
+`python3 bench/invoke_bench.py [--calls N] [--output FILE]` and compare two result files
+with `python3 bench/compare.py OLD NEW`.
+"""
+import argparse
+import array
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from unittest.mock import patch
+
+os.environ.pop("FAILURE_FLAGS_ENABLED", None)
+
+import failureflags
+from failureflags.testing import SidecarSimulator
+
+def experiment(rate):
+    return {"guid": f"bench-{rate}", "failureFlagName": "bench", "rate": rate,
+            "selector": {"route": "/"}, "effect": {"latency": 10}}
+
+CASES = {
+    "empty": [],
+    "rate-miss": [experiment(0)],
+    "impacted": [experiment(1)],
+}
+
+LOOKUPS = ("fetch", "cache", "subscription")
+
+def clockOverhead(calls=100000):
+    """Returns the median cost in nanoseconds of the two clock reads around each sample."""
+    clock = time.perf_counter_ns
+    samples = []
+    for _ in range(calls):
+        start = clock()
+        samples.append(clock() - start)
+    return statistics.median(samples)
+
+def sample(flag, calls, overhead):
+    """Returns the latency of `calls` individual invocations in nanoseconds, sorted."""
+    clock = time.perf_counter_ns
+    invoke = flag.invoke
+    samples = []
+    for _ in range(calls):
+        start = clock()
+        invoke()
+        samples.append(clock() - start)
+    samples.sort()
+    return [max(s - overhead, 0) for s in samples]
+
+def allocations(flag, calls):
+    """Returns `(peak, retained)` bytes per call measured with tracemalloc."""
+    invoke = flag.invoke
+    # allocated up front and unboxed so that storing results does not show up as allocations
+    peaks = array.array("q", bytes(8 * calls))
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        for i in range(calls):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            invoke()
+            peaks[i] = tracemalloc.get_traced_memory()[1] - before
+        retained = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+    return statistics.median(peaks), max(retained, 0) / calls
+
+def measure(flag, calls, overhead):
+    for _ in range(min(1000, calls)):
+        flag.invoke()
+    samples = sample(flag, calls, overhead)
+    peak, retained = allocations(flag, max(calls // 10, 1))
+    return {
+        "p50_ns": samples[len(samples) // 2],
+        "p99_ns": samples[min(int(len(samples) * .99), len(samples) - 1)],
+        "mean_ns": statistics.mean(samples),
+        "alloc_bytes": peak,
+        "retained_bytes": retained,
+    }
+
+def measureEnabled(experiments, lookup, calls, overhead):
+    with SidecarSimulator(experiments) as sidecar, patch.object(failureflags.time, "sleep", lambda seconds: None):
+        flag = failureflags.FailureFlag("bench", {"route": "/"}, timeout=1, endpoint=sidecar.endpoint)
+        try:
+            if lookup == "cache":
+                failureflags.enable_cache(ttl=3600)
+            elif lookup == "subscription":
+                failureflags.subscribe(sidecar.streamUrl)
+                sidecar.publish("reset", experiments)
+                if not failureflags._subscription.wait(5):
+                    raise RuntimeError("the experiment stream did not become ready")
+            return measure(flag, calls, overhead)
+        finally:
+            failureflags.unsubscribe()
+            failureflags.disable_cache()
+
+def run(calls, fetchCalls, overhead):
+    results = {}
+    failureflags.reload_config()
+    results["disabled"] = measure(failureflags.FailureFlag("bench", {"route": "/"}), calls, overhead)
+
+    os.environ["FAILURE_FLAGS_ENABLED"] = "TRUE"
+    failureflags.reload_config()
+    failureflags.breaker.reset()
+    try:
+        for case, experiments in CASES.items():
+            for lookup in LOOKUPS:
+                n = fetchCalls if lookup == "fetch" else calls
+                results[f"{case}/{lookup}"] = measureEnabled(experiments, lookup, n, overhead)
+    finally:
+        del os.environ["FAILURE_FLAGS_ENABLED"]
+        failureflags.reload_config()
+    return results
+
+def report(results):
+    print(f"{'case':<24}{'p50 ns':>10}{'p99 ns':>10}{'mean ns':>10}{'alloc B':>10}{'held B':>10}")
+    for case, r in results.items():
+        print(f"{case:<24}{r['p50_ns']:>10.0f}{r['p99_ns']:>10.0f}{r['mean_ns']:>10.0f}"
+              f"{r['alloc_bytes']:>10.0f}{r['retained_bytes']:>10.1f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=100000,
+                        help="calls per case without I/O (default 100000)")
+    parser.add_argument("--fetch-calls", type=int, default=2000,
+                        help="calls per case that fetch from the sidecar (default 2000)")
+    parser.add_argument("--output", default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results",
+        f"invoke-{failureflags.VERSION}-py{sys.version_info[0]}.{sys.version_info[1]}.json"),
+        help="where to write the JSON results")
+    args = parser.parse_args(argv)
+
+    overhead = clockOverhead()
+    results = run(args.calls, args.fetch_calls, overhead)
+    report(results)
+    document = {
+        "version": failureflags.VERSION,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "calls": args.calls,
+        "fetchCalls": args.fetch_calls,
+        "clockOverheadNs": overhead,
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    print(f"wrote {args.output}")
+    return document
+
+if __name__ == '__main__':
+    main()
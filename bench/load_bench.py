@@ -0,0 +1,38 @@
+"""Drives `invoke()` from many threads against a local sidecar simulator.
+
+Reports throughput and tail latency of the whole SDK path, including the transport, under
+concurrency. The simulator can add latency to every response to model a busy sidecar.
+Run with `make load` or
+`python3 bench/load_bench.py [--threads N] [--calls N] [--latency SECONDS] [--cache]`.
+"""
+import argparse
+import json
+import os
+
+import failureflags
+from failureflags.testing import SidecarSimulator, runLoad
+
+EXPERIMENTS = [{"guid": "load", "failureFlagName": "load", "rate": 0, "selector": {}, "effect": {"latency": 10}}]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--calls", type=int, default=2000, help="invoke() calls per thread")
+    parser.add_argument("--latency", type=float, default=0, help="seconds the sidecar waits before responding")
+    parser.add_argument("--cache", action="store_true", help="enable the experiment cache")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    os.environ["FAILURE_FLAGS_ENABLED"] = "TRUE"
+    failureflags.reload_config()
+    if args.cache:
+        failureflags.enable_cache()
+    with SidecarSimulator(EXPERIMENTS) as sidecar:
+        sidecar.program(latency=args.latency)
+        flags = lambda index: [failureflags.FailureFlag("load", {"worker": str(index)}, timeout=1,
+                                                        endpoint=sidecar.endpoint)]
+        report = runLoad(flags, threads=args.threads, calls=args.calls)
+    print(json.dumps(report.asDict(), indent=2) if args.json else report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Compares the per-call latency of `fetch()` over TCP loopback and a Unix domain socket.
+
+Both transports talk to a `failureflags.testing.SidecarSimulator` in this process. Run with `make bench` or
+`python3 bench/transport_bench.py [calls]`.
+"""
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import failureflags
+from failureflags.testing import SidecarSimulator
+
+EXPERIMENTS = [{"guid": "6884c0df-ed70-4bc8-84c0-dfed703bc8a7", "failureFlagName": "bench",
+                "rate": 1, "selector": {}, "effect": {"latency": 10}}]
+
+def measure(sidecar, calls):
+    endpoint = sidecar.endpoint
+    flag = failureflags.FailureFlag("bench", {"transport": endpoint}, timeout=1, endpoint=endpoint)
+    for _ in range(min(100, calls)):
+        flag.fetch()
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter_ns()
+        flag.fetch()
+        samples.append(time.perf_counter_ns() - start)
+    # every call must have been a round trip to the sidecar, not a short circuit
+    assert len(sidecar.requests) == min(100, calls) + calls, "fetch() did not reach the sidecar"
+    samples.sort()
+    return {
+        "p50": samples[len(samples) // 2] / 1000,
+        "p99": samples[int(len(samples) * .99)] / 1000,
+        "mean": statistics.mean(samples) / 1000,
+    }
+
+def main(calls):
+    os.environ["FAILURE_FLAGS_ENABLED"] = "TRUE"
+    failureflags.reload_config()
+    failureflags.breaker.reset()
+    directory = tempfile.mkdtemp()
+    try:
+        with SidecarSimulator(EXPERIMENTS) as tcp, \
+             SidecarSimulator(EXPERIMENTS, unixSocket=os.path.join(directory, "sidecar.sock")) as uds:
+            results = {"tcp": measure(tcp, calls), "uds": measure(uds, calls)}
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    print(f"fetch() latency over {calls} calls (microseconds)")
+    print(f"{'transport':<10}{'p50':>10}{'p99':>10}{'mean':>10}")
+    for name, r in results.items():
+        print(f"{name:<10}{r['p50']:>10.1f}{r['p99']:>10.1f}{r['mean']:>10.1f}")
+    return results
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
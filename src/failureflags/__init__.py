@@ -1,8 +1,8 @@
-from urllib.request import urlopen, Request
 from random import random
-import json
+import functools
 import collections
 import os
+import threading
 import time
 
 import logging
@@ -11,8 +11,599 @@ from logging import NullHandler
 logger = logging.getLogger(__name__)
 logger.addHandler(NullHandler())
 
+from .breaker import breaker
+from .cache import ExperimentCache, SamplingGate, cacheKey, fromEnvironment as _cacheFromEnvironment, gateFromEnvironment as _gateFromEnvironment
+from .plan import Unresolvable, compileExperiments, setExceptionAllowlist
+from .hooks import errorCause, CAUSE_CIRCUIT_OPEN, CAUSE_TIMEOUT
+from .timeouts import AdaptiveTimeout
+from .patch import applyPatches
+from .limits import LatencyLimiter, deadline as _deadline, remaining as _remaining, fromEnvironment as _limiterFromEnvironment, DEADLINE as _DEADLINE
+from .warm import Warmer, loadManifest as _loadManifest
+from .trace import DecisionTrace, installSignalHandler as _installSignalHandler, fromEnvironment as _traceFromEnvironment, DEFAULT_SIZE as _TRACE_SIZE
+from .scope import scoped_labels as _scopedLabels, current as _currentScope, snapshot as _snapshot, currentSnapshot as _currentSnapshot
+from .local import LocalExperiments, FileLoader, definitions as _definitions, fromEnvironment as _localFromEnvironment
+
 VERSION = "1.0.3"
 
+# The sidecar endpoint, either http://host:port or unix:///path/to/socket
+SIDECAR_ENDPOINT = os.environ.get("FAILURE_FLAGS_ENDPOINT", "http://localhost:5032")
+
+# HTTP status codes that mean the sidecar does not implement the batch endpoint
+_BATCH_UNSUPPORTED = (404, 405, 501)
+
+# The most FailureFlags interned by FailureFlag.get()
+REGISTRY_SIZE = 4096
+
+# Seconds the background prefetch of declared flags waits for the sidecar, see register()
+PREFETCH_TIMEOUT = 1
+
+# The label identifying this SDK in every experiment request
+SDK_VERSION_LABEL = "failure-flags-sdk-version"
+
+# Label value types whose labels and request body can be reused, see FailureFlag._staticLabels()
+_SCALARS = frozenset((str, int, float, bool, type(None)))
+
+# The patched data of a FailureFlag whose data no `data` effect changed, see FailureFlag.data
+_UNPATCHED = object()
+
+# Resolved once at import so that a disabled invoke() never touches os.environ, see reload_config()
+_enabled = "FAILURE_FLAGS_ENABLED" in os.environ
+
+_registry = {}
+_registryLock = threading.Lock()
+_cache = _cacheFromEnvironment()
+_gate = _gateFromEnvironment()
+_local = _localFromEnvironment()
+_subscription = None
+_hooks = None
+_adaptive = None
+_limiter = _limiterFromEnvironment()
+_warmer = None
+_trace = _traceFromEnvironment()
+_batchSupported = True
+
+# Names imported by _loadTransport() on the first enabled fetch instead of at import
+_TRANSPORT_NAMES = frozenset(("Request", "urlopen", "sidecarURL", "codec", "transport", "Subscription"))
+_transportLoaded = False
+
+def _loadTransport():
+    """Imports the sidecar transport, urllib.request and the codecs.
+
+    They account for most of the cost of importing this package, and an inert SDK never
+    needs them. Names already bound in this module, such as ones replaced by a test, are
+    left alone.
+    """
+    global _transportLoaded
+    import importlib
+    from urllib.request import Request
+    # `from . import` would ask this module for the names first, see __getattr__
+    codec = importlib.import_module(".codec", __name__)
+    transport = importlib.import_module(".transport", __name__)
+    from .subscription import Subscription
+    namespace = globals()
+    for name, value in (("Request", Request), ("urlopen", transport.urlopen), ("sidecarURL", transport.sidecarURL),
+                        ("codec", codec), ("transport", transport), ("Subscription", Subscription)):
+        namespace.setdefault(name, value)
+    _transportLoaded = True
+
+def __getattr__(name):
+    if name in _TRANSPORT_NAMES:
+        _loadTransport()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def reload_config():
+    """Re-reads the FAILURE_FLAGS_ENABLED and FAILURE_FLAGS_ENDPOINT environment variables.
+
+    Both are resolved once when failureflags is imported. Call this after changing
+    either of them at runtime. It applies to existing FailureFlags as well.
+    """
+    global _enabled, SIDECAR_ENDPOINT
+    _enabled = "FAILURE_FLAGS_ENABLED" in os.environ
+    SIDECAR_ENDPOINT = os.environ.get("FAILURE_FLAGS_ENDPOINT", "http://localhost:5032")
+
+def enable_cache(ttl=60, maxsize=1024, refresh=True):
+    """Enables the process-wide experiment cache used by `invoke()` and returns it.
+
+    Keyword arguments:
+    ttl -- seconds a fetched set of experiments is considered fresh (default 60).
+    maxsize -- maximum number of flag name and label combinations kept (default 1024).
+    refresh -- True (default) to serve expired entries while refreshing them in the background.
+    """
+    global _cache
+    _cache = ExperimentCache(ttl=ttl, maxsize=maxsize, refresh=refresh)
+    return _cache
+
+def disable_cache():
+    """Disables the experiment cache. Every `invoke()` will fetch from the sidecar again."""
+    global _cache
+    _cache = None
+
+def cache_stats():
+    """Returns the experiment cache counters, or None if the cache is disabled."""
+    return _cache.stats() if _cache is not None else None
+
+def enable_sampling_gate(ttl=10, maxsize=1024):
+    """Lets `invoke()` skip fetches that could not lead to an impact, and returns the gate.
+
+    The experiments fetched for a flag are remembered for `ttl` seconds. During that time
+    `invoke()` rolls the dice first and only fetches if the roll is below the highest rate
+    of the known experiments. A 1% experiment then costs a sidecar round trip on about 1%
+    of calls. Flags without experiments are fetched once per `ttl`, so new experiments are
+    picked up after at most `ttl` seconds. The gate is not used while the experiment cache
+    or a subscription is active.
+
+    Keyword arguments:
+    ttl -- seconds the last fetched experiments of a flag are trusted (default 10).
+    maxsize -- maximum number of flag name and label combinations kept (default 1024).
+    """
+    global _gate
+    _gate = SamplingGate(ttl=ttl, maxsize=maxsize)
+    return _gate
+
+def disable_sampling_gate():
+    """Disables the sampling gate. Every `invoke()` will fetch from the sidecar again."""
+    global _gate
+    _gate = None
+
+def sampling_gate_stats():
+    """Returns the sampling gate counters, or None if the gate is disabled."""
+    return _gate.stats() if _gate is not None else None
+
+def enable_local_mode(path=None, url=None, refresh=5):
+    """Evaluates experiments in-process from a full set of definitions and returns them.
+
+    The definitions (flag names, label selectors, rates and effects) are loaded from the
+    JSON file at `path`, or else from `url` (default GET /experiments on the sidecar
+    endpoint). `fetch()` and `invoke()` then match flags against an in-memory index and
+    never contact the sidecar. Definitions are reloaded in the background every `refresh`
+    seconds, pass None to load them only once. If loading fails the SDK behaves as if
+    local mode was not enabled.
+
+    Local mode can also be enabled by setting FAILURE_FLAGS_EXPERIMENTS_FILE.
+    """
+    global _local
+    if path is not None:
+        loader = FileLoader(path)
+    else:
+        if not _transportLoaded:
+            _loadTransport()
+        loader = functools.partial(_loadDefinitions, url or sidecarURL(SIDECAR_ENDPOINT, "/experiments"))
+    local = LocalExperiments(loader, refresh=refresh)
+    local.load()
+    if hasattr(_local, "stop"):
+        _local.stop()
+    _local = local
+    return local
+
+def disable_local_mode():
+    """Disables local mode, experiments are requested from the sidecar again."""
+    global _local
+    if hasattr(_local, "stop"):
+        _local.stop()
+    _local = None
+
+def enable_shared_snapshot(path=None, url=None, refresh=5, size=None):
+    """Shares one set of experiment definitions between the processes of a host and returns it.
+
+    This is local mode (see `enable_local_mode()`) for prefork servers. The definitions
+    are kept in a memory-mapped snapshot file at `path` (default
+    /dev/shm/failureflags-<uid>.snapshot). One process is elected to load them from
+    `url` (default GET /experiments on the sidecar endpoint) every `refresh` seconds and
+    write them to the snapshot. Every process reads the snapshot without locking and only
+    parses it again when it changed. If the refresher exits another process takes over
+    within `refresh` seconds. A snapshot that has not been rewritten for three refresh
+    intervals is ignored and experiments are requested from the sidecar again.
+
+    Call it before forking workers or in each worker, every process sharing a snapshot
+    must use the same `path`. `size` is the size of the file in bytes (default 1 MiB).
+    Requires a platform with `fcntl.flock()`.
+    """
+    global _local
+    from . import shared
+    if not _transportLoaded:
+        _loadTransport()
+    if hasattr(_local, "stop"):
+        _local.stop()
+    snapshot = shared.SharedSnapshot(path or shared.defaultPath(), size or shared.DEFAULT_SIZE)
+    loader = functools.partial(_loadDefinitions, url or sidecarURL(SIDECAR_ENDPOINT, "/experiments"))
+    local = shared.SharedExperiments(snapshot, loader, refresh=refresh)
+    local.load()
+    _local = local
+    return local
+
+def _loadDefinitions(url, timeout=1):
+    if not _transportLoaded:
+        _loadTransport()
+    request = Request(url, headers={"Accept": codec.JSON})
+    with urlopen(request, timeout=timeout) as response:
+        body = response.read()
+        if response.status < 200 or response.status >= 300:
+            raise ValueError(f"bad status code ({response.status}) while loading experiment definitions")
+    return _definitions(codec.jsonCodec.decode(body))
+
+def fetch_many(flags, timeout=None):
+    """`fetch_many()` requests the active experiments for many FailureFlags in one round trip.
+
+    The names and labels of every flag are sent to the sidecar's batch endpoint in a
+    single request, which goes to the endpoint of the first enabled flag. The result is a
+    list with one list of experiments per flag, in the same order as `flags`. If the
+    sidecar does not support the batch endpoint this function falls back to calling
+    `fetch()` for each flag and remembers that for the life of the process.
+
+    If the experiment cache is enabled the results are also stored in the cache, so
+    subsequent `invoke()` calls for the same flags do not contact the sidecar.
+
+    Like `fetch()` this function raises exceptions if there is a problem communicating
+    with the sidecar. `timeout` overrides the timeout of the batch request, which is the
+    longest `timeout` of the flags by default.
+    """
+    flags, results, pending = _batch(flags)
+    if not pending:
+        return results
+    if _local is not None and _local.ready:
+        return _matchLocally(flags, pending, results)
+    if not _transportLoaded:
+        _loadTransport()
+    if _batchSupported:
+        head = flags[pending[0]]
+        exchange = _Exchange(None, _batchTimeout(flags, pending, timeout))
+        # the fallback below leaves the circuit breaker to fetch()
+        if not exchange.begin(head.debug):
+            return results
+        url, headers, data = _batchRequest(head, flags, pending)
+        try:
+            with urlopen(Request(url, headers=headers, data=data), timeout=exchange.timeout) as response:
+                _readBatch(head, response, pending, results)
+        except BaseException as err:
+            exchange.failed(err)
+            raise
+        exchange.succeeded(response.status)
+    if not _batchSupported:
+        for i in pending:
+            results[i] = flags[i].fetch()
+    _storeBatch(flags, pending, results)
+    return results
+
+# The helpers below are shared by fetch(), fetch_many() and their asyncio counterparts,
+# which only differ in how they talk to the sidecar.
+
+def _headers(data):
+    return {"Content-Type": codec.JSON, "Accept": codec.ACCEPT, "Content-Length": len(data)}
+
+def _batch(flags):
+    """Returns `(flags, results, pending)`: `flags` as a list, an empty result per flag and
+    the indexes of the flags whose experiments are requested."""
+    flags = list(flags)
+    return flags, [[] for _ in flags], [i for i, ff in enumerate(flags) if ff.enabled and len(ff.name) > 0]
+
+def _matchLocally(flags, pending, results):
+    for i in pending:
+        results[i] = list(_local.table.match(flags[i].name, flags[i]._effectiveLabels()))
+    return results
+
+def _batchTimeout(flags, pending, timeout):
+    return timeout if timeout is not None else max(flags[i].timeout for i in pending)
+
+def _batchRequest(head, flags, pending):
+    """Returns the `(url, headers, data)` of a batch request."""
+    if not _transportLoaded:
+        _loadTransport()
+    data = codec.jsonCodec.encode({"flags": [{"name": flags[i].name, "labels": flags[i]._effectiveLabels()}
+                                             for i in pending]})
+    return sidecarURL(head.endpoint or SIDECAR_ENDPOINT, "/experiments"), _headers(data), data
+
+def _readBatch(head, response, pending, results):
+    """Reads a batch response into `results`, or remembers that the sidecar does not
+    support batch requests."""
+    global _batchSupported
+    if response.status in _BATCH_UNSUPPORTED:
+        if head.debug:
+            logger.debug("sidecar does not support batch fetches (%s), falling back", response.status)
+        _batchSupported = False
+        return
+    payload = readPayload(head, response)
+    if isinstance(payload, list):
+        for i, experiments in zip(pending, payload):
+            results[i] = asExperiments(experiments)
+
+def _storeBatch(flags, pending, results):
+    cache = _cache
+    if cache is not None:
+        for i in pending:
+            cache.put(flags[i]._cacheKey(), compileExperiments(results[i]))
+
+class _Exchange:
+    """_Exchange does the bookkeeping around one request to the sidecar: the circuit
+    breaker, the adaptive timeout and hooks. `flag` is None for batch requests."""
+
+    __slots__ = ("flag", "timeout", "hedgeDelay", "adaptive", "hooks", "started")
+
+    def __init__(self, flag, timeout, adaptive=None):
+        self.flag = flag
+        self.timeout = timeout
+        self.hedgeDelay = None
+        self.adaptive = adaptive
+        self.hooks = _hooks
+        self.started = None
+
+    def begin(self, debug):
+        """Returns False if the circuit breaker is open and the sidecar must not be contacted."""
+        hooks = self.hooks
+        if not breaker.allow():
+            if debug:
+                logger.debug("sidecar circuit breaker is open, skipping fetch")
+            if hooks is not None:
+                hooks.fetchFailed(self.flag, 0.0, CAUSE_CIRCUIT_OPEN)
+            return False
+        adaptive = self.adaptive
+        if adaptive is not None:
+            self.timeout = adaptive.timeout()
+            self.hedgeDelay = adaptive.hedgeDelay()
+        if hooks is not None:
+            hooks.fetchStarted(self.flag)
+            if adaptive is not None:
+                hooks.timeoutChosen(self.flag, self.timeout)
+        if hooks is not None or adaptive is not None:
+            self.started = time.perf_counter()
+        return True
+
+    def failed(self, err):
+        """Records a request that raised `err`. Call it for any BaseException: the breaker
+        must hear back from an interrupted or cancelled probe as well."""
+        breaker.failure()
+        if self.started is None:
+            return
+        cause = errorCause(err)
+        if self.adaptive is not None and cause == CAUSE_TIMEOUT:
+            self.adaptive.timedOut(self.timeout)
+        if self.hooks is not None:
+            self.hooks.fetchFailed(self.flag, time.perf_counter() - self.started, cause)
+
+    def succeeded(self, status):
+        """Records a request the sidecar answered with HTTP `status`."""
+        breaker.success()
+        if self.started is None:
+            return
+        duration = time.perf_counter() - self.started
+        if self.adaptive is not None:
+            self.adaptive.observe(duration)
+        if self.hooks is not None:
+            self.hooks.fetchFinished(self.flag, duration, status)
+
+def set_exception_allowlist(modules):
+    """Restricts which modules `exception` effects may import classes from.
+
+    `modules` is a list of module names (a name also allows its submodules), or None to
+    allow any module. `builtins` is always allowed. The allowlist can also be set with the
+    comma separated FAILURE_FLAGS_EXCEPTION_MODULES environment variable.
+    """
+    setExceptionAllowlist(modules)
+
+def set_hooks(hooks):
+    """Registers `hooks`, a `failureflags.hooks.Hooks`, to receive metrics and tracing events.
+
+    Only one set of hooks is active per process. Pass None to remove them. Returns the
+    hooks. See `failureflags.hooks` for the events and `HistogramHooks` for an in-memory
+    Prometheus-style adapter.
+    """
+    global _hooks
+    _hooks = hooks
+    return hooks
+
+def breaker_stats():
+    """Returns the state and counters of the sidecar circuit breaker."""
+    return breaker.stats()
+
+def enable_adaptive_timeout(floor=.001, ceiling=.05, hedge=False, **kwargs):
+    """Derives the timeout of `fetch()` from the observed sidecar round trip time and returns it.
+
+    The timeout follows a high percentile and the moving average of recent round trips,
+    bounded by `floor` and `ceiling` seconds. It replaces the `timeout` of every
+    FailureFlag. With `hedge=True` an asyncio fetch (see `FailureFlag.afetch()`) that is
+    slower than usual is sent a second time on another connection while the first stays
+    in flight, and the first answer wins. Blocking fetches are not hedged. The chosen
+    timeouts and hedges are reported to hooks, see `failureflags.hooks`. Other keyword
+    arguments are passed to `failureflags.timeouts.AdaptiveTimeout`.
+    """
+    global _adaptive
+    _adaptive = AdaptiveTimeout(floor=floor, ceiling=ceiling, hedge=hedge, **kwargs)
+    return _adaptive
+
+def disable_adaptive_timeout():
+    """Disables the adaptive timeout, every FailureFlag uses its own `timeout` again."""
+    global _adaptive
+    _adaptive = None
+
+def adaptive_timeout_stats():
+    """Returns the adaptive timeout state and counters, or None if it is disabled."""
+    return _adaptive.stats() if _adaptive is not None else None
+
+def subscribe(url=None, wait=None):
+    """Switches `invoke()` to subscription mode and returns the `Subscription`.
+
+    A single background connection receives experiment changes from the sidecar and keeps
+    a local experiment table up to date. While the subscription is ready `invoke()` reads
+    that table and performs no I/O. Until then, or while the stream is reconnecting,
+    `invoke()` behaves as if the subscription did not exist.
+
+    Keyword arguments:
+    url -- the sidecar event stream (default /experiments/stream on the sidecar endpoint).
+    wait -- seconds to block until the first snapshot arrives (default None, do not wait).
+    """
+    global _subscription
+    unsubscribe()
+    if not _transportLoaded:
+        _loadTransport()
+    subscription = Subscription(url or sidecarURL(SIDECAR_ENDPOINT, "/experiments/stream"))
+    _subscription = subscription.start()
+    if wait is not None:
+        subscription.wait(wait)
+    return subscription
+
+def unsubscribe():
+    """Stops subscription mode if it is running."""
+    global _subscription
+    subscription, _subscription = _subscription, None
+    if subscription is not None:
+        subscription.stop()
+
+def enable_latency_limits(concurrency=None, budget=None):
+    """Bounds the latency injected in this process and returns the `LatencyLimiter`.
+
+    Keyword arguments:
+    concurrency -- the most calls sleeping on injected latency at the same time.
+    budget -- the most seconds of latency injected per second across all threads.
+
+    A delay that would exceed a limit is skipped and counted, see `latency_limit_stats()`,
+    and reported to hooks as `effectSkipped`. The limits can also be set with
+    FAILURE_FLAGS_LATENCY_CONCURRENCY and FAILURE_FLAGS_LATENCY_BUDGET.
+    """
+    global _limiter
+    _limiter = LatencyLimiter(concurrency=concurrency, budget=budget)
+    return _limiter
+
+def disable_latency_limits():
+    """Removes the latency limits."""
+    global _limiter
+    _limiter = None
+
+def latency_limit_stats():
+    """Returns the latency limiter counters, or None if no limits are set."""
+    return _limiter.stats() if _limiter is not None else None
+
+def enable_decision_trace(size=_TRACE_SIZE, signum=None):
+    """Records the last `size` invoke() decisions in memory and returns the `DecisionTrace`.
+
+    Recording costs no I/O and no formatting, so the trace can stay on under full load.
+    Read it with `decision_trace()`. If `signum` is given, such as `signal.SIGUSR1`, the
+    trace is also written to stderr as JSON lines when the process receives that signal.
+    Signal handlers can only be installed from the main thread. The trace can also be
+    enabled with FAILURE_FLAGS_TRACE_SIZE and FAILURE_FLAGS_TRACE_SIGNAL.
+    """
+    global _trace
+    trace = DecisionTrace(size)
+    if signum is not None:
+        _installSignalHandler(trace, signum)
+    _trace = trace
+    return trace
+
+def disable_decision_trace():
+    """Stops recording invoke() decisions."""
+    global _trace
+    _trace = None
+
+def decision_trace():
+    """Returns the recorded invoke() decisions as dicts, oldest first, or None if the trace
+    is disabled. See `failureflags.trace` for the recorded fields."""
+    return _trace.decisions() if _trace is not None else None
+
+def latency_deadline(seconds):
+    """Returns a context manager that clips latency injected within it to `seconds` from now.
+
+    Use it around the handling of a request with the time left in the caller's budget.
+    Delays are shortened to the time remaining and skipped once the deadline has passed.
+    The deadline is tracked per thread and per asyncio task.
+
+        with failureflags.latency_deadline(.5):
+            FailureFlag("db", {}).invoke()
+    """
+    return _deadline(seconds)
+
+def scoped_labels(labels=None, **kwargs):
+    """Returns a context manager that adds labels to every FailureFlag fetched within it.
+
+    Use it to supply request labels, such as the route or tenant, to flags that are
+    defined once with their static labels. Scoped labels are tracked per thread and per
+    asyncio task, nested scopes add to the enclosing one, and a flag's own labels take
+    precedence.
+
+        with failureflags.scoped_labels(route="/checkout", tenant=tenant):
+            DB_FLAG.invoke()
+    """
+    return _scopedLabels(labels, **kwargs)
+
+def experiment_snapshot(flags=None, timeout=None):
+    """Resolves the experiments of `flags` once and returns a context manager within which
+    `invoke()` reads them from that snapshot.
+
+    `flags` defaults to the flags declared with `register()` and is resolved with a single
+    `fetch_many()` call, using the labels scoped at the time of the call (see
+    `scoped_labels()`). Within the block, in the calling thread or asyncio task, every
+    `invoke()` of these flags sees the same experiments without contacting the sidecar.
+    Other flags are fetched as usual, and so are all flags if the snapshot could not be
+    resolved. `failureflags.middleware` takes a snapshot for every web request.
+
+        with failureflags.scoped_labels(tenant=tenant), failureflags.experiment_snapshot():
+            handle(request)
+    """
+    return _snapshot(_resolveSnapshot(_snapshotFlags(flags), timeout))
+
+def _snapshotFlags(flags):
+    if flags is None:
+        return list(_warmer.flags) if _warmer is not None else []
+    return [_declared(flag) for flag in flags]
+
+def _snapshotOf(flags, results):
+    return {ff._cacheKey(): compileExperiments(experiments) for ff, experiments in zip(flags, results)}
+
+def _resolveSnapshot(flags, timeout=None):
+    if not _enabled or not flags:
+        return None
+    try:
+        return _snapshotOf(flags, fetch_many(flags, timeout))
+    except Exception as err:
+        logger.debug("unable to resolve an experiment snapshot: %s", err)
+        return None
+
+def register(flags, interval=None, wait=None):
+    """Declares the Failure Flags a service uses so that their experiments are prefetched.
+
+    `flags` is a list of FailureFlags, flag names, `(name, labels)` pairs or
+    `{"name": ..., "labels": ...}` objects. The experiments of every declared flag are
+    fetched with `fetch_many()` on a background thread and stored in the experiment
+    cache, which is enabled with its defaults if needed. They are fetched again every
+    `interval` seconds (default half the cache TTL) to keep the cache warm, so the first
+    `invoke()` of a declared flag does not wait for the sidecar.
+
+    Call it at import time, or set FAILURE_FLAGS_MANIFEST to a manifest file (see
+    `failureflags.warm`). `wait` is the number of seconds to block until the first
+    prefetch completed, for example in a readiness check (default None, do not wait).
+    Returns the `Warmer`, or None while the SDK is disabled.
+    """
+    global _warmer
+    if not _enabled:
+        return None
+    declared = [_declared(flag) for flag in flags]
+    if _cache is None:
+        enable_cache()
+    if _warmer is None:
+        prefetch = functools.partial(fetch_many, timeout=PREFETCH_TIMEOUT)
+        _warmer = Warmer(prefetch, interval if interval is not None else _cache.ttl / 2)
+    elif interval is not None:
+        _warmer.interval = interval
+    _warmer.add(declared, lambda ff: cacheKey(ff.name, ff.labels))
+    if wait is not None:
+        _warmer.wait(wait)
+    return _warmer
+
+def unregister():
+    """Forgets every declared flag and stops keeping their experiments warm."""
+    global _warmer
+    warmer, _warmer = _warmer, None
+    if warmer is not None:
+        warmer.stop()
+
+def _declared(flag):
+    if isinstance(flag, FailureFlag):
+        return flag
+    if isinstance(flag, str):
+        return FailureFlag.get(flag)
+    if isinstance(flag, dict):
+        return FailureFlag.get(flag["name"], flag.get("labels"))
+    name, labels = flag
+    return FailureFlag.get(name, labels)
+
 class FailureFlag:
     """FailureFlag represents a point in your code where you want to be able to inject failures dynamically.
     
@@ -20,27 +611,73 @@ class FailureFlag:
     invoke() function is called. Instead of relying on the built-in behavior processing a user can call the
     fetch() function to simply retrieve any active experiments targeting a FailureFlag.
 
-    This package is inert if the FAILURE_FLAGS_ENABLED environment variable is unset.
+    This package is inert if the FAILURE_FLAGS_ENABLED environment variable is unset when
+    failureflags is imported (see `reload_config()`).
 
     This package sends debug logs to a logger named `failureflags`.
     """
 
-    def __init__(self, name, labels, behavior=None, data={}, debug=False, timeout=.001):
+    __slots__ = ("name", "labels", "behavior", "_data", "_patched", "debug", "timeout", "endpoint", "_static", "_wire")
+
+    def __init__(self, name, labels, behavior=None, data={}, debug=False, timeout=.001, endpoint=None):
         """Create a new FailureFlag.
 
         Keyword arguments:
         behavior -- a function to invoke for retrieved experiments instead of the default behavior chain.
         debug -- True or False (default False) to control debug logging.
         data -- Data to be mutated by behaviors and effect data.
+        endpoint -- the sidecar to talk to, http://host:port or unix:///path/to/socket
+                    (default FAILURE_FLAGS_ENDPOINT or http://localhost:5032).
         """
         
-        self.enabled = 'FAILURE_FLAGS_ENABLED' in os.environ
         self.name = name
         self.labels = labels
         self.behavior = behavior if behavior != None else defaultBehavior
         self.data = data 
         self.debug = True if debug != False else False # filter out any other possible values that might be provided
         self.timeout = timeout
+        self.endpoint = endpoint
+        self._static = None
+        self._wire = None
+
+    @classmethod
+    def get(cls, name, labels=None, **kwargs):
+        """Returns a shared FailureFlag for `name` and `labels`, creating it on first use.
+
+        Keyword arguments are passed to the constructor the first time and ignored after
+        that. Use this for call sites with static labels instead of building a new
+        FailureFlag on every call. At most REGISTRY_SIZE flags are interned, beyond that
+        a new, unshared FailureFlag is returned.
+        """
+        labels = labels if labels is not None else {}
+        key = cacheKey(name, labels)
+        flag = _registry.get(key)
+        if flag is None:
+            flag = cls(name, dict(labels), **kwargs)
+            with _registryLock:
+                if len(_registry) < REGISTRY_SIZE:
+                    flag = _registry.setdefault(key, flag)
+        return flag
+
+    @property
+    def data(self):
+        """The `data` passed by the caller with the `data` effects of the last `invoke()` applied.
+
+        Every call patches the caller's data afresh, so repeated calls do not build on each
+        other. Assigning `data` replaces the caller's data.
+        """
+        patched = self._patched
+        return patched if patched is not _UNPATCHED else self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self._patched = _UNPATCHED
+
+    @property
+    def enabled(self):
+        """True if the SDK is enabled, see `reload_config()`."""
+        return _enabled
 
     def __str__(self):
         return f"<FailureFlag name:{self.name} labels:{self.labels} debug:{self.debug}>"
@@ -65,40 +702,170 @@ class FailureFlag:
         `experiments` is the list of active experiments targeting this FailureFlag. Use
         `experiments` to drive any externalized behavior handling you may have in branching
         logic.
+
+        If the experiment cache is enabled (see `enable_cache()`) experiments are read from
+        the cache and the sidecar is only contacted on a miss or to refresh an expired entry.
+        Within an experiment snapshot (see `experiment_snapshot()`) experiments are read
+        from the snapshot. In subscription mode (see `subscribe()`) experiments are read
+        from the local experiment table without any I/O, and in local mode (see
+        `enable_local_mode()`) from definitions evaluated in-process. With the sampling gate (see
+        `enable_sampling_gate()`) the dice are rolled first and the fetch is skipped if
+        the roll cannot beat the rate of any recently fetched experiment.
         """
-        global logger
-        active = False
-        impacted = False
-        experiments = []
-        if not self.enabled:
+        if not _enabled:
             if self.debug:
                 logger.debug("SDK not enabled")
-            return (active, impacted, experiments)
-        if len(self.name) <= 0:
-            if self.debug:
-                logger.debug("no failure flag name specified")
-            return (active, impacted, experiments)
+            return (False, False, [])
+        if not self._named():
+            return (False, False, [])
+        # rolled before the lookup so the sampling gate can use it to skip the fetch
+        dice = random()
+        trace = _trace
+        started = time.perf_counter() if trace is not None else None
         try:
-            experiments = self.fetch()
+            compiled, source = self._lookup(dice)
+            if compiled is None:
+                if source == "cache":
+                    compiled = _cache.get(self._cacheKey(), self._fetchCompiled)
+                else:
+                    compiled, source = self._fetched(source, self.fetch())
+            experiments = list(compiled)
         except Exception as err:
+            self._lookupFailed(err, dice, trace, started)
+            return (False, False, [])
+        duration = time.perf_counter() - started if trace is not None else None
+        impacting = self._roll(compiled, experiments, source, dice)
+        impacted = False
+        try:
+            if impacting is not None:
+                try:
+                    impacted = self.behavior(self, impacting)
+                except Exception:
+                    # a raised exception effect is an impact, as recorded by the trace
+                    impacted = True
+                    raise
+        finally:
+            if trace is not None:
+                trace.record(self.name, self._cacheKey(), source, duration, experiments, dice, impacting or (), impacted)
+        return (impacting is not None, impacted, experiments)
+
+    # The helpers below are shared by invoke() and ainvoke(), which only differ in how
+    # they fetch experiments and run the behavior.
+
+    def _named(self):
+        if len(self.name) <= 0:
             if self.debug:
-                logger.debug("received error while fetching experiments", err)
-            return (active, impacted, experiments)
-        if len(experiments) > 0:
-            active = True
-            # TODO dice roll
-            dice = random()
-            filteredExperiments = filter(lambda experiment: 
-                                         (type(experiment["rate"]) is float 
-                                         or type(experiment["rate"]) is int)
-                                         and experiment["rate"] >= 0 
-                                         and experiment["rate"] <= 1 
-                                         and dice < experiment["rate"], experiments)
-            impacted = self.behavior(self, list(filteredExperiments))
-        else:
+                logger.debug("no failure flag name specified")
+            return False
+        return True
+
+    def _lookup(self, dice):
+        """Returns `(compiled, source)` from the first source that answers without I/O.
+
+        `compiled` is None if the experiments must be fetched, `source` is then "cache"
+        to fetch them through the experiment cache, "gate" after a sampling gate miss, or
+        "fetch".
+        """
+        snapshot = _currentSnapshot()
+        if snapshot is not None:
+            compiled = snapshot.get(self._cacheKey())
+            if compiled is not None:
+                return compiled, "snapshot"
+        local = _local
+        if local is not None and local.ready:
+            return local.table.match(self.name, self._effectiveLabels()), "local"
+        subscription = _subscription
+        if subscription is not None and subscription.ready:
+            return subscription.table.match(self.name, self._effectiveLabels()), "subscription"
+        if _cache is not None:
+            return None, "cache"
+        gate = _gate
+        if gate is not None:
+            return gate.admit(self._cacheKey(), dice), "gate"
+        return None, "fetch"
+
+    def _fetched(self, source, experiments):
+        """Returns `(compiled, "fetch")` for fetched experiments and remembers them in the
+        sampling gate after a gate miss."""
+        compiled = compileExperiments(experiments)
+        gate = _gate
+        if source == "gate" and gate is not None:
+            gate.put(self._cacheKey(), compiled)
+        return compiled, "fetch"
+
+    def _lookupFailed(self, err, dice, trace, started):
+        if self.debug:
+            logger.debug("received error while fetching experiments: %s", err)
+        if trace is not None:
+            trace.record(self.name, self._cacheKey(), None, time.perf_counter() - started,
+                         [], dice, (), False, errorCause(err))
+
+    def _roll(self, compiled, experiments, source, dice):
+        """Reports the experiments to hooks and returns the ones the dice selected, or None
+        if there are no experiments."""
+        if self._patched is not _UNPATCHED:
+            # data effects of an earlier call do not carry over
+            self._patched = _UNPATCHED
+        hooks = _hooks
+        if hooks is not None:
+            hooks.experimentsReturned(self, experiments, source)
+        if len(experiments) <= 0:
             if self.debug:
                 logger.debug("no experiments retrieved")
-        return (active, impacted, experiments)
+            return None
+        impacting = compiled.impacting(dice)
+        if hooks is not None:
+            hooks.diceRolled(self, dice, impacting)
+        return impacting
+
+    def _fetchCompiled(self):
+        return compileExperiments(self.fetch())
+
+    def _staticLabels(self):
+        """Returns `(labels, key)`, this flag's labels with the SDK version label and their
+        cache key. Both are reused while the name and labels are unchanged; `self.labels`
+        itself is never modified."""
+        static = self._static
+        if static is not None and static[0] == self.name and static[1] == self.labels:
+            return static[2]
+        labels = dict(self.labels)
+        labels[SDK_VERSION_LABEL] = f"python-{VERSION}"
+        result = (labels, cacheKey(self.name, labels))
+        # a copy of labels only detects changes if the values cannot be mutated in place
+        if all(type(value) in _SCALARS for value in self.labels.values()):
+            self._static = (self.name, dict(self.labels), result)
+        return result
+
+    def _effectiveLabels(self):
+        """Returns the labels experiments are matched against: the scoped labels of the
+        current context (see `scoped_labels()`) merged with this flag's labels."""
+        scope = _currentScope()
+        labels = self._staticLabels()[0]
+        if scope is None:
+            return labels
+        return {**scope.labels, **labels}
+
+    def _cacheKey(self):
+        """Returns the experiment cache key for this flag in the current context."""
+        scope = _currentScope()
+        key = self._staticLabels()[1]
+        if scope is None:
+            return key
+        return (key, scope.fingerprint)
+
+    def _requestBody(self):
+        """Returns the encoded body of an experiment request, reusing it while the name
+        and labels are unchanged and no labels are scoped."""
+        if not _transportLoaded:
+            _loadTransport()
+        labels = self._effectiveLabels()
+        wire = self._wire
+        if wire is not None and wire[0] is labels:
+            return wire[1]
+        body = codec.jsonCodec.encode({"name": self.name, "labels": labels})
+        if self._static is not None and self._static[2][0] is labels:
+            self._wire = (labels, body)
+        return body
 
     def fetch(self):
         """`fetch()` requests the current set of active experiments for this FailureFlag.
@@ -106,55 +873,116 @@ class FailureFlag:
         sidecar process. The response will always be a list.
         This function does not analyse the resulting list of experiments or apply
         probablistic pruning of the list.
+
+        After repeated failures to reach the sidecar the process-wide circuit breaker
+        (`failureflags.transport.breaker`) opens and `fetch()` returns an empty list
+        without contacting the sidecar until a probe request succeeds again.
+
+        In local mode (see `enable_local_mode()`) this is an in-memory query against the
+        loaded experiment definitions.
         """
         global logger
         global VERSION
         experiments = []
-        if not self.enabled:
+        if not _enabled:
             return experiments
-        self.labels["failure-flags-sdk-version"] = f"python-{VERSION}"
-        data = json.dumps({"name": self.name, "labels": self.labels}).encode("utf-8")
-        request = Request('http://localhost:5032/experiment',
-                          headers={"Content-Type": "application/json", "Content-Length": len(data)},
-                          data=data)
-        with urlopen(request, timeout=self.timeout) as response:
-            code = response.status if hasattr(response, 'status') else 0
-            if code < 200 or code >= 300:
-                if self.debug:
-                    logger.debug(f"bad status code ({code}) while fetching experiments")
-                return []
-
-            # Validate Content-Type
-            content_type = response.headers.get("Content-Type", "").lower()
-            if content_type != "application/json":
-                if self.debug:
-                    logger.debug(f"unexpected Content-Type: {content_type}")
-                return []
-
-            # Validate Content-Length
-            content_length = response.headers.get("Content-Length", None)
-            if content_length is None or not content_length.isdigit() or int(content_length) <= 0:
-                if self.debug:
-                    logger.debug(f"invalid Content-Length: {content_length}")
-                return []
-
-            # Read the response body
-            body = response.read().decode('utf-8').strip()  # Decode and strip whitespace
-            response.close()
-            experiments = json.loads(body)
-            if isinstance(experiments, list) or type(experiments) is list:
-                return experiments
-            elif isinstance(experiments, dict) or type(experiments) is dict:
-                return [experiments]
-            else:
-                return []
+        if _local is not None and _local.ready:
+            return list(_local.table.match(self.name, self._effectiveLabels()))
+        if not _transportLoaded:
+            _loadTransport()
+        data = self._requestBody()
+        request = Request(sidecarURL(self.endpoint or SIDECAR_ENDPOINT, "/experiment"),
+                          headers=_headers(data), data=data)
+        exchange = _Exchange(self, self.timeout, _adaptive)
+        if not exchange.begin(self.debug):
+            return experiments
+        try:
+            # not hedged: a blocking fetch cannot wait for two responses at once
+            with urlopen(request, timeout=exchange.timeout) as response:
+                experiments = readExperiments(self, response)
+        except BaseException as err:
+            exchange.failed(err)
+            raise
+        exchange.succeeded(response.status)
+        return experiments
+
+    async def afetch(self):
+        """`afetch()` is the asyncio counterpart of `fetch()`.
+
+        It talks to the sidecar over a non-blocking connection and applies the same
+        response validation as `fetch()`.
+        """
+        from . import aio
+        return await aio.afetch(self)
+
+    async def ainvoke(self):
+        """`ainvoke()` is the asyncio counterpart of `invoke()` and returns the same triple.
+
+        The default behavior chain is replaced by `adefaultBehavior` so that injected latency
+        suspends only the calling coroutine instead of the whole event loop. A custom
+        `behavior` may be a plain function or a coroutine function.
+        """
+        from . import aio
+        return await aio.ainvoke(self)
+
+def readExperiments(ff, response):
+    """`readExperiments()` validates a sidecar response and returns its experiments as a list.
+
+    `response` needs a `status`, `headers.get()` and `read()`. Responses with a non-2xx
+    status, a Content-Type other than application/json (or a binary encoding offered
+    by `failureflags.codec`), or a missing Content-Length produce an empty list and the
+    body is never read.
+    """
+    return asExperiments(readPayload(ff, response))
+
+def asExperiments(payload):
+    """`asExperiments()` normalizes a decoded sidecar payload into a list of experiments."""
+    if isinstance(payload, list) or type(payload) is list:
+        return payload
+    elif isinstance(payload, dict) or type(payload) is dict:
+        return [payload]
+    else:
+        return []
+
+def readPayload(ff, response):
+    """`readPayload()` validates a sidecar response and returns its decoded JSON body.
+
+    Returns None if the response was rejected. See `readExperiments()`.
+    """
+    if not _transportLoaded:
+        _loadTransport()
+    code = response.status if hasattr(response, 'status') else 0
+    if code < 200 or code >= 300:
+        if ff.debug:
+            logger.debug("bad status code (%s) while fetching experiments", code)
+        return None
+
+    # Validate Content-Type, JSON or a binary encoding offered in the Accept header
+    content_type = response.headers.get("Content-Type", "").lower()
+    decoder = codec.decoderFor(content_type)
+    if decoder is None:
+        if ff.debug:
+            logger.debug("unexpected Content-Type: %s", content_type)
+        return None
+
+    # Validate Content-Length
+    content_length = response.headers.get("Content-Length", None)
+    if content_length is None or not content_length.isdigit() or int(content_length) <= 0:
+        if ff.debug:
+            logger.debug("invalid Content-Length: %s", content_length)
+        return None
+
+    # Decode the body straight from bytes, JSON allows surrounding whitespace
+    body = response.read()
+    response.close()
+    return decoder.decode(body)
 
 def delayedDataOrError(failureflag, experiments):
     """`delayedDataOrError()` is the head of the default behavior chain used by `invoke()`.
 
     This chain will process `latency` effects, then `exception` effects, and finally
-    `data` effects. The `data` effects are not yet implemented. This function will 
-    return True if any of the three effects in the chain return True.
+    `data` effects. This function will return True if any of the three effects in the
+    chain return True.
     """
     latencyImpact = latency(failureflag, experiments)
     exceptionImpact = exception(failureflag, experiments)
@@ -166,49 +994,75 @@ def latency(ff, experiments):
     impacted = False
     # the latency effect should never cause an Exception to be thrown even if the SDK has a bug.
     try:
-        if experiments == None or len(experiments) == 0:
-            if ff.debug:
-                logger.debug("experiments was empty")
-            return impacted
-        for e in experiments:
-            if not isinstance(e, dict) or type(e) is not dict:
-                if ff.debug:
-                    logger.debug("experiment is not a dict, skipping")
+        for delay in latencyDelays(ff, experiments):
+            delay, limiter = scheduleLatency(ff, delay)
+            if delay is None:
                 continue
-            if "effect" not in e:
-                if ff.debug:
-                    logger.debug("no effect in experiment, skipping")
-                continue
-            if "latency" not in e["effect"]:
-                if ff.debug:
-                    logger.debug("no latency in experiment effect, skipping")
-                continue
-            if type(e["effect"]["latency"]) is int:
-                impacted = True
-                time.sleep(e["effect"]["latency"]/1000)
-            elif type(e["effect"]["latency"]) is str:
-                try: 
-                    ms = int(e["effect"]["latency"])
-                    time.sleep(ms/1000)
-                    impacted = True
-                except ValueError as err:
-                    if ff.debug:
-                        logger.debug("experiment contained a non-number latency clause")
-            elif isinstance(e["effect"]["latency"], dict):
-                impacted = True
-                ms = 0
-                jitter = 0
-                if "ms" in e["effect"]["latency"] and type(e["effect"]["latency"]["ms"]) is int:
-                    ms = e["effect"]["latency"]["ms"]
-                if "jitter" in e["effect"]["latency"] and type(e["effect"]["latency"]["jitter"]) is int:
-                    jitter = e["effect"]["latency"]["jitter"]
-                # convert both ms and jitter to seconds
-                time.sleep(ms/1000 + jitter*random()/1000)
+            impacted = True
+            try:
+                time.sleep(delay)
+            finally:
+                if limiter is not None:
+                    limiter.release()
+            if _hooks is not None:
+                _hooks.effectApplied(ff, "latency", delay)
     except Exception as oerr:
         if ff.debug:
-            logger.debug(f"experiments caused an exception to be thrown in latency, {oerr}")
+            logger.debug("experiments caused an exception to be thrown in latency, %s", oerr)
     return impacted
 
+def scheduleLatency(ff, delay):
+    """`scheduleLatency` applies the latency deadline and limits to an injected delay.
+
+    Returns `(delay, limiter)`. `delay` is None if it must be skipped, or the delay to
+    inject, clipped to the current deadline. Call `limiter.release()` after injecting it
+    unless `limiter` is None.
+    """
+    limiter = _limiter
+    left = _remaining()
+    reason = None
+    if left is not None:
+        if left <= 0:
+            reason = _DEADLINE
+        elif delay > left:
+            delay = left
+            if limiter is not None:
+                limiter.clip()
+    if reason is None:
+        if limiter is None:
+            return delay, None
+        reason = limiter.admit(delay)
+        if reason is None:
+            return delay, limiter
+    elif limiter is not None:
+        limiter.skip(reason)
+    if ff.debug:
+        logger.debug("skipping injected latency, %s limit reached", reason)
+    if _hooks is not None:
+        _hooks.effectSkipped(ff, "latency", reason)
+    return None, None
+
+def latencyDelays(ff, experiments):
+    """`latencyDelays` yields the delay in seconds described by each `latency` clause.
+
+    This is the parsing half of the `latency` effect. It is shared by the blocking
+    `latency()` and the asyncio `alatency()` effects. Experiments are compiled into
+    effect plans once, see `failureflags.plan`.
+    """
+    if experiments == None or len(experiments) == 0:
+        if ff.debug:
+            logger.debug("experiments was empty")
+        return
+    for plan in compileExperiments(experiments).plans:
+        if plan.latency is None:
+            if ff.debug:
+                logger.debug("no latency in experiment effect, skipping")
+            continue
+        if plan.jitter:
+            yield plan.latency + plan.jitter*random()
+        else:
+            yield plan.latency
+
 def exception(ff, experiments):
     """`exception` processes `exception` clauses in effect statements for each provided experiment in the list.
 
@@ -221,61 +1075,109 @@ def exception(ff, experiments):
     function attempts to load `className` from `builtins`. This function always provides
     The value for `message` as the sole argument when invoking the function identified by
     `className`.
+
+    Exception classes are resolved when the experiment is compiled, and resolutions
+    (including failures) are memoized per process. `className` must name a subclass of
+    `BaseException`, and if an allowlist is configured (see `set_exception_allowlist()`)
+    `module` must be on it.
     """
     global logger
-    for f in experiments:
-        if not isinstance(f, dict) or type(f) is not dict:
-            continue
-        if "effect" not in f:
+    for plan in compileExperiments(experiments).plans:
+        factory = plan.exception
+        if factory is None:
             continue
-        if "exception" not in f["effect"]:
-            continue
-        if type(f["effect"]["exception"]) is str:
-            # this is the feature
-            raise ValueError(f["effect"]["exception"])
-        elif isinstance(f["effect"]["exception"], dict):
-            module = "builtins"
-            class_name = "ValueError"
-            message = "Error injected via Gremlin Failure Flags (default message)"
-            hasKnown = False
-            if "module" in f["effect"]["exception"] and type(f["effect"]["exception"]["module"]) is str:
-                module = f["effect"]["exception"]["module"]
-                hasKnown = True
-            if "className" in f["effect"]["exception"] and type(f["effect"]["exception"]["className"]) is str:
-                class_name= f["effect"]["exception"]["className"]
-                hasKnown = True
-            if "message" in f["effect"]["exception"] and type(f["effect"]["exception"]["message"]) is str:
-                message = f["effect"]["exception"]["message"]
-                hasKnown = True
-            if not hasKnown:
+        if type(factory) is Unresolvable:
+            # unable to load the class
+            if ff.debug:
+                logger.debug("unable to load the named module: %s, %s", factory.module, factory.error)
+            return False
+        try:
+            error = factory()
+        except Exception as err:
+            if ff.debug:
+                logger.debug("unable to create %s: %s", factory, err)
+            return False
+        if _hooks is not None:
+            _hooks.effectApplied(ff, "exception", 0.0)
+        # this is the acceptable place to raise an exception
+        raise error
+    return False
+
+def data(ff, experiments):
+    """`data` processes `data` clauses in effect statements for each provided experiment in the list.
+
+    A `data` clause describes `replace`, `merge`, and `delete` patches for the flag's
+    `data`, see `failureflags.patch`. Patches are compiled once per experiment and applied
+    copy-on-write: the object passed as `data` is never mutated, only the dicts and lists
+    along patched paths are copied, and the result is read from `ff.data`. Patches are
+    always applied to the caller's original data, never to the result of an earlier call.
+    """
+    impacted = False
+    patched = ff._data
+    # the data effect should never cause an Exception to be thrown even if the SDK has a bug.
+    try:
+        for plan in compileExperiments(experiments).plans:
+            if plan.data is None:
+                continue
+            result, applied = applyPatches(patched, plan.data)
+            if not applied:
                 if ff.debug:
-                    logger.debug("exception clause was not populated")
+                    logger.debug("data patches did not match the flag's data, skipping")
                 continue
-            if len(class_name) == 0:
-                # for some reason this was explicitly unset
+            patched = result
+            impacted = True
+            if _hooks is not None:
+                _hooks.effectApplied(ff, "data", 0.0)
+    except Exception as oerr:
+        if ff.debug:
+            logger.debug("experiments caused an exception to be thrown in data, %s", oerr)
+    ff._patched = patched if impacted else _UNPATCHED
+    return impacted
+
+defaultBehavior = delayedDataOrError
+
+async def adelayedDataOrError(failureflag, experiments):
+    """`adelayedDataOrError()` is the asyncio default behavior chain used by `ainvoke()`.
+
+    It processes the same effects as `delayedDataOrError()` but awaits `latency` effects
+    with `asyncio.sleep` instead of blocking the event loop.
+    """
+    latencyImpact = await alatency(failureflag, experiments)
+    exceptionImpact = exception(failureflag, experiments)
+    dataImpact = data(failureflag, experiments)
+    return latencyImpact or exceptionImpact or dataImpact
+
+async def alatency(ff, experiments):
+    """`alatency` is the asyncio version of `latency`, it suspends only the calling coroutine."""
+    import asyncio
+    impacted = False
+    try:
+        for delay in latencyDelays(ff, experiments):
+            delay, limiter = scheduleLatency(ff, delay)
+            if delay is None:
                 continue
-            error = None
+            impacted = True
             try:
-                if module is not None:
-                    module_ = __import__(module, fromlist=[None])
-                    class_ = getattr(module_, class_name)
-                else: 
-                    class_ = globals()[class_name]
-                error = class_(message)
-            except Exception as err:
-                # unable to load the class
-                if ff.debug:
-                    logger.debug(f"unable to load the named module: {module}, {err}")
-                return False
-            if error is not None:
-                # this is the acceptable place to raise an exception
-                raise error
-    return False
+                await asyncio.sleep(delay)
+            finally:
+                if limiter is not None:
+                    limiter.release()
+            if _hooks is not None:
+                _hooks.effectApplied(ff, "latency", delay)
+    except Exception as oerr:
+        if ff.debug:
+            logger.debug("experiments caused an exception to be thrown in alatency, %s", oerr)
+    return impacted
 
-def data(ff, experiments):
-    """data is not yet implemented"""
-    if ff.debug:
-        logger.debug("data effects are not yet implemented")
-    return False
+adefaultBehavior = adelayedDataOrError
 
-defaultBehavior = delayedDataOrError
+def _registerFromEnvironment():
+    path = os.environ.get("FAILURE_FLAGS_MANIFEST")
+    if not path or not _enabled:
+        return
+    try:
+        register(_loadManifest(path))
+    except Exception as err:
+        logger.debug("unable to register the flags declared in %s: %s", path, err)
+
+_registerFromEnvironment()
@@ -0,0 +1,276 @@
+"""Native asyncio support for Failure Flags.
+
+This module backs `FailureFlag.afetch()` and `FailureFlag.ainvoke()`. It talks to the
+sidecar with a small non-blocking HTTP/1.1 client built on asyncio streams. Idle
+connections are kept per event loop and reused like the blocking transport does.
+"""
+import asyncio
+import inspect
+import time
+import weakref
+from random import random
+
+import failureflags
+from .plan import compileExperiments
+from .transport import address, sidecarURL
+
+_STALE_CONNECTION_ERRORS = (
+    asyncio.IncompleteReadError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+)
+
+class Headers(dict):
+    """A dict of response headers with case-insensitive `get()`."""
+
+    def get(self, key, default=None):
+        return super().get(key.lower(), default)
+
+class Response:
+    """The subset of `http.client.HTTPResponse` that `readExperiments()` relies on."""
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self._body = body
+
+    def read(self):
+        return self._body
+
+    def close(self):
+        pass
+
+class AsyncConnectionPool:
+    """AsyncConnectionPool keeps up to `maxsize` idle stream pairs per host for one event loop."""
+
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self._idle = {}
+        self.opened = 0
+        self.reused = 0
+
+    async def _acquire(self, key):
+        idle = self._idle.get(key)
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                self.reused += 1
+                return reader, writer, True
+            writer.close()
+        self.opened += 1
+        reader, writer = await _connect(key)
+        return reader, writer, False
+
+    def _release(self, key, reader, writer, reusable):
+        idle = self._idle.setdefault(key, [])
+        if reusable and len(idle) < self.maxsize:
+            idle.append((reader, writer))
+        else:
+            writer.close()
+
+    async def post(self, url, body, headers):
+        socketPath, host, port, path = address(url)
+        key = (socketPath, host, port)
+        host = host or "localhost"
+        reader, writer, reused = await self._acquire(key)
+        try:
+            try:
+                response, reusable = await _exchange(reader, writer, host, path, body, headers)
+            except _STALE_CONNECTION_ERRORS:
+                writer.close()
+                if not reused:
+                    raise
+                # the sidecar closed the kept-alive connection, reconnect once
+                self.opened += 1
+                reader, writer = await _connect(key)
+                response, reusable = await _exchange(reader, writer, host, path, body, headers)
+        except BaseException:
+            # includes cancellation by a timeout, the connection is in an unknown state
+            writer.close()
+            raise
+        self._release(key, reader, writer, reusable)
+        return response
+
+    def stats(self):
+        return {"opened": self.opened, "reused": self.reused,
+                "idle": sum(len(idle) for idle in self._idle.values())}
+
+async def _connect(key):
+    socketPath, host, port = key
+    if socketPath is not None:
+        return await asyncio.open_unix_connection(socketPath)
+    return await asyncio.open_connection(host, port)
+
+async def _exchange(reader, writer, host, path, body, headers):
+    """Writes one POST request and reads the response. Returns `(Response, reusable)`."""
+    lines = [f"POST {path} HTTP/1.1", f"Host: {host}"]
+    lines.extend(f"{k}: {v}" for k, v in headers.items())
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise asyncio.IncompleteReadError(status_line, None)
+    parts = status_line.decode("latin-1").split(None, 2)
+    status = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+    response_headers = Headers()
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        response_headers[key.strip().lower()] = value.strip()
+
+    reusable = response_headers.get("Connection", "").lower() != "close"
+    content_length = response_headers.get("Content-Length", "")
+    if content_length.isdigit():
+        payload = await reader.readexactly(int(content_length))
+    else:
+        # without a usable length the body is not read and readExperiments() rejects it
+        payload = b""
+        reusable = False
+    return Response(status, response_headers, payload), reusable
+
+_pools = weakref.WeakKeyDictionary()
+
+def poolFor(loop=None):
+    """Returns the `AsyncConnectionPool` of the running (or given) event loop."""
+    loop = loop if loop is not None else asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = _pools[loop] = AsyncConnectionPool()
+    return pool
+
+async def afetch(ff):
+    """Requests the current set of active experiments for `ff` without blocking the event loop.
+
+    Like `fetch()` this raises if the sidecar cannot be reached, including `TimeoutError`
+    when the request takes longer than the flag's `timeout`.
+    """
+    if not ff.enabled:
+        return []
+    local = failureflags._local
+    if local is not None and local.ready:
+        return list(local.table.match(ff.name, ff._effectiveLabels()))
+    exchange = failureflags._Exchange(ff, ff.timeout, failureflags._adaptive)
+    if not exchange.begin(ff.debug):
+        return []
+    data = ff._requestBody()
+    url = sidecarURL(ff.endpoint or failureflags.SIDECAR_ENDPOINT, "/experiment")
+    headers = failureflags._headers(data)
+    try:
+        try:
+            if exchange.hedgeDelay is not None:
+                response = await _hedgedPost(ff, url, data, headers, exchange)
+            else:
+                response = await asyncio.wait_for(poolFor().post(url, data, headers), exchange.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError("timed out while fetching experiments") from None
+        experiments = failureflags.readExperiments(ff, response)
+    except BaseException as err:
+        exchange.failed(err)
+        raise
+    exchange.succeeded(response.status)
+    return experiments
+
+async def _hedgedPost(ff, url, data, headers, exchange):
+    """Sends the request, and again if it is unanswered after the hedge delay. The first
+    response wins and the other request is cancelled."""
+    hedgeDelay, adaptive = exchange.hedgeDelay, exchange.adaptive
+    pool = poolFor()
+    tasks = {asyncio.ensure_future(pool.post(url, data, headers))}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedgeDelay)
+        if not done:
+            adaptive.hedged()
+            if exchange.hooks is not None:
+                exchange.hooks.requestHedged(ff, hedgeDelay)
+            tasks.add(asyncio.ensure_future(pool.post(url, data, headers)))
+            remaining = max(exchange.timeout - hedgeDelay, adaptive.floor)
+            done, _ = await asyncio.wait(tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise asyncio.TimeoutError()
+        succeeded = [task for task in done if task.exception() is None]
+        return (succeeded or list(done))[0].result()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def afetch_many(flags, timeout=None):
+    """The asyncio counterpart of `fetch_many()`, one batch request without blocking the event loop."""
+    flags, results, pending = failureflags._batch(flags)
+    if not pending:
+        return results
+    local = failureflags._local
+    if local is not None and local.ready:
+        return failureflags._matchLocally(flags, pending, results)
+    if failureflags._batchSupported:
+        head = flags[pending[0]]
+        exchange = failureflags._Exchange(None, failureflags._batchTimeout(flags, pending, timeout))
+        # the fallback below leaves the circuit breaker to afetch()
+        if not exchange.begin(head.debug):
+            return results
+        url, headers, data = failureflags._batchRequest(head, flags, pending)
+        try:
+            try:
+                response = await asyncio.wait_for(poolFor().post(url, data, headers), exchange.timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError("timed out while fetching experiments") from None
+            failureflags._readBatch(head, response, pending, results)
+        except BaseException as err:
+            exchange.failed(err)
+            raise
+        exchange.succeeded(response.status)
+    if not failureflags._batchSupported:
+        fetched = await asyncio.gather(*(afetch(flags[i]) for i in pending))
+        for i, experiments in zip(pending, fetched):
+            results[i] = experiments
+    failureflags._storeBatch(flags, pending, results)
+    return results
+
+async def _afetchCompiled(ff):
+    return compileExperiments(await afetch(ff))
+
+async def ainvoke(ff):
+    """Runs the `invoke()` algorithm for `ff` and returns `(active, impacted, experiments)`."""
+    if not failureflags._enabled:
+        if ff.debug:
+            failureflags.logger.debug("SDK not enabled")
+        return (False, False, [])
+    if not ff._named():
+        return (False, False, [])
+    dice = random()
+    trace = failureflags._trace
+    started = time.perf_counter() if trace is not None else None
+    try:
+        compiled, source = ff._lookup(dice)
+        if compiled is None:
+            if source == "cache":
+                compiled = await failureflags._cache.aget(ff._cacheKey(), lambda: _afetchCompiled(ff))
+            else:
+                compiled, source = ff._fetched(source, await afetch(ff))
+        experiments = list(compiled)
+    except Exception as err:
+        ff._lookupFailed(err, dice, trace, started)
+        return (False, False, [])
+    duration = time.perf_counter() - started if trace is not None else None
+    impacting = ff._roll(compiled, experiments, source, dice)
+    impacted = False
+    try:
+        if impacting is not None:
+            behavior = ff.behavior
+            if behavior is failureflags.defaultBehavior or behavior is failureflags.delayedDataOrError:
+                behavior = failureflags.adefaultBehavior
+            try:
+                impacted = behavior(ff, impacting)
+                if inspect.isawaitable(impacted):
+                    impacted = await impacted
+            except Exception:
+                # a raised exception effect is an impact, as recorded by the trace
+                impacted = True
+                raise
+    finally:
+        if trace is not None:
+            trace.record(ff.name, ff._cacheKey(), source, duration, experiments, dice, impacting or (), impacted)
+    return (impacting is not None, impacted, experiments)
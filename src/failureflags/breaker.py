@@ -0,0 +1,91 @@
+"""The circuit breaker consulted before contacting the sidecar.
+
+This module is deliberately free of network imports: `failureflags` imports it eagerly
+while the transport itself is only imported on the first enabled fetch.
+"""
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+class CircuitBreaker:
+    """CircuitBreaker stops the SDK from hammering a sidecar that is down or not deployed.
+
+    After `threshold` consecutive failures the breaker trips and `allow()` returns False
+    for `backoff` seconds, during which fetches return no experiments without touching
+    the network. Once the backoff elapsed a single caller is allowed through as a probe:
+    if it succeeds the breaker closes, otherwise it opens again with the backoff doubled
+    up to `maxBackoff` seconds. A probe that never reports back, for example because it
+    was cancelled, is replaced by another one after the same backoff.
+    """
+
+    def __init__(self, threshold=5, backoff=1, maxBackoff=30):
+        self.threshold = threshold
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.shortCircuits = 0
+        self._openedAt = 0
+        self._currentBackoff = backoff
+
+    def allow(self):
+        """Returns True if the caller may contact the sidecar."""
+        if self.state is CLOSED:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if now - self._openedAt >= self._currentBackoff:
+                # let exactly one probe through per backoff, whether the breaker is open or
+                # still waiting for the previous probe
+                self.state = HALF_OPEN
+                self._openedAt = now
+                return True
+            self.shortCircuits += 1
+            return False
+
+    def success(self):
+        """Records a successful exchange with the sidecar."""
+        if self.state is CLOSED and self.failures == 0:
+            return
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._currentBackoff = self.backoff
+
+    def failure(self):
+        """Records a failed exchange with the sidecar (connection error, timeout, ...)."""
+        with self._lock:
+            if self.state is HALF_OPEN:
+                self._currentBackoff = min(self._currentBackoff * 2, self.maxBackoff)
+                self._trip()
+                return
+            self.failures += 1
+            if self.state is CLOSED and self.failures >= self.threshold:
+                self._trip()
+
+    def _trip(self):
+        self.state = OPEN
+        self.trips += 1
+        self._openedAt = time.monotonic()
+
+    def reset(self):
+        """Closes the breaker and clears its counters."""
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.trips = 0
+            self.shortCircuits = 0
+            self._currentBackoff = self.backoff
+
+    def stats(self):
+        """Returns a dict with the breaker `state` and its `failures`, `trips` and `shortCircuits` counters."""
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "trips": self.trips,
+                    "shortCircuits": self.shortCircuits}
+
+breaker = CircuitBreaker()
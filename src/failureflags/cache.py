@@ -0,0 +1,253 @@
+"""In-process cache of experiments fetched from the sidecar.
+
+The cache is optional and disabled by default. Enable it with `failureflags.enable_cache()`
+or by setting FAILURE_FLAGS_CACHE_TTL to a number of seconds. Once enabled `invoke()`
+reads experiments from the cache and only talks to the sidecar on a miss or when a
+cached entry has expired.
+
+`SamplingGate` is a lighter alternative. It remembers the experiments last fetched for
+each flag only to decide whether a fetch is worth making, see `enable_sampling_gate()`.
+"""
+import collections
+import contextvars
+import os
+import threading
+import time
+import weakref
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 60
+DEFAULT_MAXSIZE = 1024
+DEFAULT_GATE_TTL = 10
+
+def cacheKey(name, labels):
+    """Returns a hashable key for a flag name and its labels."""
+    try:
+        key = (name, tuple(sorted(labels.items())))
+        hash(key)
+        return key
+    except TypeError:
+        # unhashable or unorderable label values
+        return (name, repr(sorted(labels.items(), key=lambda item: item[0])))
+
+class _Entry:
+    __slots__ = ("experiments", "fetchedAt", "refreshing")
+
+    def __init__(self, experiments, fetchedAt):
+        self.experiments = experiments
+        self.fetchedAt = fetchedAt
+        self.refreshing = False
+
+class ExperimentCache:
+    """ExperimentCache is a bounded LRU cache of experiment lists with a TTL.
+
+    Entries younger than `ttl` seconds are served directly. When `refresh` is True
+    (the default) an expired entry is still served while a background thread fetches
+    a replacement (stale-while-revalidate). When `refresh` is False an expired entry
+    is treated as a miss and fetched synchronously. If a background refresh fails the
+    entry is dropped so that the SDK fails safe instead of replaying old experiments.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, maxsize=DEFAULT_MAXSIZE, refresh=True):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+        _caches.add(self)
+
+    def _lookup(self, key):
+        """Returns `(entry, refresh)`. `entry` is None on a miss and `refresh` is True if
+        the caller is responsible for refreshing the (expired) entry in the background."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry.fetchedAt < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry, False
+                if self.refresh:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    if entry.refreshing:
+                        return entry, False
+                    entry.refreshing = True
+                    self.refreshes += 1
+                    return entry, True
+            self.misses += 1
+            return None, False
+
+    def get(self, key, fetcher):
+        """Returns the experiments cached under `key`, calling `fetcher()` on a miss.
+
+        Exceptions raised by `fetcher` on a miss are propagated to the caller. Background
+        refreshes call `fetcher()` in a copy of the caller's context.
+        """
+        entry, refresh = self._lookup(key)
+        if entry is None:
+            experiments = fetcher()
+            self.put(key, experiments)
+            return experiments
+        if refresh:
+            # the refresh fetches with the caller's context, such as its scoped labels
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(self._refresh, key, entry, fetcher),
+                             name="failureflags-cache-refresh", daemon=True).start()
+        return entry.experiments
+
+    async def aget(self, key, afetcher):
+        """The asyncio version of `get()`. `afetcher()` must return an awaitable.
+
+        Background refreshes run as tasks on the calling event loop.
+        """
+        entry, refresh = self._lookup(key)
+        if entry is None:
+            experiments = await afetcher()
+            self.put(key, experiments)
+            return experiments
+        if refresh:
+            import asyncio
+            task = asyncio.get_running_loop().create_task(self._arefresh(key, entry, afetcher))
+            _tasks.add(task)
+            task.add_done_callback(_tasks.discard)
+        return entry.experiments
+
+    async def _arefresh(self, key, entry, afetcher):
+        try:
+            experiments = await afetcher()
+        except Exception as err:
+            experiments = err
+        self._completeRefresh(key, entry, experiments)
+
+    def peek(self, key):
+        """Returns the experiments cached under `key` if they are younger than `ttl`, or None.
+
+        Unlike `get()` this never fetches or refreshes.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry.fetchedAt >= self.ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.experiments
+
+    def put(self, key, experiments):
+        """Stores `experiments` under `key`, evicting the least recently used entry if full."""
+        with self._lock:
+            self._entries[key] = _Entry(experiments, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _refresh(self, key, entry, fetcher):
+        try:
+            experiments = fetcher()
+        except Exception as err:
+            experiments = err
+        self._completeRefresh(key, entry, experiments)
+
+    def _completeRefresh(self, key, entry, experiments):
+        if isinstance(experiments, Exception):
+            logger.debug("background refresh failed, dropping cached experiments: %s", experiments)
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            return
+        with self._lock:
+            # only replace the entry we set out to refresh, it may have been evicted or replaced
+            if self._entries.get(key) is entry:
+                self._entries[key] = _Entry(experiments, time.monotonic())
+
+    def clear(self):
+        """Drops every cached entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Returns a dict of counters: `hits`, `misses`, `refreshes`, `evictions`, and `size`."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "refreshes": self.refreshes,
+                    "evictions": self.evictions, "size": len(self._entries)}
+
+    def __len__(self):
+        return len(self._entries)
+
+class SamplingGate(ExperimentCache):
+    """SamplingGate lets `invoke()` roll the dice before deciding to fetch.
+
+    It remembers the experiments last fetched for each flag for `ttl` seconds. While they
+    are known, a dice roll at or above their highest rate cannot impact the call, so the
+    fetch is skipped. Otherwise the experiments are fetched again and the same dice roll
+    is applied to the fresh set. Every call that could be impacted is decided against the
+    sidecar's current experiments, and the probability of impact is unchanged.
+    """
+
+    def __init__(self, ttl=DEFAULT_GATE_TTL, maxsize=DEFAULT_MAXSIZE):
+        super().__init__(ttl=ttl, maxsize=maxsize, refresh=False)
+        self.skipped = 0
+
+    def admit(self, key, dice):
+        """Returns the known experiments for `key` if `dice` cannot impact any of them, so
+        the caller may skip the fetch. Returns None if the caller has to fetch."""
+        known = self.peek(key)
+        if known is None or dice < known.maxRate:
+            return None
+        with self._lock:
+            self.skipped += 1
+        return known
+
+    def stats(self):
+        """Returns the `ExperimentCache` counters and `skipped`, the number of fetches avoided."""
+        stats = super().stats()
+        stats["skipped"] = self.skipped
+        return stats
+
+_caches = weakref.WeakSet()
+# strong references to background refresh tasks, the event loop only keeps weak ones
+_tasks = set()
+
+def _afterForkInChild():
+    for cache in list(_caches):
+        # a refresh thread that was running in the parent does not exist in the child
+        cache._lock = threading.Lock()
+        for entry in cache._entries.values():
+            entry.refreshing = False
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_afterForkInChild)
+
+def gateFromEnvironment():
+    """Returns a `SamplingGate` configured by FAILURE_FLAGS_SAMPLING_TTL, or None if unset."""
+    ttl = os.environ.get("FAILURE_FLAGS_SAMPLING_TTL")
+    if ttl is None:
+        return None
+    try:
+        return SamplingGate(ttl=float(ttl))
+    except ValueError:
+        logger.debug("ignoring invalid FAILURE_FLAGS_SAMPLING_TTL: %s", ttl)
+        return None
+
+def fromEnvironment():
+    """Returns an `ExperimentCache` configured by FAILURE_FLAGS_CACHE_TTL, or None if unset."""
+    ttl = os.environ.get("FAILURE_FLAGS_CACHE_TTL")
+    if ttl is None:
+        return None
+    try:
+        ttl = float(ttl)
+    except ValueError:
+        logger.debug("ignoring invalid FAILURE_FLAGS_CACHE_TTL: %s", ttl)
+        return None
+    maxsize = os.environ.get("FAILURE_FLAGS_CACHE_SIZE", "")
+    return ExperimentCache(ttl=ttl, maxsize=int(maxsize) if maxsize.isdigit() else DEFAULT_MAXSIZE)
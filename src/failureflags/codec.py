@@ -0,0 +1,68 @@
+"""Wire formats used to talk to the sidecar.
+
+A `Codec` encodes request bodies to bytes and decodes response bodies directly from
+bytes. JSON is always available. It uses orjson when it is installed and the standard
+library otherwise. If msgpack is installed the SDK also offers the more compact
+`application/msgpack` encoding to the sidecar through the Accept header. A sidecar that
+does not support it answers with JSON, and responses are decoded according to their
+Content-Type. Requests are always sent as JSON.
+
+Set FAILURE_FLAGS_WIRE_FORMAT=json to never offer msgpack.
+"""
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+class Codec:
+    """Codec converts between Python objects and the bytes of one Content-Type."""
+    __slots__ = ("contentType", "encode", "decode")
+
+    def __init__(self, contentType, encode, decode):
+        self.contentType = contentType
+        self.encode = encode
+        self.decode = decode
+
+    def __repr__(self):
+        return f"<Codec {self.contentType}>"
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+    jsonCodec = Codec(JSON, lambda value: orjson.dumps(value, option=_OPTIONS), orjson.loads)
+else:
+    _encoder = json.JSONEncoder(separators=(",", ":"))
+    # json.loads() accepts bytes and detects their encoding, there is no need to decode first
+    jsonCodec = Codec(JSON, lambda value: _encoder.encode(value).encode("utf-8"), json.loads)
+
+msgpackCodec = None
+if msgpack is not None:
+    msgpackCodec = Codec(MSGPACK, lambda value: msgpack.packb(value, use_bin_type=True),
+                         lambda body: msgpack.unpackb(body, raw=False))
+
+_decoders = {JSON: jsonCodec}
+if msgpackCodec is not None:
+    _decoders[MSGPACK] = msgpackCodec
+    _decoders["application/x-msgpack"] = msgpackCodec
+
+def decoderFor(contentType):
+    """Returns the `Codec` for a response Content-Type, or None if it is not supported."""
+    return _decoders.get(contentType)
+
+def acceptHeader():
+    """Returns the Accept header sent with experiment requests."""
+    if msgpackCodec is not None and os.environ.get("FAILURE_FLAGS_WIRE_FORMAT", "").lower() != "json":
+        return f"{MSGPACK}, {JSON};q=0.5"
+    return JSON
+
+ACCEPT = acceptHeader()
@@ -0,0 +1,193 @@
+"""Metrics and tracing hooks.
+
+Register one `Hooks` object per process with `failureflags.set_hooks()` to receive
+structured events from the SDK's hot path:
+
+    fetchStarted(flag)                           a request to the sidecar is about to be sent
+    fetchFinished(flag, duration, status)        the sidecar answered with HTTP `status`
+    fetchFailed(flag, duration, cause)           the fetch failed, see `errorCause()`
+    experimentsReturned(flag, experiments, source)
+                                                 `source` is "fetch", "cache", "gate",
+                                                 "subscription", "local" or "snapshot"
+    diceRolled(flag, dice, impacting)            `impacting` are the experiments the dice selected
+    effectApplied(flag, effect, duration)        `effect` is "latency", "exception" or "data",
+                                                 `duration` is the injected delay in seconds
+    effectSkipped(flag, effect, reason)          an effect was not applied, `reason` is the limit
+                                                 that was reached, see `failureflags.limits`
+    timeoutChosen(flag, timeout)                 the adaptive timeout chosen for a fetch
+    requestHedged(flag, delay)                   a fetch was sent again after `delay` seconds
+
+Durations are in seconds. `flag` is None for fetches made by `fetch_many()`. Hooks are
+called synchronously on the calling thread, so keep them cheap and do not raise. Without
+registered hooks the SDK skips every call, including reading the clock.
+"""
+import bisect
+import threading
+
+CAUSE_TIMEOUT = "timeout"
+CAUSE_REFUSED = "refused"
+CAUSE_CONNECTION = "connection"
+CAUSE_DECODE = "decode"
+CAUSE_CIRCUIT_OPEN = "circuit-open"
+
+# Prometheus' default buckets, in seconds
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+# buckets for fetch timeouts, which are usually a few milliseconds
+TIMEOUT_BUCKETS = (.0005, .001, .002, .005, .01, .02, .05, .1, .25, .5, 1.0)
+
+def errorCause(err):
+    """Classifies an exception raised while fetching into a short, low-cardinality cause."""
+    # only reached after a fetch, when the transport has already imported socket
+    import socket
+    if isinstance(err, (TimeoutError, socket.timeout)):
+        return CAUSE_TIMEOUT
+    if isinstance(err, ConnectionRefusedError):
+        return CAUSE_REFUSED
+    if isinstance(err, OSError):
+        return CAUSE_CONNECTION
+    if isinstance(err, ValueError):
+        return CAUSE_DECODE
+    return type(err).__name__
+
+class Hooks:
+    """Hooks is the no-op base class. Override the events you are interested in."""
+
+    def fetchStarted(self, flag):
+        pass
+
+    def fetchFinished(self, flag, duration, status):
+        pass
+
+    def fetchFailed(self, flag, duration, cause):
+        pass
+
+    def experimentsReturned(self, flag, experiments, source):
+        pass
+
+    def diceRolled(self, flag, dice, impacting):
+        pass
+
+    def effectApplied(self, flag, effect, duration):
+        pass
+
+    def effectSkipped(self, flag, effect, reason):
+        pass
+
+    def timeoutChosen(self, flag, timeout):
+        pass
+
+    def requestHedged(self, flag, delay):
+        pass
+
+class Histogram:
+    """A Prometheus-style histogram: cumulative bucket counts, a sum and a count."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Returns `(upperBound, count)` pairs, ending with `("+Inf", count)`."""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+class HistogramHooks(Hooks):
+    """HistogramHooks aggregates events into in-memory histograms and counters.
+
+    Metrics are labeled by flag name and kept until the process exits, so use it with a
+    bounded set of flag names. `exposition()` renders them in the Prometheus text format:
+
+        failureflags_fetch_duration_seconds{flag,status}   histogram
+        failureflags_fetch_errors_total{flag,cause}        counter
+        failureflags_experiments_total{flag,source}        counter
+        failureflags_impacted_total{flag}                  counter
+        failureflags_effect_duration_seconds{flag,effect}  histogram
+        failureflags_effect_skipped_total{flag,effect,reason}  counter
+        failureflags_fetch_timeout_seconds{flag}           histogram
+        failureflags_fetch_hedged_total{flag}              counter
+
+    The hedge rate is `failureflags_fetch_hedged_total` over the count of
+    `failureflags_fetch_timeout_seconds`.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def _observe(self, metric, labels, value, buckets=None):
+        key = (metric, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets or self.buckets)
+            histogram.observe(value)
+
+    def _increment(self, metric, labels, value=1):
+        key = (metric, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def fetchFinished(self, flag, duration, status):
+        self._observe("failureflags_fetch_duration_seconds", (("flag", _name(flag)), ("status", str(status))), duration)
+
+    def fetchFailed(self, flag, duration, cause):
+        self._increment("failureflags_fetch_errors_total", (("flag", _name(flag)), ("cause", cause)))
+
+    def experimentsReturned(self, flag, experiments, source):
+        self._increment("failureflags_experiments_total", (("flag", _name(flag)), ("source", source)), len(experiments))
+
+    def diceRolled(self, flag, dice, impacting):
+        if impacting:
+            self._increment("failureflags_impacted_total", (("flag", _name(flag)),))
+
+    def effectApplied(self, flag, effect, duration):
+        self._observe("failureflags_effect_duration_seconds", (("flag", _name(flag)), ("effect", effect)), duration)
+
+    def effectSkipped(self, flag, effect, reason):
+        self._increment("failureflags_effect_skipped_total", (("flag", _name(flag)), ("effect", effect), ("reason", reason)))
+
+    def timeoutChosen(self, flag, timeout):
+        self._observe("failureflags_fetch_timeout_seconds", (("flag", _name(flag)),), timeout, TIMEOUT_BUCKETS)
+
+    def requestHedged(self, flag, delay):
+        self._increment("failureflags_fetch_hedged_total", (("flag", _name(flag)),))
+
+    def exposition(self):
+        """Returns every metric in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = {key: (h.cumulative(), h.sum, h.count) for key, h in self.histograms.items()}
+            counters = dict(self.counters)
+        lines = []
+        for (metric, labels), value in sorted(counters.items()):
+            lines.append(f"{metric}{_labels(labels)} {value}")
+        for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+            for bound, cumulative in buckets:
+                lines.append(f"{metric}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{metric}_sum{_labels(labels)} {total}")
+            lines.append(f"{metric}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+def _name(flag):
+    return flag.name if flag is not None else ""
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
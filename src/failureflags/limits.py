@@ -0,0 +1,140 @@
+"""Process-wide limits for injected latency.
+
+A `latency` effect sleeps on the calling thread. A 100% experiment with a long delay
+can park every worker thread of a process and turn a targeted experiment into an
+outage. `LatencyLimiter` bounds that:
+
+    concurrency -- the most calls sleeping on injected latency at the same time.
+    budget      -- the most seconds of latency injected per second, across all threads.
+                   It is a token bucket that holds at most one second worth of budget.
+
+A delay that would exceed a limit is skipped, not shortened, and the skip is counted
+by reason.
+
+Independently of the limiter, `deadline()` sets a per-call deadline for the current
+thread or asyncio task. Injected delays are clipped to the time remaining before the
+deadline and skipped once it has passed.
+"""
+import contextlib
+import contextvars
+import os
+import threading
+import time
+import weakref
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONCURRENCY = "concurrency"
+BUDGET = "budget"
+DEADLINE = "deadline"
+
+_deadline = contextvars.ContextVar("failureflags_latency_deadline", default=None)
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """Clips latency injected within the block to `seconds` from now.
+
+    Nested deadlines never extend an outer one.
+    """
+    end = time.monotonic() + seconds
+    outer = _deadline.get()
+    if outer is not None and outer < end:
+        end = outer
+    token = _deadline.set(end)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining():
+    """Returns the seconds left before the current deadline, or None without a deadline."""
+    end = _deadline.get()
+    return None if end is None else end - time.monotonic()
+
+class LatencyLimiter:
+    """LatencyLimiter admits injected delays within a concurrency and a budget limit.
+
+    Either limit may be None. Call `admit()` before sleeping and `release()` after a
+    delay was admitted.
+    """
+
+    def __init__(self, concurrency=None, budget=None):
+        self.concurrency = concurrency
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._tokens = budget if budget is not None else 0.0
+        self._refilledAt = time.monotonic()
+        self.sleeping = 0
+        self.admitted = 0
+        self.injected = 0.0
+        self.skipped = {CONCURRENCY: 0, BUDGET: 0, DEADLINE: 0}
+        self.clipped = 0
+        _instances.add(self)
+
+    def admit(self, delay):
+        """Returns None if `delay` may be injected, or the reason it must be skipped."""
+        with self._lock:
+            if self.concurrency is not None and self.sleeping >= self.concurrency:
+                self.skipped[CONCURRENCY] += 1
+                return CONCURRENCY
+            if self.budget is not None:
+                now = time.monotonic()
+                self._tokens = min(self.budget, self._tokens + (now - self._refilledAt) * self.budget)
+                self._refilledAt = now
+                if delay > self._tokens:
+                    self.skipped[BUDGET] += 1
+                    return BUDGET
+                self._tokens -= delay
+            self.sleeping += 1
+            self.admitted += 1
+            self.injected += delay
+            return None
+
+    def release(self):
+        """Records the end of an admitted delay."""
+        with self._lock:
+            self.sleeping -= 1
+
+    def skip(self, reason):
+        """Records a delay skipped for a reason outside the limiter, such as a deadline."""
+        with self._lock:
+            self.skipped[reason] += 1
+
+    def clip(self):
+        """Records a delay shortened to fit a deadline."""
+        with self._lock:
+            self.clipped += 1
+
+    def stats(self):
+        """Returns `sleeping`, `admitted`, `injected` seconds, `clipped` and `skipped` by reason."""
+        with self._lock:
+            return {"sleeping": self.sleeping, "admitted": self.admitted, "injected": self.injected,
+                    "clipped": self.clipped, "skipped": dict(self.skipped)}
+
+def fromEnvironment():
+    """Returns a `LatencyLimiter` configured by FAILURE_FLAGS_LATENCY_CONCURRENCY and
+    FAILURE_FLAGS_LATENCY_BUDGET, or None if neither is set."""
+    limits = {}
+    for key, name, kind in (("concurrency", "FAILURE_FLAGS_LATENCY_CONCURRENCY", int),
+                            ("budget", "FAILURE_FLAGS_LATENCY_BUDGET", float)):
+        value = os.environ.get(name, "")
+        if not value:
+            continue
+        try:
+            limits[key] = kind(value)
+        except ValueError:
+            logger.debug("ignoring invalid %s: %s", name, value)
+    return LatencyLimiter(**limits) if limits else None
+
+_instances = weakref.WeakSet()
+
+def _afterForkInChild():
+    for limiter in list(_instances):
+        # threads sleeping in the parent do not exist in the child
+        limiter._lock = threading.Lock()
+        limiter.sleeping = 0
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_afterForkInChild)
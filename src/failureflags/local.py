@@ -0,0 +1,148 @@
+"""Local mode: evaluate experiment definitions in-process.
+
+In local mode the SDK holds the full set of experiment definitions (flag name, label
+selector, rate and effect) in an `ExperimentTable` and answers `fetch()` and `invoke()`
+from it. The definitions are loaded from a JSON file or from the sidecar's
+`GET /experiments` endpoint, and reloaded in the background every `refresh` seconds.
+The sidecar is not on the request path.
+
+A definitions file holds a JSON list of experiments or an object with an `experiments`
+list. Experiments without a `guid` are given one based on their position.
+"""
+import os
+import threading
+import time
+import weakref
+
+import logging
+
+from .selector import ExperimentTable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REFRESH = 5
+
+def definitions(payload):
+    """Normalizes a decoded definitions document into a list of experiments."""
+    if isinstance(payload, dict):
+        payload = payload.get("experiments")
+    if not isinstance(payload, list):
+        raise ValueError("experiment definitions must be a list")
+    experiments = []
+    for i, experiment in enumerate(payload):
+        if isinstance(experiment, dict):
+            if "guid" not in experiment:
+                experiment = dict(experiment, guid=f"local-{i}")
+            experiments.append(experiment)
+    return experiments
+
+class FileLoader:
+    """Loads experiment definitions from a JSON file, skipping reads while it is unchanged."""
+
+    def __init__(self, path):
+        self.path = path
+        self._stamp = None
+        self._experiments = None
+
+    def __call__(self):
+        stat = os.stat(self.path)
+        stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if stamp != self._stamp:
+            import json
+            with open(self.path, "rb") as f:
+                self._experiments = definitions(json.loads(f.read()))
+            self._stamp = stamp
+        return self._experiments
+
+    def __repr__(self):
+        return f"<FileLoader {self.path}>"
+
+class LocalExperiments:
+    """LocalExperiments keeps an `ExperimentTable` loaded from `loader`.
+
+    `loader` is a function returning the list of experiment definitions. It is called
+    once by `load()` and then again at most every `refresh` seconds, on a background
+    thread started by the first read after the interval passed. If a reload fails the
+    table is cleared and the SDK fails safe until a later reload succeeds.
+    """
+
+    def __init__(self, loader, refresh=DEFAULT_REFRESH):
+        self.loader = loader
+        self.refresh = refresh
+        self.table = ExperimentTable()
+        self.loads = 0
+        self._loaded = False
+        self._last = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._nextRefresh = 0.0
+        _instances.add(self)
+
+    @property
+    def ready(self):
+        """True once definitions were loaded. Schedules a background reload when due."""
+        if self.refresh is not None and time.monotonic() >= self._nextRefresh:
+            self._scheduleRefresh()
+        return self._loaded
+
+    def _scheduleRefresh(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+            self._nextRefresh = time.monotonic() + self.refresh
+        threading.Thread(target=self.load, name="failureflags-local-refresh", daemon=True).start()
+
+    def load(self):
+        """Loads the definitions now. Returns True on success."""
+        try:
+            experiments = self.loader()
+        except Exception as err:
+            logger.debug("unable to load experiment definitions from %s: %s", self.loader, err)
+            self.table.clear()
+            self._last = None
+            self._loaded = False
+            return False
+        else:
+            if experiments is not self._last:
+                self.table.reset(experiments)
+                self._last = experiments
+            self.loads += 1
+            self._loaded = True
+            return True
+        finally:
+            with self._lock:
+                self._refreshing = False
+                self._nextRefresh = time.monotonic() + (self.refresh or 0)
+
+    def match(self, name, labels):
+        return self.table.match(name, labels)
+
+def fromEnvironment():
+    """Returns `LocalExperiments` loaded from FAILURE_FLAGS_EXPERIMENTS_FILE, or None if unset.
+
+    FAILURE_FLAGS_EXPERIMENTS_REFRESH sets the reload interval in seconds.
+    """
+    path = os.environ.get("FAILURE_FLAGS_EXPERIMENTS_FILE")
+    if not path:
+        return None
+    refresh = os.environ.get("FAILURE_FLAGS_EXPERIMENTS_REFRESH", "")
+    try:
+        refresh = float(refresh) if refresh else DEFAULT_REFRESH
+    except ValueError:
+        logger.debug("ignoring invalid FAILURE_FLAGS_EXPERIMENTS_REFRESH: %s", refresh)
+        refresh = DEFAULT_REFRESH
+    local = LocalExperiments(FileLoader(path), refresh=refresh)
+    local.load()
+    return local
+
+_instances = weakref.WeakSet()
+
+def _afterForkInChild():
+    for local in list(_instances):
+        # a refresh thread that was running in the parent does not exist in the child
+        local._lock = threading.Lock()
+        local._refreshing = False
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_afterForkInChild)
@@ -0,0 +1,106 @@
+"""WSGI and ASGI middleware that takes an experiment snapshot for every request.
+
+Without it every flag on a request path fetches its experiments on its own: N flags
+cost N round trips to the sidecar, and an experiment that starts or stops halfway
+through a request affects only part of it. The middleware resolves the experiments
+of a set of flags once per request, in a single batch, and every `invoke()` of those
+flags while the request is handled reads that snapshot (see
+`failureflags.experiment_snapshot()`).
+
+    from failureflags.middleware import WSGIMiddleware, ASGIMiddleware
+
+    app = WSGIMiddleware(app)
+    app = ASGIMiddleware(app)
+
+`flags` defaults to the flags declared with `failureflags.register()`. `labels` is a
+function of the WSGI environ (or the ASGI scope) that returns the request labels. They
+are scoped to the request (see `failureflags.scoped_labels()`), so they take part in
+the snapshot and in every fetch made while handling the request. The default labels
+are the request `method` and `path`.
+"""
+import contextvars
+
+import failureflags
+from .scope import extend, snapshot, _scope as _scopeVar, _snapshot as _snapshotVar
+
+def wsgiLabels(environ):
+    """Returns the `method` and `path` labels of a WSGI request."""
+    return {"method": environ.get("REQUEST_METHOD", ""), "path": environ.get("PATH_INFO", "")}
+
+def asgiLabels(scope):
+    """Returns the `method` and `path` labels of an ASGI request."""
+    return {"method": scope.get("method", "GET"), "path": scope.get("path", "")}
+
+class WSGIMiddleware:
+    """WSGIMiddleware runs each request with its labels scoped and an experiment snapshot.
+
+    The snapshot also covers the iteration of a streamed response body.
+    """
+
+    def __init__(self, app, flags=None, labels=wsgiLabels, timeout=None):
+        self.app = app
+        self.flags = flags
+        self.labels = labels
+        self.timeout = timeout
+
+    def __call__(self, environ, start_response):
+        if not failureflags._enabled:
+            return self.app(environ, start_response)
+        context = contextvars.copy_context()
+        return _ResponseIterable(context, context.run(self._handle, environ, start_response))
+
+    def _handle(self, environ, start_response):
+        # runs in a copy of the server's context, nothing set here outlives the request
+        _scopeVar.set(extend(self.labels(environ)))
+        flags = failureflags._snapshotFlags(self.flags)
+        _snapshotVar.set(failureflags._resolveSnapshot(flags, self.timeout))
+        return self.app(environ, start_response)
+
+class _ResponseIterable:
+    """Iterates a WSGI response body in the context the request was handled in."""
+
+    def __init__(self, context, iterable):
+        self._context = context
+        self._iterable = iterable
+        self._iterator = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._iterator is None:
+            self._iterator = self._context.run(iter, self._iterable)
+        return self._context.run(next, self._iterator)
+
+    def close(self):
+        close = getattr(self._iterable, "close", None)
+        if close is not None:
+            self._context.run(close)
+
+class ASGIMiddleware:
+    """ASGIMiddleware runs each HTTP and WebSocket connection with its labels scoped and an
+    experiment snapshot. The snapshot is resolved without blocking the event loop."""
+
+    def __init__(self, app, flags=None, labels=asgiLabels, timeout=None):
+        self.app = app
+        self.flags = flags
+        self.labels = labels
+        self.timeout = timeout
+
+    async def __call__(self, scope, receive, send):
+        if scope.get("type") not in ("http", "websocket") or not failureflags._enabled:
+            return await self.app(scope, receive, send)
+        with failureflags.scoped_labels(self.labels(scope)):
+            with snapshot(await self._resolve()):
+                return await self.app(scope, receive, send)
+
+    async def _resolve(self):
+        from . import aio
+        flags = failureflags._snapshotFlags(self.flags)
+        if not flags:
+            return None
+        try:
+            return failureflags._snapshotOf(flags, await aio.afetch_many(flags, self.timeout))
+        except Exception as err:
+            failureflags.logger.debug("unable to resolve an experiment snapshot: %s", err)
+            return None
@@ -0,0 +1,176 @@
+"""Copy-on-write patches for the `data` effect.
+
+A `data` clause is a list of operations, or a dict that is shorthand for merging that
+dict into the data:
+
+    "data": [
+        {"op": "replace", "path": "/status", "value": 503},
+        {"op": "merge", "path": "/body", "value": {"error": "injected", "items": null}},
+        {"op": "delete", "path": "/headers/etag"}
+    ]
+
+    "data": {"status": 503}
+
+`path` is a JSON pointer (RFC 6901), the empty string is the whole document. A path
+without a leading slash names a single top-level key. `replace` sets the value at the
+path, `-` appends to a list. `merge` follows JSON merge patch (RFC 7386): nested dicts are
+merged and a null value deletes the key. `delete` removes the key or list item.
+
+Like JSON Patch `add`, `replace` and `merge` create the last key of their path if it is
+missing. Every other element of the path must exist, otherwise the operation is
+skipped, as is a `delete` of a missing key and a `merge` that changes nothing.
+
+Patches never mutate the document they are applied to. Only the dicts and lists along a
+patched path are copied, everything else is shared with the original document.
+"""
+import copy
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+REPLACE = "replace"
+MERGE = "merge"
+DELETE = "delete"
+OPERATIONS = (REPLACE, MERGE, DELETE)
+
+# sentinels for a missing path element and for an operation that did not apply
+_MISSING = object()
+_SKIPPED = object()
+
+class Patch:
+    """Patch is a single compiled operation of a `data` clause."""
+    __slots__ = ("op", "path", "value", "mutable")
+
+    def __init__(self, op, path, value=None):
+        self.op = op
+        self.path = path
+        self.value = value
+        # values are copied when applied so the caller never holds the experiment's objects
+        self.mutable = isinstance(value, (dict, list))
+
+    def fresh(self):
+        return copy.deepcopy(self.value) if self.mutable else self.value
+
+def parsePointer(path):
+    """Returns the reference tokens of a JSON pointer as a tuple."""
+    if path == "":
+        return ()
+    if not path.startswith("/"):
+        return (path,)
+    return tuple(token.replace("~1", "/").replace("~0", "~") for token in path[1:].split("/"))
+
+def compilePatches(clause):
+    """Returns the `data` clause as a tuple of `Patch`, or None if it holds no valid operation."""
+    if isinstance(clause, dict):
+        clause = [{"op": MERGE, "path": "", "value": clause}]
+    if not isinstance(clause, list):
+        return None
+    patches = []
+    for operation in clause:
+        if not isinstance(operation, dict):
+            logger.debug("data clause contained a non-object operation")
+            continue
+        op = operation.get("op")
+        path = operation.get("path", "")
+        if op not in OPERATIONS or type(path) is not str:
+            logger.debug("data clause contained an invalid operation: %s %s", op, path)
+            continue
+        tokens = parsePointer(path)
+        if op == DELETE:
+            if not tokens:
+                logger.debug("data clause cannot delete the whole document")
+                continue
+        elif "value" not in operation:
+            logger.debug("data clause %s operation has no value", op)
+            continue
+        patches.append(Patch(op, tokens, operation.get("value")))
+    return tuple(patches) if patches else None
+
+def applyPatches(document, patches):
+    """Applies `patches` to `document` and returns `(document, applied)`.
+
+    `document` is not mutated. The result shares every untouched dict and list with it.
+    `applied` is True if at least one operation changed the document.
+    """
+    applied = False
+    for patch in patches:
+        result = _apply(document, patch, 0)
+        if result is not _SKIPPED:
+            document = result
+            applied = True
+    return document, applied
+
+def _apply(node, patch, depth):
+    path = patch.path
+    if depth == len(path):
+        return patch.fresh() if patch.op == REPLACE else _merge(node, patch.value)
+    last = depth == len(path) - 1
+    if isinstance(node, dict):
+        key = path[depth]
+        present = key in node
+    elif isinstance(node, list):
+        key = _index(path[depth], len(node), last and patch.op == REPLACE)
+        if key is None:
+            return _SKIPPED
+        present = key < len(node)
+    else:
+        return _SKIPPED
+    if last and patch.op == DELETE:
+        if not present:
+            return _SKIPPED
+        result = node.copy()
+        del result[key]
+        return result
+    if present:
+        child = node[key]
+    elif last:
+        child = _MISSING
+    else:
+        return _SKIPPED
+    value = _apply(child, patch, depth + 1)
+    if value is _SKIPPED:
+        return value
+    result = node.copy()
+    if present:
+        result[key] = value
+    elif isinstance(result, list):
+        result.append(value)
+    else:
+        result[key] = value
+    return result
+
+def _index(token, length, append):
+    if token == "-":
+        return length if append else None
+    if not token.isdigit() or (len(token) > 1 and token[0] == "0"):
+        return None
+    index = int(token)
+    return index if index < length else None
+
+def _merge(target, value):
+    # returns _SKIPPED if merging `value` leaves `target` as it is
+    if not isinstance(value, dict):
+        if type(target) is type(value) and target == value:
+            return _SKIPPED
+        return copy.deepcopy(value) if isinstance(value, list) else value
+    if isinstance(target, dict):
+        result = None
+    else:
+        # merging a dict into anything else replaces it
+        target, result = {}, {}
+    for key, item in value.items():
+        if item is None:
+            if key not in target:
+                continue
+            if result is None:
+                result = target.copy()
+            del result[key]
+        else:
+            merged = _merge(target.get(key, _MISSING), item)
+            if merged is _SKIPPED:
+                continue
+            if result is None:
+                result = target.copy()
+            result[key] = merged
+    return result if result is not None else _SKIPPED
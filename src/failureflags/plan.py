@@ -0,0 +1,196 @@
+"""Compiled effect plans.
+
+Experiments arrive as nested dicts. The default behavior chain used to re-validate and
+re-parse those dicts on every `invoke()`. Instead, each experiment is compiled once into
+an `EffectPlan` that holds its parsed rate, latency, a ready to call exception factory,
+and its compiled data patches. `CompiledExperiments` carries the plans alongside the raw
+experiments so they can be cached together.
+
+Exception classes named by experiments are resolved through `resolveExceptionClass()`,
+which memoizes both successful and failed lookups so a module is imported at most once
+per process and a misconfigured experiment does not retry the import on every call.
+"""
+import functools
+import importlib
+import os
+import threading
+
+import logging
+
+from .patch import compilePatches
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXCEPTION_MESSAGE = "Error injected via Gremlin Failure Flags (default message)"
+
+RESOLVE_CACHE_SIZE = 256
+
+_resolved = {}
+_resolvedLock = threading.Lock()
+_allowedModules = None
+
+def setExceptionAllowlist(modules):
+    """Restricts the modules that exception clauses may import.
+
+    `modules` is an iterable of module names, a name also allows its submodules. Pass
+    None to allow any module. `builtins` is always allowed.
+    """
+    global _allowedModules
+    with _resolvedLock:
+        _allowedModules = frozenset(modules) if modules is not None else None
+        _resolved.clear()
+
+def _allowed(module):
+    if _allowedModules is None or module == "builtins":
+        return True
+    if module in _allowedModules:
+        return True
+    return any(module.startswith(allowed + ".") for allowed in _allowedModules)
+
+def resolveExceptionClass(module, className):
+    """Returns the exception class `module.className`, or an `Unresolvable` describing why not.
+
+    Results are memoized in a bounded, process-wide cache. Reads do not take a lock.
+    Only subclasses of `BaseException` are accepted, and only from allowed modules.
+    """
+    key = (module, className)
+    resolved = _resolved.get(key)
+    if resolved is not None:
+        return resolved
+    if not _allowed(module):
+        resolved = Unresolvable(module, className, ImportError(f"module {module} is not in the exception allowlist"))
+    else:
+        try:
+            class_ = getattr(importlib.import_module(module), className)
+            if not (isinstance(class_, type) and issubclass(class_, BaseException)):
+                raise TypeError(f"{module}.{className} is not an exception class")
+            resolved = class_
+        except Exception as err:
+            resolved = Unresolvable(module, className, err)
+    with _resolvedLock:
+        if len(_resolved) >= RESOLVE_CACHE_SIZE:
+            # evict the oldest entry, dicts preserve insertion order
+            del _resolved[next(iter(_resolved))]
+        _resolved[key] = resolved
+    return resolved
+
+class Unresolvable:
+    """Marks an exception clause whose class could not be loaded."""
+    __slots__ = ("module", "className", "error")
+
+    def __init__(self, module, className, error):
+        self.module = module
+        self.className = className
+        self.error = error
+
+class EffectPlan:
+    """EffectPlan is the compiled, immutable form of a single experiment.
+
+    `rate` is the probability of impact or None if the experiment carries no valid rate.
+    `latency` and `jitter` are in seconds, `latency` is None without a latency clause.
+    `exception` is None, a callable returning the exception to raise, or an `Unresolvable`.
+    `data` is None or a tuple of `failureflags.patch.Patch` for the flag's data.
+    """
+    __slots__ = ("experiment", "rate", "latency", "jitter", "exception", "data")
+
+    def __init__(self, experiment, rate, latency, jitter, exception, data=None):
+        self.experiment = experiment
+        self.rate = rate
+        self.latency = latency
+        self.jitter = jitter
+        self.exception = exception
+        self.data = data
+
+    def __setattr__(self, name, value):
+        if hasattr(self, name):
+            raise AttributeError(f"EffectPlan is immutable, cannot set {name}")
+        object.__setattr__(self, name, value)
+
+class CompiledExperiments(list):
+    """A list of raw experiments that also carries their compiled `plans`.
+
+    It is a regular list so custom behaviors and callers of `invoke()` keep working with
+    plain experiment dicts. Do not mutate it, the plans would no longer match.
+    """
+    __slots__ = ("plans", "_maxRate")
+
+    def __init__(self, experiments=(), plans=None):
+        super().__init__(experiments)
+        self.plans = plans if plans is not None else [compileExperiment(e) for e in self]
+        self._maxRate = None
+
+    @property
+    def maxRate(self):
+        """The highest rate of any experiment, 0 if none of them can impact."""
+        if self._maxRate is None:
+            self._maxRate = max((plan.rate for plan in self.plans if plan.rate is not None), default=0)
+        return self._maxRate
+
+    def impacting(self, dice):
+        """Returns the experiments whose rate is beaten by `dice`, as `CompiledExperiments`."""
+        selected = [plan for plan in self.plans if plan.rate is not None and dice < plan.rate]
+        return CompiledExperiments([plan.experiment for plan in selected], selected)
+
+EMPTY_PLAN = EffectPlan(None, None, None, 0, None)
+
+def compileExperiments(experiments):
+    """Returns `experiments` as `CompiledExperiments`, compiling them if necessary."""
+    if type(experiments) is CompiledExperiments:
+        return experiments
+    return CompiledExperiments(experiments if experiments is not None else ())
+
+def compileExperiment(experiment):
+    """Validates a single raw experiment and compiles it into an `EffectPlan`."""
+    if type(experiment) is not dict:
+        return EMPTY_PLAN
+    rate = experiment.get("rate")
+    if not ((type(rate) is float or type(rate) is int) and rate >= 0 and rate <= 1):
+        rate = None
+    effect = experiment.get("effect")
+    if not isinstance(effect, dict):
+        return EffectPlan(experiment, rate, None, 0, None)
+    latency, jitter = _compileLatency(effect.get("latency"))
+    data = effect.get("data")
+    return EffectPlan(experiment, rate, latency, jitter, _compileException(effect.get("exception")),
+                      compilePatches(data) if data is not None else None)
+
+def _compileLatency(clause):
+    if type(clause) is int:
+        return clause/1000, 0
+    elif type(clause) is str:
+        try:
+            return int(clause)/1000, 0
+        except ValueError:
+            logger.debug("experiment contained a non-number latency clause")
+            return None, 0
+    elif isinstance(clause, dict):
+        ms = clause.get("ms")
+        jitter = clause.get("jitter")
+        return (ms/1000 if type(ms) is int else 0), (jitter/1000 if type(jitter) is int else 0)
+    return None, 0
+
+def _compileException(clause):
+    if type(clause) is str:
+        return functools.partial(ValueError, clause)
+    if not isinstance(clause, dict):
+        return None
+    module = clause.get("module")
+    className = clause.get("className")
+    message = clause.get("message")
+    hasKnown = type(module) is str or type(className) is str or type(message) is str
+    if not hasKnown:
+        logger.debug("exception clause was not populated")
+        return None
+    module = module if type(module) is str else "builtins"
+    className = className if type(className) is str else "ValueError"
+    message = message if type(message) is str else DEFAULT_EXCEPTION_MESSAGE
+    if len(className) == 0:
+        # for some reason this was explicitly unset
+        return None
+    class_ = resolveExceptionClass(module, className)
+    if type(class_) is Unresolvable:
+        return class_
+    return functools.partial(class_, message)
+
+if "FAILURE_FLAGS_EXCEPTION_MODULES" in os.environ:
+    setExceptionAllowlist(m.strip() for m in os.environ["FAILURE_FLAGS_EXCEPTION_MODULES"].split(",") if m.strip())
@@ -0,0 +1,78 @@
+"""Request-scoped Failure Flag labels and experiment snapshots.
+
+Labels that describe a request, such as the route, tenant or user, are usually only
+known while that request is being served. Instead of building a new `FailureFlag` with
+those labels on every request, define flags once with their static labels and supply
+the request labels for the duration of a block:
+
+    with failureflags.scoped_labels(route="/checkout", tenant=tenant):
+        handle(request)
+
+Every flag fetched within the block is matched against its own labels merged with the
+scoped labels. The labels are held in a `contextvars.ContextVar`, so each thread and each
+asyncio task sees only its own scope. Nested scopes add to and override the labels of
+the enclosing scope. A flag's own labels take precedence over scoped labels.
+
+An experiment snapshot pins the experiments of a set of flags for the duration of a
+block, see `failureflags.experiment_snapshot()` and `failureflags.middleware`. It is held
+in a `ContextVar` as well.
+"""
+import contextlib
+import contextvars
+
+from .cache import cacheKey
+
+_scope = contextvars.ContextVar("failureflags_scoped_labels", default=None)
+_snapshot = contextvars.ContextVar("failureflags_experiment_snapshot", default=None)
+
+class Scope:
+    """The labels in effect for the current context and their `fingerprint`.
+
+    The fingerprint is a hashable value computed once when the scope is entered. It is
+    combined with a flag's precomputed key to key the experiment cache without sorting
+    the merged labels on every call.
+    """
+
+    __slots__ = ("labels", "fingerprint")
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.fingerprint = cacheKey(None, labels)[1]
+
+def extend(labels):
+    """Returns the `Scope` of the current context extended by `labels`."""
+    outer = _scope.get()
+    if not labels:
+        return outer
+    merged = dict(outer.labels) if outer is not None else {}
+    merged.update(labels)
+    return Scope(merged)
+
+@contextlib.contextmanager
+def scoped_labels(labels=None, **kwargs):
+    """Adds `labels` and keyword labels to every Failure Flag fetched within the block."""
+    if kwargs:
+        labels = {**labels, **kwargs} if labels else kwargs
+    token = _scope.set(extend(labels))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+def current():
+    """Returns the `Scope` of the current context, or None outside of `scoped_labels()`."""
+    return _scope.get()
+
+@contextlib.contextmanager
+def snapshot(experiments):
+    """Makes `experiments`, a dict of flag cache keys to `CompiledExperiments`, the
+    snapshot read by `invoke()` within the block. None leaves the current snapshot."""
+    token = _snapshot.set(experiments if experiments is not None else _snapshot.get())
+    try:
+        yield
+    finally:
+        _snapshot.reset(token)
+
+def currentSnapshot():
+    """Returns the experiment snapshot of the current context, or None."""
+    return _snapshot.get()
@@ -0,0 +1,177 @@
+"""Local evaluation of experiment selectors against Failure Flag labels.
+
+Experiments target a Failure Flag by `failureFlagName` and a `selector`. A selector is a
+map of label keys to a list of acceptable values: every key in the selector must be
+present in the flag's labels and the label value must match one of the listed values.
+A selector value may also be a single string.
+
+`ExperimentTable` evaluates selectors through an inverted index keyed by flag name and
+label key/value, so the cost of a match depends on the flag's labels and not on the
+number of experiments in the table. Results are memoized per name and label set.
+"""
+import threading
+
+from .cache import cacheKey
+from .plan import CompiledExperiments, compileExperiment
+
+# The most distinct name and label combinations memoized per table version
+MEMO_SIZE = 4096
+
+def matches(experiment, name, labels):
+    """Returns True if `experiment` targets a Failure Flag with `name` and `labels`."""
+    if experiment.get("failureFlagName") != name:
+        return False
+    selector = experiment.get("selector") or {}
+    for key, values in selector.items():
+        if key not in labels:
+            return False
+        value = labels[key]
+        if isinstance(values, (list, tuple)):
+            if value not in values:
+                return False
+        elif value != values:
+            return False
+    return True
+
+class _NameIndex:
+    """The experiments targeting one flag name, indexed by selector label key/value."""
+    __slots__ = ("entries", "always", "byLabel", "required", "unindexed")
+
+    def __init__(self):
+        # (experiment, plan) in table order, every other field refers to positions in it
+        self.entries = []
+        self.always = []
+        self.byLabel = {}
+        self.required = []
+        self.unindexed = []
+
+    def add(self, experiment, plan):
+        position = len(self.entries)
+        self.entries.append((experiment, plan))
+        selector = experiment.get("selector") or {}
+        self.required.append(len(selector) if isinstance(selector, dict) else 0)
+        if not isinstance(selector, dict):
+            # never matches, like a selector naming a label the flag does not have
+            return
+        if not selector:
+            self.always.append(position)
+            return
+        postings = []
+        try:
+            for key, values in selector.items():
+                values = values if isinstance(values, (list, tuple)) else (values,)
+                postings.extend((key, value) for value in dict.fromkeys(values))
+        except TypeError:
+            # unhashable selector values are evaluated without the index
+            self.unindexed.append(position)
+            return
+        for posting in postings:
+            self.byLabel.setdefault(posting, []).append(position)
+
+    def match(self, name, labels):
+        counts = {}
+        byLabel = self.byLabel
+        for posting in labels.items():
+            try:
+                positions = byLabel.get(posting)
+            except TypeError:
+                continue
+            if positions:
+                for position in positions:
+                    counts[position] = counts.get(position, 0) + 1
+        required = self.required
+        selected = [p for p, count in counts.items() if count == required[p]]
+        selected.extend(self.always)
+        selected.extend(p for p in self.unindexed if matches(self.entries[p][0], name, labels))
+        selected.sort()
+        entries = self.entries
+        return CompiledExperiments([entries[p][0] for p in selected], [entries[p][1] for p in selected])
+
+class _State:
+    __slots__ = ("byGuid", "byName", "memo")
+
+    def __init__(self, byGuid, byName):
+        self.byGuid = byGuid
+        self.byName = byName
+        self.memo = {}
+
+class ExperimentTable:
+    """ExperimentTable holds the experiments known to this process, keyed by `guid`.
+
+    Each experiment is compiled into an effect plan once, when it enters the table.
+
+    Writers rebuild the table and its index and swap them in under a lock. Readers never
+    take the lock and always see a consistent table, so `match()` is safe to call from
+    any thread.
+    """
+
+    def __init__(self, experiments=()):
+        self._lock = threading.Lock()
+        self._state = _State({}, {})
+        self.reset(experiments)
+
+    def _swap(self, byGuid):
+        byName = {}
+        for experiment, plan in byGuid.values():
+            name = experiment.get("failureFlagName")
+            index = byName.get(name)
+            if index is None:
+                index = byName[name] = _NameIndex()
+            index.add(experiment, plan)
+        # publish the table, its index and an empty memo with a single reference assignment
+        self._state = _State(byGuid, byName)
+
+    def reset(self, experiments):
+        """Replaces the content of the table with `experiments`."""
+        with self._lock:
+            self._swap({e["guid"]: (e, compileExperiment(e)) for e in experiments
+                        if isinstance(e, dict) and "guid" in e})
+
+    def add(self, experiment):
+        """Adds or replaces a single experiment."""
+        if not isinstance(experiment, dict) or "guid" not in experiment:
+            return
+        with self._lock:
+            byGuid = dict(self._state.byGuid)
+            byGuid[experiment["guid"]] = (experiment, compileExperiment(experiment))
+            self._swap(byGuid)
+
+    def remove(self, guid):
+        """Removes the experiment with `guid` if present."""
+        with self._lock:
+            if guid not in self._state.byGuid:
+                return
+            byGuid = dict(self._state.byGuid)
+            del byGuid[guid]
+            self._swap(byGuid)
+
+    def clear(self):
+        self.reset(())
+
+    def match(self, name, labels):
+        """Returns the experiments targeting a Failure Flag with `name` and `labels`.
+
+        The result is a `CompiledExperiments` list built from plans compiled when the
+        experiments were added to the table. Results are memoized until the table
+        changes, so do not mutate the returned list.
+        """
+        state = self._state
+        index = state.byName.get(name)
+        if index is None:
+            return CompiledExperiments((), [])
+        key = cacheKey(name, labels)
+        memo = state.memo
+        result = memo.get(key)
+        if result is None:
+            result = index.match(name, labels)
+            if len(memo) >= MEMO_SIZE:
+                memo.clear()
+            memo[key] = result
+        return result
+
+    def experiments(self):
+        """Returns every experiment in the table."""
+        return [e for e, _ in self._state.byGuid.values()]
+
+    def __len__(self):
+        return len(self._state.byGuid)
@@ -0,0 +1,246 @@
+"""One experiment snapshot shared by every process on a host.
+
+Prefork servers run many worker processes that would each load experiments on their
+own. With a shared snapshot a single designated refresher process loads the experiment
+definitions and writes them into a memory-mapped file. Every process, including the
+refresher, reads the snapshot from that mapping and only parses it again when its
+version changes.
+
+The segment starts with a fixed header followed by the JSON encoded definitions:
+
+    magic      4 bytes   b"FFS1"
+    (padding)  4 bytes
+    sequence   uint64    odd while a write is in progress
+    writtenAt  double    time.time() of the last write
+    length     uint32    payload length, UNAVAILABLE if the last load failed
+
+Readers use the sequence as a seqlock: they read the sequence, copy the payload, and
+read the sequence again, retrying if it was odd or has changed. They never take a lock.
+
+The refresher is elected with an exclusive `flock()` on `<path>.lock`. The lock is
+released by the kernel when the refresher exits, and the other processes try to take
+it over every `refresh` seconds. Snapshots older than `maxAge` are ignored so that the
+SDK fails safe if no refresher is left.
+"""
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import weakref
+
+import logging
+
+from .selector import ExperimentTable
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"FFS1"
+HEADER = struct.Struct("<4s4xQdI")
+SEQUENCE = struct.Struct("<Q")
+SEQUENCE_OFFSET = 8
+DEFAULT_SIZE = 1 << 20
+UNAVAILABLE = 0xFFFFFFFF
+READ_ATTEMPTS = 100
+
+def defaultPath():
+    """Returns the default snapshot path, in /dev/shm when it exists."""
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else "/tmp"
+    return os.path.join(directory, f"failureflags-{os.getuid()}.snapshot")
+
+class SharedSnapshot:
+    """SharedSnapshot is a versioned byte payload in a memory-mapped file."""
+
+    def __init__(self, path, size=DEFAULT_SIZE):
+        self.path = path
+        self.size = size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+
+    @property
+    def capacity(self):
+        return self.size - HEADER.size
+
+    def version(self):
+        """Returns the current sequence number, it changes with every write."""
+        return SEQUENCE.unpack_from(self._map, SEQUENCE_OFFSET)[0]
+
+    def write(self, payload):
+        """Publishes `payload` (bytes), or marks the snapshot unavailable if it is None.
+
+        Only one process may write at a time, see `SharedExperiments`.
+        """
+        if payload is not None and len(payload) > self.capacity:
+            logger.debug("experiment snapshot of %s bytes does not fit in %s", len(payload), self.path)
+            payload = None
+        sequence = self.version()
+        sequence += 1 if sequence % 2 == 0 else 2
+        # an odd sequence tells readers a write is in progress
+        SEQUENCE.pack_into(self._map, SEQUENCE_OFFSET, sequence)
+        length = UNAVAILABLE if payload is None else len(payload)
+        if payload is not None:
+            self._map[HEADER.size:HEADER.size + length] = payload
+        HEADER.pack_into(self._map, 0, MAGIC, sequence, time.time(), length)
+        SEQUENCE.pack_into(self._map, SEQUENCE_OFFSET, sequence + 1)
+
+    def read(self):
+        """Returns a consistent `(version, writtenAt, payload)`. `payload` is None if the
+        snapshot was never written or is marked unavailable."""
+        for _ in range(READ_ATTEMPTS):
+            magic, sequence, writtenAt, length = HEADER.unpack_from(self._map, 0)
+            if sequence % 2 == 1:
+                time.sleep(0)
+                continue
+            payload = None
+            if magic == MAGIC and length != UNAVAILABLE and length <= self.capacity:
+                payload = self._map[HEADER.size:HEADER.size + length]
+            if self.version() == sequence:
+                return sequence, writtenAt, payload
+        raise TimeoutError(f"experiment snapshot {self.path} is being rewritten continuously")
+
+    def close(self):
+        self._map.close()
+
+class SharedExperiments:
+    """SharedExperiments keeps an `ExperimentTable` in sync with a `SharedSnapshot`.
+
+    `loader` is a function returning the list of experiment definitions. It is only
+    called by the process elected as refresher, every `refresh` seconds on a background
+    thread, never by a caller of `ready`. Like `failureflags.local.LocalExperiments` it
+    exposes `ready` and `table`.
+    """
+
+    def __init__(self, snapshot, loader, refresh=5, maxAge=None):
+        self.snapshot = snapshot
+        self.loader = loader
+        self.refresh = refresh
+        self.maxAge = maxAge if maxAge is not None else refresh * 3
+        self.table = ExperimentTable()
+        self.refresher = False
+        self.writes = 0
+        self._version = None
+        self._loaded = False
+        self._writtenAt = 0.0
+        self._lockFd = None
+        self._nextElection = 0.0
+        self._stopped = threading.Event()
+        self._published = threading.Event()
+        self._thread = None
+        _instances.add(self)
+
+    @property
+    def ready(self):
+        """True if the table holds a snapshot younger than `maxAge`."""
+        now = time.monotonic()
+        if not self.refresher and now >= self._nextElection:
+            self._nextElection = now + self.refresh
+            self.elect()
+        if self.snapshot.version() != self._version:
+            self._sync()
+        return self._loaded and time.time() - self._writtenAt < self.maxAge
+
+    def _sync(self):
+        try:
+            version, writtenAt, payload = self.snapshot.read()
+            experiments = json.loads(payload) if payload is not None else None
+        except Exception as err:
+            logger.debug("unable to read the experiment snapshot: %s", err)
+            return
+        self._version = version
+        self._writtenAt = writtenAt
+        if experiments is None:
+            self.table.clear()
+            self._loaded = False
+        else:
+            self.table.reset(experiments)
+            self._loaded = True
+
+    def load(self):
+        """Tries to become the refresher and reads the snapshot now. Returns `ready`.
+
+        A process elected as refresher waits for its first load of the definitions.
+        """
+        self._nextElection = time.monotonic() + self.refresh
+        if self.elect():
+            self._published.wait()
+        self._sync()
+        return self.ready
+
+    def match(self, name, labels):
+        return self.table.match(name, labels)
+
+    def elect(self):
+        """Tries to become the refresher. Returns True if this process is the refresher.
+
+        A new refresher loads the definitions on its background thread, this does not wait
+        for them.
+        """
+        if self.refresher or self._stopped.is_set():
+            return self.refresher
+        fd = os.open(self.snapshot.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lockFd = fd
+        self.refresher = True
+        self._thread = threading.Thread(target=self._run, name="failureflags-snapshot-refresh", daemon=True)
+        self._thread.start()
+        return True
+
+    def publish(self):
+        """Loads the definitions and writes them to the snapshot. Refresher only."""
+        try:
+            payload = json.dumps(self.loader(), separators=(",", ":")).encode("utf-8")
+        except Exception as err:
+            logger.debug("unable to load experiment definitions, marking the snapshot unavailable: %s", err)
+            payload = None
+        try:
+            self.snapshot.write(payload)
+            self.writes += 1
+        finally:
+            self._published.set()
+
+    def _run(self):
+        pid = os.getpid()
+        self.publish()
+        while not self._stopped.wait(self.refresh) and pid == os.getpid():
+            self.publish()
+
+    def stop(self):
+        """Stops refreshing and gives up the refresher role."""
+        self._stopped.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(1)
+        self._release()
+
+    def _release(self):
+        self.refresher = False
+        if self._lockFd is not None:
+            os.close(self._lockFd)
+            self._lockFd = None
+
+_instances = weakref.WeakSet()
+
+def _afterForkInChild():
+    for shared in list(_instances):
+        # the child inherits the parent's lock but not its refresher thread, the parent
+        # stays the refresher
+        if shared._lockFd is not None:
+            os.close(shared._lockFd)
+            shared._lockFd = None
+        shared.refresher = False
+        shared._thread = None
+        shared._published.clear()
+        shared._nextElection = 0.0
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_afterForkInChild)
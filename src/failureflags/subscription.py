@@ -0,0 +1,163 @@
+"""Subscription mode: a single background connection that keeps a local experiment table.
+
+The sidecar pushes experiment changes as a server-sent-event stream. Three events are
+understood:
+
+    event: reset     data: a JSON list with every active experiment
+    event: add       data: a JSON experiment
+    event: remove    data: a JSON object with the `guid` of the removed experiment
+
+The sidecar sends `reset` right after a client connects. The subscription is only
+`ready` once that first snapshot was received. Whenever the stream breaks the table is
+cleared and `ready` drops back to False, so `invoke()` falls back to fetching until the
+stream is re-established.
+"""
+import json
+import os
+import socket
+import threading
+
+import logging
+
+from .selector import ExperimentTable
+from .transport import newConnection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_URL = "http://localhost:5032/experiments/stream"
+
+def events(lines):
+    """Parses an iterable of server-sent-event lines (bytes) into `(event, data)` pairs."""
+    event = "message"
+    data = []
+    for raw in lines:
+        line = raw.decode("utf-8").rstrip("\r\n")
+        if line == "":
+            if data:
+                yield event, "\n".join(data)
+            event = "message"
+            data = []
+            continue
+        if line.startswith(":"):
+            continue
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if field == "event":
+            event = value
+        elif field == "data":
+            data.append(value)
+
+class Subscription:
+    """Subscription streams experiment changes from the sidecar into an `ExperimentTable`.
+
+    Keyword arguments:
+    url -- the sidecar event stream (default http://localhost:5032/experiments/stream),
+           `http+unix://` URLs are supported as well.
+    retryMin -- seconds to wait before the first reconnect attempt (default 0.5).
+    retryMax -- upper bound for the exponential reconnect backoff (default 30).
+    """
+
+    def __init__(self, url=DEFAULT_URL, retryMin=.5, retryMax=30):
+        self.url = url
+        self.retryMin = retryMin
+        self.retryMax = retryMax
+        self.table = ExperimentTable()
+        self.connects = 0
+        self.received = 0
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        self._sock = None
+        self._thread = None
+        self._pid = None
+
+    @property
+    def ready(self):
+        """True if the table reflects the sidecar's current experiments."""
+        if self._pid != os.getpid() and not self._stopped.is_set():
+            # the stream thread does not survive os.fork(), start a new one in the child
+            self._restart()
+            return False
+        return self._ready.is_set()
+
+    def start(self):
+        """Starts the background stream. Returns self."""
+        self._stopped.clear()
+        self._restart()
+        return self
+
+    def _restart(self):
+        self._pid = os.getpid()
+        self._ready.clear()
+        self.table.clear()
+        self._thread = threading.Thread(target=self._run, name="failureflags-subscription", daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        """Blocks until the first snapshot was received. Returns True if ready."""
+        return self._ready.wait(timeout)
+
+    def stop(self):
+        """Stops the background stream and clears the table."""
+        self._stopped.set()
+        sock = self._sock
+        if sock is not None:
+            try:
+                # unblocks the stream thread waiting for the next event
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(1)
+        self._ready.clear()
+        self.table.clear()
+
+    def _run(self):
+        delay = self.retryMin
+        pid = self._pid
+        while not self._stopped.is_set() and pid == os.getpid():
+            try:
+                self._stream()
+                delay = self.retryMin
+            except Exception as err:
+                if not self._stopped.is_set():
+                    logger.debug("experiment stream failed, reconnecting in %ss: %s", delay, err)
+            finally:
+                self._ready.clear()
+                self.table.clear()
+            if self._stopped.wait(delay):
+                break
+            delay = min(delay * 2, self.retryMax)
+
+    def _stream(self):
+        conn, path = newConnection(self.url)
+        try:
+            conn.request("GET", path, headers={"Accept": "text/event-stream"})
+            # keep the socket, http.client hands it over to the response for streamed bodies
+            self._sock = conn.sock
+            response = conn.getresponse()
+            content_type = response.headers.get("Content-Type", "").lower()
+            if response.status != 200 or not content_type.startswith("text/event-stream"):
+                raise ValueError(f"unexpected experiment stream response ({response.status}, {content_type})")
+            self.connects += 1
+            for event, data in events(response):
+                if self._stopped.is_set():
+                    return
+                self._apply(event, data)
+        finally:
+            self._sock = None
+            conn.close()
+
+    def _apply(self, event, data):
+        self.received += 1
+        payload = json.loads(data)
+        if event == "reset":
+            self.table.reset(payload if isinstance(payload, list) else [])
+            self._ready.set()
+        elif event == "add":
+            self.table.add(payload)
+        elif event == "remove":
+            if isinstance(payload, dict) and "guid" in payload:
+                self.table.remove(payload["guid"])
+        else:
+            logger.debug("ignoring unknown experiment stream event: %s", event)
@@ -0,0 +1,380 @@
+"""A local sidecar simulator and load generator for integration and load tests.
+
+`SidecarSimulator` is a multi-threaded HTTP server that implements the sidecar's
+contract: `POST /experiment`, the batch endpoint `POST /experiments`, the experiment
+definitions at `GET /experiments` and the event stream at `GET /experiments/stream`.
+It listens on a TCP port or a Unix domain socket and talks to the SDK over its real
+transport, so no mocking is involved:
+
+    from failureflags.testing import SidecarSimulator
+
+    with SidecarSimulator() as sidecar:
+        sidecar.program("db", {"table": "users"}, experiments=[...], latency=.002)
+        sidecar.program("http", status=503)
+        FailureFlag("db", {"table": "users"}, endpoint=sidecar.endpoint).invoke()
+
+Every response can be programmed per flag name and label set with `program()`: the
+experiments returned, added latency, an error status, a malformed Content-Type or
+Content-Length, or dropping the connection without a response.
+
+`runLoad()` and `arunLoad()` drive `invoke()` (or `ainvoke()`) from many threads or
+coroutines and return a `LoadReport` with throughput and tail latency.
+"""
+import asyncio
+import json
+import os
+import queue
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .transport import sidecarURL
+
+# `contentLength` value that sends the correct Content-Length
+AUTO = "auto"
+
+# errors of a client that hung up before its response was written
+_DISCONNECTS = (BrokenPipeError, ConnectionResetError, ConnectionAbortedError)
+
+class _QuietDisconnects:
+    """Ignores clients that hang up, which timeouts, hedged and dropped requests do on
+    purpose, instead of printing a traceback for each of them."""
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], _DISCONNECTS):
+            return
+        super().handle_error(request, client_address)
+
+class _TCPServer(_QuietDisconnects, ThreadingHTTPServer):
+    # load tests open many connections at once, the default backlog of 5 drops some of them
+    request_queue_size = 128
+    daemon_threads = True
+
+class _UnixServer(_QuietDisconnects, socketserver.ThreadingUnixStreamServer):
+    request_queue_size = 128
+    daemon_threads = True
+
+class Rule:
+    """Rule programs the responses for one flag name and the flags whose labels include `labels`.
+
+    Keyword arguments:
+    experiments -- the experiments returned (default None, use the simulator's experiments).
+    latency -- seconds to wait before responding (default 0).
+    status -- the HTTP status to respond with (default 200).
+    contentType -- the Content-Type header (default application/json).
+    contentLength -- AUTO (default) for the correct Content-Length, None to omit the
+                     header, or an int to send that value instead.
+    body -- raw bytes to respond with instead of the encoded experiments.
+    drop -- True to close the connection without responding.
+    """
+
+    def __init__(self, name, labels=None, experiments=None, latency=0, status=200,
+                 contentType="application/json", contentLength=AUTO, body=None, drop=False):
+        self.name = name
+        self.labels = dict(labels or {})
+        self.experiments = experiments
+        self.latency = latency
+        self.status = status
+        self.contentType = contentType
+        self.contentLength = contentLength
+        self.body = body
+        self.drop = drop
+        self.hits = 0
+
+    def matches(self, name, labels):
+        if self.name is not None and self.name != name:
+            return False
+        return all(key in labels and labels[key] == value for key, value in self.labels.items())
+
+    @property
+    def faulty(self):
+        return (self.drop or self.status != 200 or self.contentType != "application/json"
+                or self.contentLength != AUTO or self.body is not None)
+
+class SidecarSimulator:
+    """SidecarSimulator is an in-process stand-in for the Failure Flags sidecar.
+
+    `experiments` is either the list returned for every flag or a function of the flag
+    name and labels returning that flag's list. Rules added with `program()` take
+    precedence. Pass `unixSocket` to listen on a Unix domain socket instead of a TCP
+    port. `idleTimeout` closes kept-alive connections that stay idle that many seconds.
+
+    Every request is appended to `requests` as a `(path, decoded body)` pair.
+    """
+
+    def __init__(self, experiments=None, idleTimeout=None, unixSocket=None):
+        self.experiments = experiments if experiments is not None else []
+        self.requests = []
+        self.rules = []
+        self.closeConnections = False
+        self.batch = True
+        self.stream = queue.Queue()
+        self.stopping = threading.Event()
+        self._rulesLock = threading.Lock()
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            timeout = idleTimeout
+            # headers and body are written separately, avoid Nagle/delayed-ACK stalls on TCP
+            disable_nagle_algorithm = unixSocket is None
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                simulator._post(self)
+
+            def do_GET(self):
+                simulator._get(self)
+
+        if unixSocket is not None:
+            self.server = _UnixServer(unixSocket, Handler)
+            self.port = None
+            self.endpoint = f"unix://{unixSocket}"
+        else:
+            self.server = _TCPServer(("127.0.0.1", 0), Handler)
+            self.port = self.server.server_address[1]
+            self.endpoint = f"http://127.0.0.1:{self.port}"
+        self.unixSocket = unixSocket
+        self.url = sidecarURL(self.endpoint, "/experiment")
+        self.streamUrl = sidecarURL(self.endpoint, "/experiments/stream")
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        self.server.shutdown()
+        self.server.server_close()
+        if self.unixSocket is not None and os.path.exists(self.unixSocket):
+            os.unlink(self.unixSocket)
+
+    def program(self, name=None, labels=None, **kwargs):
+        """Adds and returns a `Rule` for flags named `name` whose labels include `labels`.
+
+        `name=None` matches every flag. The most recently added matching rule wins.
+        """
+        rule = Rule(name, labels, **kwargs)
+        with self._rulesLock:
+            self.rules.insert(0, rule)
+        return rule
+
+    def reset(self):
+        """Removes every rule and forgets the recorded requests."""
+        with self._rulesLock:
+            self.rules = []
+        self.requests = []
+
+    def ruleFor(self, name, labels):
+        """Returns the `Rule` that applies to a flag, or None."""
+        for rule in self.rules:
+            if rule.matches(name, labels or {}):
+                return rule
+        return None
+
+    def experimentsFor(self, name, labels, rule=None):
+        rule = rule if rule is not None else self.ruleFor(name, labels)
+        if rule is not None and rule.experiments is not None:
+            return rule.experiments
+        if callable(self.experiments):
+            return self.experiments(name, labels)
+        return self.experiments
+
+    def publish(self, event, data):
+        """Sends a server-sent event to the connected experiment stream."""
+        self.stream.put((event, data))
+
+    def disconnect(self):
+        """Ends the current experiment stream."""
+        self.stream.put(None)
+
+    def _post(self, handler):
+        length = int(handler.headers.get("Content-Length", 0))
+        request = json.loads(handler.rfile.read(length) or b"null")
+        self.requests.append((handler.path, request))
+        if handler.path == "/experiments":
+            if not self.batch:
+                self._respond(handler, 404, b"")
+                return
+            flags = request["flags"]
+            rules = [self.ruleFor(f["name"], f["labels"]) for f in flags]
+            payload = [self.experimentsFor(f["name"], f["labels"], rule) for f, rule in zip(flags, rules)]
+            # the slowest flag delays the batch, and a fault of any flag applies to all of it
+            rules = [rule for rule in rules if rule is not None]
+            for rule in rules:
+                rule.hits += 1
+            latency = max((rule.latency for rule in rules), default=0)
+            rule = next((rule for rule in rules if rule.faulty), None)
+        else:
+            name, labels = request.get("name"), request.get("labels", {})
+            rule = self.ruleFor(name, labels)
+            payload = self.experimentsFor(name, labels, rule)
+            latency = 0
+            if rule is not None:
+                rule.hits += 1
+                latency = rule.latency
+        if latency:
+            time.sleep(latency)
+        if rule is not None and rule.drop:
+            handler.close_connection = True
+            return
+        body = json.dumps(payload).encode("utf-8")
+        if rule is None:
+            self._respond(handler, 200, body)
+            return
+        self._respond(handler, rule.status, rule.body if rule.body is not None else body,
+                      rule.contentType, rule.contentLength)
+
+    def _respond(self, handler, status, body, contentType="application/json", contentLength=AUTO):
+        handler.send_response(status)
+        if contentType is not None:
+            handler.send_header("Content-Type", contentType)
+        if contentLength == AUTO:
+            handler.send_header("Content-Length", str(len(body)))
+        else:
+            if contentLength is not None:
+                handler.send_header("Content-Length", str(contentLength))
+            # the body no longer frames the response, the connection cannot be reused
+            handler.send_header("Connection", "close")
+            handler.close_connection = True
+        if self.closeConnections and not handler.close_connection:
+            handler.send_header("Connection", "close")
+            handler.close_connection = True
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _get(self, handler):
+        self.requests.append((handler.path, None))
+        if handler.path == "/experiments":
+            # every experiment definition, for local mode
+            experiments = self.experiments if isinstance(self.experiments, list) else []
+            self._respond(handler, 200, json.dumps(experiments).encode("utf-8"))
+            return
+        if handler.path != "/experiments/stream":
+            handler.send_error(404)
+            return
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        handler.close_connection = True
+        while not self.stopping.is_set():
+            try:
+                item = self.stream.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            if item is None:
+                return
+            event, data = item
+            handler.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+            handler.wfile.flush()
+
+class LoadReport:
+    """LoadReport summarizes a load run. Latencies are in seconds."""
+
+    def __init__(self, latencies, errors, impacted, elapsed, workers):
+        latencies.sort()
+        self.calls = len(latencies)
+        self.errors = errors
+        self.impacted = impacted
+        self.elapsed = elapsed
+        self.workers = workers
+        self.throughput = self.calls / elapsed if elapsed > 0 else 0.0
+        self.p50 = _quantile(latencies, .5)
+        self.p90 = _quantile(latencies, .9)
+        self.p99 = _quantile(latencies, .99)
+        self.p999 = _quantile(latencies, .999)
+        self.max = latencies[-1] if latencies else 0.0
+
+    def asDict(self):
+        return {"calls": self.calls, "errors": self.errors, "impacted": self.impacted,
+                "elapsed": self.elapsed, "workers": self.workers, "throughput": self.throughput,
+                "p50": self.p50, "p90": self.p90, "p99": self.p99, "p999": self.p999, "max": self.max}
+
+    def __str__(self):
+        return (f"{self.calls} calls by {self.workers} workers in {self.elapsed:.3f}s: "
+                f"{self.throughput:.0f}/s, p50 {self.p50 * 1e6:.0f}us, p99 {self.p99 * 1e6:.0f}us, "
+                f"p99.9 {self.p999 * 1e6:.0f}us, max {self.max * 1e6:.0f}us, {self.errors} errors")
+
+def _quantile(ordered, quantile):
+    if not ordered:
+        return 0.0
+    return ordered[min(int(quantile * len(ordered)), len(ordered) - 1)]
+
+def runLoad(flags, threads=8, calls=1000):
+    """Calls `invoke()` `calls` times from each of `threads` threads and returns a `LoadReport`.
+
+    `flags` is a FailureFlag, a list of FailureFlags that each thread cycles through, or
+    a function of the thread index returning such a list. Exceptions raised by
+    `invoke()`, for example by an `exception` effect, are counted as errors.
+    """
+    start = threading.Barrier(threads + 1)
+    results = [None] * threads
+
+    def worker(index):
+        ring = _flagsFor(flags, index)
+        latencies, errors, impacted = [], 0, 0
+        clock = time.perf_counter
+        start.wait()
+        for i in range(calls):
+            ff = ring[i % len(ring)]
+            began = clock()
+            try:
+                if ff.invoke()[1]:
+                    impacted += 1
+            except Exception:
+                errors += 1
+            latencies.append(clock() - began)
+        results[index] = (latencies, errors, impacted)
+
+    workers = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return _report(results, time.perf_counter() - began, threads)
+
+async def arunLoad(flags, coroutines=8, calls=1000):
+    """The asyncio counterpart of `runLoad()`: drives `ainvoke()` from `coroutines` tasks."""
+    results = [None] * coroutines
+
+    async def worker(index):
+        ring = _flagsFor(flags, index)
+        latencies, errors, impacted = [], 0, 0
+        clock = time.perf_counter
+        for i in range(calls):
+            ff = ring[i % len(ring)]
+            began = clock()
+            try:
+                if (await ff.ainvoke())[1]:
+                    impacted += 1
+            except Exception:
+                errors += 1
+            latencies.append(clock() - began)
+        results[index] = (latencies, errors, impacted)
+
+    began = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(coroutines)))
+    return _report(results, time.perf_counter() - began, coroutines)
+
+def _flagsFor(flags, index):
+    if callable(flags):
+        flags = flags(index)
+    return list(flags) if isinstance(flags, (list, tuple)) else [flags]
+
+def _report(results, elapsed, workers):
+    latencies = [latency for result in results for latency in result[0]]
+    return LoadReport(latencies, sum(r[1] for r in results), sum(r[2] for r in results), elapsed, workers)
@@ -0,0 +1,132 @@
+"""Adaptive sidecar timeouts derived from the observed round trip time.
+
+A fixed `timeout` is either too short on a busy node, where experiments are then missed
+silently, or longer than it needs to be on a quiet one. `AdaptiveTimeout` tracks an
+exponentially weighted moving average (EWMA) and a high percentile of the sidecar round
+trip time of this process and derives the fetch timeout from them:
+
+    timeout = clamp(max(percentile, ewma) * headroom, floor, ceiling)
+
+Until `warmup` round trips were observed the `ceiling` is used. A fetch that times out
+took longer than its timeout, it is recorded as a round trip of twice the timeout (at
+most the `ceiling`) so that the estimate rises quickly when the sidecar slows down.
+
+With `hedge=True` an asyncio fetch that has not been answered after `hedgeQuantile` of
+the round trip time is sent a second time on another connection. Both requests stay in
+flight and the first answer wins. This trims the tail of fetches that were stuck behind
+a slow connection at the cost of a few extra requests. A blocking fetch cannot wait for
+two responses at once and is never hedged.
+"""
+import collections
+import os
+import threading
+import weakref
+
+DEFAULT_FLOOR = .001
+DEFAULT_CEILING = .05
+DEFAULT_WINDOW = 256
+DEFAULT_WARMUP = 20
+
+# percentiles are recomputed after this many new observations
+RECOMPUTE_EVERY = 16
+
+class AdaptiveTimeout:
+    """AdaptiveTimeout chooses fetch timeouts and hedge delays from recent round trip times.
+
+    Keyword arguments:
+    floor -- the shortest timeout ever chosen, in seconds (default .001).
+    ceiling -- the longest timeout ever chosen, in seconds (default .05).
+    quantile -- the round trip percentile the timeout is based on (default .99).
+    headroom -- the factor applied to that percentile (default 1.5).
+    hedge -- True to send a second request when an asyncio fetch is slower than usual.
+    hedgeQuantile -- the round trip percentile after which a fetch is hedged (default .95).
+    alpha -- the EWMA smoothing factor (default .1).
+    window -- the number of recent round trips percentiles are computed over (default 256).
+    warmup -- round trips observed before the ceiling is no longer used (default 20).
+    """
+
+    def __init__(self, floor=DEFAULT_FLOOR, ceiling=DEFAULT_CEILING, quantile=.99, headroom=1.5,
+                 hedge=False, hedgeQuantile=.95, alpha=.1, window=DEFAULT_WINDOW, warmup=DEFAULT_WARMUP):
+        if floor <= 0 or ceiling < floor:
+            raise ValueError("adaptive timeout requires 0 < floor <= ceiling")
+        self.floor = floor
+        self.ceiling = ceiling
+        self.quantile = quantile
+        self.headroom = headroom
+        self.hedge = hedge
+        self.hedgeQuantile = hedgeQuantile
+        self.alpha = alpha
+        self.warmup = warmup
+        self._samples = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.ewma = None
+        self.percentile = None
+        self.hedgePercentile = None
+        self.observed = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self._timeout = ceiling
+        self._hedgeDelay = None
+        _instances.add(self)
+
+    def timeout(self):
+        """Returns the timeout for the next fetch, in seconds."""
+        return self._timeout
+
+    def hedgeDelay(self):
+        """Returns the seconds after which the next fetch is hedged, or None to not hedge it."""
+        return self._hedgeDelay
+
+    def observe(self, rtt):
+        """Records the round trip time of a fetch that completed."""
+        with self._lock:
+            self._record(rtt)
+
+    def timedOut(self, timeout):
+        """Records a fetch that timed out after `timeout` seconds."""
+        with self._lock:
+            self.timeouts += 1
+            self._record(min(timeout * 2, self.ceiling))
+
+    def hedged(self):
+        """Records that a fetch was hedged."""
+        with self._lock:
+            self.hedges += 1
+
+    def _record(self, rtt):
+        self._samples.append(rtt)
+        self.ewma = rtt if self.ewma is None else self.ewma + self.alpha * (rtt - self.ewma)
+        self.observed += 1
+        if self.observed < self.warmup:
+            return
+        if self.percentile is None or self.observed % RECOMPUTE_EVERY == 0:
+            samples = sorted(self._samples)
+            self.percentile = _percentile(samples, self.quantile)
+            self.hedgePercentile = _percentile(samples, self.hedgeQuantile)
+        timeout = min(max(max(self.percentile, self.ewma) * self.headroom, self.floor), self.ceiling)
+        self._timeout = timeout
+        if self.hedge:
+            delay = min(max(self.hedgePercentile, self.floor), self.ceiling)
+            self._hedgeDelay = delay if delay < timeout else None
+
+    def stats(self):
+        """Returns the chosen `timeout` and `hedgeDelay`, the round trip `ewma` and
+        `percentile`, and the `observed`, `timeouts` and `hedges` counters. `hedgeRate`
+        is the share of fetches that were hedged."""
+        with self._lock:
+            requests = self.observed
+            return {"timeout": self._timeout, "hedgeDelay": self._hedgeDelay, "ewma": self.ewma,
+                    "percentile": self.percentile, "observed": self.observed, "timeouts": self.timeouts,
+                    "hedges": self.hedges, "hedgeRate": self.hedges / requests if requests else 0.0}
+
+def _percentile(ordered, quantile):
+    return ordered[min(int(quantile * len(ordered)), len(ordered) - 1)]
+
+_instances = weakref.WeakSet()
+
+def _afterForkInChild():
+    for adaptive in list(_instances):
+        adaptive._lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_afterForkInChild)
@@ -0,0 +1,133 @@
+"""An in-memory trace of the most recent `invoke()` decisions.
+
+Debug logging writes every decision as it happens, which is too slow and too noisy to
+leave on under production load. `DecisionTrace` instead keeps the last `size` decisions
+in a fixed-size ring buffer and formats nothing until it is read. Each decision records:
+
+    at          -- wall clock time of the decision
+    flag        -- the flag name
+    fingerprint -- a hash of the flag name and its labels, including scoped labels, that
+                   is stable within a process
+    source      -- where the experiments came from, see `Hooks.experimentsReturned()`
+    duration    -- seconds spent looking up the experiments
+    experiments -- the guids of the experiments returned
+    dice        -- the dice roll
+    impacting   -- the guids of the experiments the dice selected
+    effects     -- the effect types of the impacting experiments
+    impacted    -- True if the behavior reported an impact
+    error       -- the cause of a failed lookup, see `failureflags.hooks.errorCause()`
+
+Recording takes no lock: slots are claimed with an atomic counter and overwritten in
+place. Read the trace with `failureflags.decision_trace()`, or with a signal, see
+`installSignalHandler()`.
+"""
+import itertools
+import os
+import sys
+import time
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZE = 1024
+
+class Decision:
+    __slots__ = ("seq", "at", "flag", "fingerprint", "source", "duration", "experiments", "dice",
+                 "impacting", "impacted", "error")
+
+    def __init__(self, seq, at, flag, fingerprint, source, duration, experiments, dice, impacting, impacted, error):
+        self.seq = seq
+        self.at = at
+        self.flag = flag
+        self.fingerprint = fingerprint
+        self.source = source
+        self.duration = duration
+        self.experiments = experiments
+        self.dice = dice
+        self.impacting = impacting
+        self.impacted = impacted
+        self.error = error
+
+    def asDict(self):
+        """Returns the decision as a dict of plain values."""
+        return {"at": self.at, "flag": self.flag, "fingerprint": f"{self.fingerprint & 0xffffffff:08x}",
+                "source": self.source, "duration": self.duration, "experiments": _guids(self.experiments),
+                "dice": self.dice, "impacting": _guids(self.impacting), "effects": _effects(self.impacting),
+                "impacted": self.impacted, "error": self.error}
+
+def _guids(experiments):
+    return [e.get("guid") if isinstance(e, dict) else None for e in experiments]
+
+def _effects(experiments):
+    effects = set()
+    for e in experiments:
+        effect = e.get("effect") if isinstance(e, dict) else None
+        if isinstance(effect, dict):
+            effects.update(effect)
+    return sorted(effects)
+
+class DecisionTrace:
+    """DecisionTrace is a ring buffer of the last `size` invoke decisions."""
+
+    def __init__(self, size=DEFAULT_SIZE):
+        if size <= 0:
+            raise ValueError("a decision trace needs room for at least one decision")
+        self.size = size
+        self._slots = [None] * size
+        # next() of itertools.count is atomic, concurrent callers never share a slot number
+        self._seq = itertools.count()
+
+    def record(self, flag, key, source, duration, experiments, dice, impacting, impacted, error=None):
+        """Records one decision. `key` is the flag's cache key, only its hash is kept."""
+        seq = next(self._seq)
+        self._slots[seq % self.size] = Decision(seq, time.time(), flag, hash(key), source, duration,
+                                                experiments, dice, impacting, impacted, error)
+
+    def decisions(self):
+        """Returns the recorded decisions as dicts, oldest first."""
+        slots = [d for d in list(self._slots) if d is not None]
+        slots.sort(key=lambda d: d.seq)
+        return [d.asDict() for d in slots]
+
+    def clear(self):
+        self._slots = [None] * self.size
+
+    def dump(self, stream=None):
+        """Writes the recorded decisions to `stream` (default stderr), one JSON object per line."""
+        import json
+        stream = stream if stream is not None else sys.stderr
+        for decision in self.decisions():
+            stream.write(json.dumps(decision, default=str) + "\n")
+        stream.flush()
+
+def installSignalHandler(trace, signum=None, stream=None):
+    """Dumps `trace` to `stream` (default stderr) when the process receives `signum`
+    (default SIGUSR1). Must be called from the main thread. Returns the previous handler."""
+    import signal
+    signum = signum if signum is not None else signal.SIGUSR1
+    return signal.signal(signum, lambda signum, frame: trace.dump(stream))
+
+def fromEnvironment():
+    """Returns a `DecisionTrace` sized by FAILURE_FLAGS_TRACE_SIZE, or None if unset.
+
+    If FAILURE_FLAGS_TRACE_SIGNAL names a signal, such as USR1 or SIGUSR2, the trace is
+    dumped to stderr when the process receives it.
+    """
+    size = os.environ.get("FAILURE_FLAGS_TRACE_SIZE", "")
+    if not size:
+        return None
+    try:
+        trace = DecisionTrace(int(size))
+    except ValueError:
+        logger.debug("ignoring invalid FAILURE_FLAGS_TRACE_SIZE: %s", size)
+        return None
+    name = os.environ.get("FAILURE_FLAGS_TRACE_SIGNAL", "")
+    if name:
+        import signal
+        name = name.upper()
+        try:
+            installSignalHandler(trace, getattr(signal, name if name.startswith("SIG") else "SIG" + name))
+        except (AttributeError, ValueError) as err:
+            logger.debug("unable to dump the decision trace on %s: %s", name, err)
+    return trace
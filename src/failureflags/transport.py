@@ -0,0 +1,272 @@
+"""Pooled HTTP/1.1 transport used by `FailureFlag.fetch()` to talk to the sidecar.
+
+`urlopen()` is a drop-in replacement for `urllib.request.urlopen` for sidecar requests.
+Instead of opening a new connection for every call it borrows a persistent connection
+from a small per-host pool and returns it once the response body has been consumed.
+
+The sidecar is reached over TCP (`http://host:port`) or over a Unix domain socket
+(`unix:///path/to/socket`). Unix domain socket requests are expressed as
+`http+unix://<percent-encoded socket path>/<path>` URLs, see `sidecarURL()`.
+
+`breaker` is the process-wide `CircuitBreaker` that fetches consult before contacting
+the sidecar. It is defined in `failureflags.breaker` so that it is available without
+importing this module, and re-exported here.
+"""
+import functools
+import http.client
+import os
+import socket
+import threading
+from urllib.parse import quote, unquote, urlsplit
+
+from .breaker import CircuitBreaker, breaker, CLOSED, OPEN, HALF_OPEN
+
+DEFAULT_POOL_SIZE = 8
+
+# Errors raised by http.client when a kept-alive connection was closed by the peer
+# between two requests. A request that fails this way on a reused connection is
+# retried once on a freshly opened connection.
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+)
+
+@functools.lru_cache(maxsize=64)
+def sidecarURL(endpoint, path):
+    """Returns the URL of `path` on the sidecar listening at `endpoint`.
+
+    `endpoint` is either `http://host:port`, `unix:///path/to/socket`, or an absolute
+    socket path.
+    """
+    if endpoint.startswith("unix://"):
+        socketPath = endpoint[len("unix://"):]
+    elif endpoint.startswith("/"):
+        socketPath = endpoint
+    else:
+        return endpoint.rstrip("/") + path
+    return "http+unix://" + quote(socketPath, safe="") + path
+
+def address(url):
+    """Splits a sidecar URL into `(socketPath, host, port, path)`.
+
+    `socketPath` is None for TCP URLs, `host` and `port` are None for Unix domain sockets.
+    """
+    parts = urlsplit(url)
+    path = parts.path or "/"
+    if parts.scheme == "http+unix":
+        return unquote(parts.netloc), None, None, path
+    if parts.scheme != "http":
+        raise ValueError(f"unsupported sidecar URL scheme: {parts.scheme}")
+    return None, parts.hostname, parts.port or 80, path
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """An `http.client.HTTPConnection` over a Unix domain socket."""
+
+    def __init__(self, socketPath, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socketPath = socketPath
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            if self.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(self.timeout)
+            sock.connect(self.socketPath)
+        except BaseException:
+            sock.close()
+            raise
+        self.sock = sock
+
+def newConnection(url, timeout=None):
+    """Returns an unconnected `HTTPConnection` for a sidecar URL and the request path."""
+    socketPath, host, port, path = address(url)
+    if socketPath is not None:
+        return UnixHTTPConnection(socketPath, timeout=timeout), path
+    return http.client.HTTPConnection(host, port, timeout=timeout), path
+
+class ConnectionPool:
+    """ConnectionPool keeps up to `maxsize` idle persistent connections to one host.
+
+    Pass `socketPath` to connect over a Unix domain socket instead of TCP.
+
+    The pool never blocks a caller: when every pooled connection is in use a new
+    connection is opened, and connections returned to a full pool are closed. The
+    pool is thread-safe and resets itself in a child process after `os.fork()` so
+    that parent and child never share a socket.
+    """
+
+    def __init__(self, host, port, maxsize=DEFAULT_POOL_SIZE, socketPath=None):
+        self.host = host
+        self.port = port
+        self.socketPath = socketPath
+        self.maxsize = maxsize
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._idle = []
+        self._pid = os.getpid()
+        self.opened = 0
+        self.reused = 0
+        self.discarded = 0
+
+    def _newConnection(self, timeout):
+        if self.socketPath is not None:
+            return UnixHTTPConnection(self.socketPath, timeout=timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def _acquire(self, timeout):
+        """Returns a `(connection, reused)` pair."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # forked without the at-fork hook (or before it was installed)
+                self._idle = []
+                self._pid = os.getpid()
+            if self._idle:
+                self.reused += 1
+                conn = self._idle.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+            self.opened += 1
+        return self._newConnection(timeout), False
+
+    def _release(self, conn, reusable):
+        if reusable and self._pid == os.getpid():
+            with self._lock:
+                if len(self._idle) < self.maxsize:
+                    self._idle.append(conn)
+                    return
+        with self._lock:
+            self.discarded += 1
+        conn.close()
+
+    def urlopen(self, request, timeout=None):
+        """Sends `request` (a `urllib.request.Request`) and returns a `PooledResponse`."""
+        body = request.data
+        headers = dict(request.header_items())
+        method = request.get_method()
+        conn, reused = self._acquire(timeout)
+        try:
+            conn.request(method, request.selector, body=body, headers=headers)
+            response = conn.getresponse()
+        except _STALE_CONNECTION_ERRORS:
+            self._release(conn, False)
+            if not reused:
+                raise
+            # the sidecar closed the kept-alive connection, reconnect once
+            with self._lock:
+                self.opened += 1
+            conn = self._newConnection(timeout)
+            try:
+                conn.request(method, request.selector, body=body, headers=headers)
+                response = conn.getresponse()
+            except BaseException:
+                self._release(conn, False)
+                raise
+        except BaseException:
+            self._release(conn, False)
+            raise
+        return PooledResponse(self, conn, response)
+
+    def clear(self):
+        """Closes every idle connection held by the pool."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        """Returns a dict of counters: `opened`, `reused`, `discarded`, and `idle`."""
+        with self._lock:
+            return {"opened": self.opened, "reused": self.reused,
+                    "discarded": self.discarded, "idle": len(self._idle)}
+
+class PooledResponse:
+    """A context manager around `http.client.HTTPResponse` that hands the connection
+    back to its pool when the response is closed.
+
+    The connection is only reused if the body was read completely and the sidecar did
+    not ask to close the connection. Otherwise it is closed.
+    """
+
+    def __init__(self, pool, conn, response):
+        self._pool = pool
+        self._conn = conn
+        self._response = response
+        self.status = response.status
+        self.headers = response.headers
+
+    def read(self, amt=None):
+        return self._response.read(amt)
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        reusable = self._response.isclosed() and not self._response.will_close
+        self._response.close()
+        self._pool._release(conn, reusable)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+_pools = {}
+_poolsLock = threading.Lock()
+
+def poolFor(host, port, socketPath=None):
+    """Returns the process-wide `ConnectionPool` for `host:port` (or `socketPath`), creating it if needed."""
+    key = (host, port, socketPath)
+    pool = _pools.get(key)
+    if pool is None:
+        with _poolsLock:
+            pool = _pools.get(key)
+            if pool is None:
+                size = os.environ.get("FAILURE_FLAGS_POOL_SIZE", "")
+                pool = ConnectionPool(host, port, int(size) if size.isdigit() else DEFAULT_POOL_SIZE,
+                                      socketPath=socketPath)
+                _pools[key] = pool
+    return pool
+
+def urlopen(request, timeout=None):
+    """Opens `request` on a pooled keep-alive connection.
+
+    Supports `http://` and `http+unix://` URLs.
+    """
+    if request.type == "http+unix":
+        # urllib has already percent-decoded the socket path in request.host
+        return poolFor("localhost", None, request.host).urlopen(request, timeout=timeout)
+    if request.type != "http":
+        raise ValueError(f"unsupported sidecar URL scheme: {request.type}")
+    _, host, port, _ = address(request.full_url)
+    return poolFor(host, port).urlopen(request, timeout=timeout)
+
+def stats():
+    """Returns connection counters summed over every pool in this process.
+
+    `opened` counts new TCP connections, `reused` counts requests served on an already
+    open connection, and `discarded` counts connections closed instead of being pooled.
+    """
+    total = {"opened": 0, "reused": 0, "discarded": 0, "idle": 0}
+    for pool in list(_pools.values()):
+        for k, v in pool.stats().items():
+            total[k] += v
+    return total
+
+def _afterForkInChild():
+    global _poolsLock
+    _poolsLock = threading.Lock()
+    breaker._lock = threading.Lock()
+    for pool in _pools.values():
+        # drop (do not close) sockets inherited from the parent, the parent still owns them
+        pool._reset()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_afterForkInChild)
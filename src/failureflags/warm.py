@@ -0,0 +1,119 @@
+"""Declared flags that are prefetched at startup and kept warm.
+
+A service can declare the Failure Flags it uses with `failureflags.register()` or in a
+manifest file named by FAILURE_FLAGS_MANIFEST. The experiments of every declared flag
+are fetched in a single batch request on a background thread as soon as they are
+declared, stored in the experiment cache, and fetched again every `interval` seconds.
+The first `invoke()` of a declared flag then hits a populated cache instead of
+blocking on the sidecar.
+
+A manifest is a JSON list of flags, or an object with a `flags` list. Each flag is an
+object with a `name` and optional `labels`:
+
+    {"flags": [{"name": "http-ingress"}, {"name": "db", "labels": {"table": "users"}}]}
+"""
+import os
+import threading
+import weakref
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+def loadManifest(path):
+    """Returns the `(name, labels)` pairs declared in the manifest file at `path`."""
+    import json
+    with open(path, "rb") as f:
+        payload = json.loads(f.read())
+    if isinstance(payload, dict):
+        payload = payload.get("flags")
+    if not isinstance(payload, list):
+        raise ValueError("a flag manifest must be a list of flags")
+    declared = []
+    for flag in payload:
+        if not isinstance(flag, dict) or not isinstance(flag.get("name"), str):
+            raise ValueError(f"invalid flag in manifest: {flag}")
+        labels = flag.get("labels") or {}
+        if not isinstance(labels, dict):
+            raise ValueError(f"invalid labels in manifest: {labels}")
+        declared.append((flag["name"], labels))
+    return declared
+
+class Warmer:
+    """Warmer prefetches the experiments of declared flags on a background thread.
+
+    `fetchMany` is called with the list of declared flags right after flags are added
+    and then every `interval` seconds. Errors are logged and retried on the next round.
+    """
+
+    def __init__(self, fetchMany, interval):
+        self.fetchMany = fetchMany
+        self.interval = interval
+        self.flags = []
+        self.rounds = 0
+        self.failures = 0
+        self._generation = 0
+        self._keys = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._warm = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        _instances.add(self)
+
+    def add(self, flags, key):
+        """Declares `flags`, `key` is a function returning a flag's identity."""
+        with self._lock:
+            for ff in flags:
+                k = key(ff)
+                if k not in self._keys:
+                    self._keys.add(k)
+                    self.flags.append(ff)
+            self._generation += 1
+            self._warm.clear()
+            self._wake.set()
+            if self._thread is None and not self._stopped.is_set():
+                self._start()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name="failureflags-warm", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        pid = os.getpid()
+        while not self._stopped.is_set() and pid == os.getpid():
+            self._wake.clear()
+            with self._lock:
+                flags = list(self.flags)
+                generation = self._generation
+            try:
+                self.fetchMany(flags)
+            except Exception as err:
+                self.failures += 1
+                logger.debug("unable to prefetch experiments for declared flags: %s", err)
+            self.rounds += 1
+            with self._lock:
+                if generation == self._generation:
+                    self._warm.set()
+            self._wake.wait(self.interval)
+
+    def wait(self, timeout=None):
+        """Blocks until the declared flags were prefetched once. Returns False on timeout."""
+        return self._warm.wait(timeout)
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+_instances = weakref.WeakSet()
+
+def _afterForkInChild():
+    for warmer in list(_instances):
+        # the parent's thread does not exist in the child, each worker keeps its own cache warm
+        warmer._lock = threading.Lock()
+        warmer._thread = None
+        if warmer.flags and not warmer._stopped.is_set():
+            warmer._start()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_afterForkInChild)
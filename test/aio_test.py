@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+import failureflags
+from failureflags import aio
+from failureflags.testing import SidecarSimulator
+
+debug = logging.getLogger("failureflags")
+debug.addHandler(logging.StreamHandler())
+debug.setLevel(logging.DEBUG)
+
+def experiment(effect, rate=1):
+    return {"guid": "6884c0df-ed70-4bc8-84c0-dfed703bc8a7", "failureFlagName": "async",
+            "rate": rate, "selector": {}, "effect": effect}
+
+class TestAsyncio(unittest.TestCase):
+
+    def tearDown(self):
+        failureflags.breaker.reset()
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_afetchReusesConnections(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator([experiment({"latency": 10})]) as sidecar:
+            with patch('failureflags.SIDECAR_ENDPOINT', sidecar.endpoint):
+                async def run():
+                    flag = failureflags.FailureFlag("async", {"a": "1"}, timeout=1)
+                    results = [await flag.afetch() for _ in range(3)]
+                    return results, aio.poolFor().stats()
+                results, stats = asyncio.run(run())
+        assert all(len(r) == 1 for r in results)
+        assert stats["opened"] == 1 and stats["reused"] == 2, stats
+        path, body = sidecar.requests[0]
+        assert path == "/experiment"
+        assert body["name"] == "async"
+        assert body["labels"]["a"] == "1"
+
+    @patch('failureflags.time.sleep')
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_ainvokeLatencyDoesNotBlockTheLoop(self, mock_sleep):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator([experiment({"latency": 200})]) as sidecar:
+            with patch('failureflags.SIDECAR_ENDPOINT', sidecar.endpoint):
+                async def ticker(ticks):
+                    while True:
+                        await asyncio.sleep(0.01)
+                        ticks.append(1)
+
+                async def run():
+                    ticks = []
+                    task = asyncio.ensure_future(ticker(ticks))
+                    result = await failureflags.FailureFlag("async", {}, timeout=1).ainvoke()
+                    task.cancel()
+                    return result, len(ticks)
+                (active, impacted, experiments), ticks = asyncio.run(run())
+        mock_sleep.assert_not_called()
+        assert active and impacted
+        assert len(experiments) == 1
+        assert ticks >= 5, "other coroutines must keep running during injected latency"
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_ainvokeRaisesInjectedException(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator([experiment({"exception": "injected"})]) as sidecar:
+            with patch('failureflags.SIDECAR_ENDPOINT', sidecar.endpoint):
+                with self.assertRaises(ValueError) as ctx:
+                    asyncio.run(failureflags.FailureFlag("async", {}, timeout=1).ainvoke())
+        assert ctx.exception.args[0] == "injected"
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_ainvokeAwaitsCustomBehavior(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        evidence = MagicMock()
+        async def customBehavior(ff, experiments):
+            evidence(experiments)
+            return True
+        with SidecarSimulator([experiment({"custom": 1})]) as sidecar:
+            with patch('failureflags.SIDECAR_ENDPOINT', sidecar.endpoint):
+                result = asyncio.run(failureflags.FailureFlag(
+                    "async", {}, behavior=customBehavior, timeout=1).ainvoke())
+        assert result[0] and result[1]
+        evidence.assert_called_once()
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_ainvokeSwallowsSidecarErrors(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator() as sidecar:
+            endpoint = sidecar.endpoint
+        # the simulator is stopped, nothing is listening anymore
+        with patch('failureflags.SIDECAR_ENDPOINT', endpoint):
+            result = asyncio.run(failureflags.FailureFlag("async", {}, timeout=1).ainvoke())
+        assert result == (False, False, [])
+
+    @patch.dict(os.environ, clear=True)
+    def test_ainvokeInert(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        result = asyncio.run(failureflags.FailureFlag("async", {}).ainvoke())
+        assert result == (False, False, [])
+
+if __name__ == '__main__':
+    unittest.main()
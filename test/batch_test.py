@@ -0,0 +1,84 @@
+import logging
+import os
+import unittest
+from unittest.mock import patch
+
+import failureflags
+from failureflags.testing import SidecarSimulator
+
+debug = logging.getLogger("failureflags")
+debug.addHandler(logging.StreamHandler())
+debug.setLevel(logging.DEBUG)
+
+def experimentsByName(name, labels):
+    if name == "db":
+        return [{"guid": "1", "failureFlagName": "db", "rate": 1, "effect": {"latency": 10}}]
+    if name == "cache":
+        return {"guid": "2", "failureFlagName": "cache", "rate": 1, "effect": {"latency": 20}}
+    return []
+
+class TestFetchMany(unittest.TestCase):
+
+    def setUp(self):
+        failureflags._batchSupported = True
+
+    def tearDown(self):
+        failureflags._batchSupported = True
+        failureflags.disable_cache()
+
+    def flags(self):
+        return [failureflags.FailureFlag(name, {"route": "/a"}, timeout=1)
+                for name in ("db", "cache", "http")]
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_singleRoundTrip(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator(experimentsByName) as sidecar:
+            with patch('failureflags.SIDECAR_ENDPOINT', sidecar.endpoint):
+                results = failureflags.fetch_many(self.flags())
+        assert [len(r) for r in results] == [1, 1, 0]
+        assert results[0][0]["guid"] == "1"
+        assert results[1][0]["guid"] == "2"
+        assert len(sidecar.requests) == 1
+        path, body = sidecar.requests[0]
+        assert path == "/experiments"
+        assert [f["name"] for f in body["flags"]] == ["db", "cache", "http"]
+        assert body["flags"][0]["labels"]["route"] == "/a"
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_fallsBackToPerFlagFetch(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator(experimentsByName) as sidecar:
+            sidecar.batch = False
+            with patch('failureflags.SIDECAR_ENDPOINT', sidecar.endpoint):
+                results = failureflags.fetch_many(self.flags())
+                assert [len(r) for r in results] == [1, 1, 0]
+                assert len(sidecar.requests) == 4
+                failureflags.fetch_many(self.flags())
+        assert len(sidecar.requests) == 7, "an unsupported batch endpoint should only be probed once"
+        assert [path for path, _ in sidecar.requests].count("/experiments") == 1
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_populatesCache(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        failureflags.enable_cache(ttl=60)
+        with SidecarSimulator(experimentsByName) as sidecar:
+            with patch('failureflags.SIDECAR_ENDPOINT', sidecar.endpoint):
+                failureflags.fetch_many(self.flags())
+        with patch('failureflags.urlopen') as mock_urlopen, patch('failureflags.time.sleep') as mock_sleep:
+            active, impacted, _ = self.flags()[0].invoke()
+        assert active and impacted
+        mock_sleep.assert_called_with(0.01)
+        mock_urlopen.assert_not_called()
+
+    @patch.dict(os.environ, clear=True)
+    def test_inert(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        assert failureflags.fetch_many(self.flags()) == [[], [], []]
+
+if __name__ == '__main__':
+    unittest.main()
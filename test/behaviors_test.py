@@ -1,4 +1,5 @@
 import logging
+import os
 
 import failureflags
 import unittest
@@ -218,6 +219,72 @@ class TestFailureFlagsBehaviors(unittest.TestCase):
             return
         assert False, "An exception must be raised if the experiment provides a valid exception clause"
 
+    ##################################################
+    # Testing the data behavior
+    ##################################################
+
+    def test_dataNoDataEffect(self):
+        flag = failureflags.FailureFlag("name", {}, data={"status": 200})
+        impacted = failureflags.data(flag, [{"guid": "1", "rate": 1, "effect": {"latency": 10}}])
+        assert impacted == False
+        assert flag.data == {"status": 200}
+
+    def test_dataPatchesAreCopyOnWrite(self):
+        body = {"items": [1, 2, 3], "meta": {"page": 1}}
+        headers = {"etag": "abc", "server": "app"}
+        original = {"status": 200, "body": body, "headers": headers}
+        flag = failureflags.FailureFlag("name", {}, data=original, debug=True)
+        impacted = failureflags.data(flag, [{
+            "guid": "1",
+            "rate": 1,
+            "effect": {
+                "data": [
+                    {"op": "replace", "path": "/status", "value": 503},
+                    {"op": "merge", "path": "/body", "value": {"error": "injected", "items": None}},
+                    {"op": "delete", "path": "headers"},
+                ]
+            }}])
+        assert impacted == True
+        assert flag.data == {"status": 503, "body": {"meta": {"page": 1}, "error": "injected"}}
+        assert original == {"status": 200, "body": body, "headers": headers}, "the caller's data must not be mutated"
+        assert body == {"items": [1, 2, 3], "meta": {"page": 1}}
+        assert flag.data["body"]["meta"] is body["meta"], "untouched paths must be shared, not copied"
+
+    def test_dataShorthandMergesIntoRoot(self):
+        flag = failureflags.FailureFlag("name", {}, data={"status": 200, "body": "ok"})
+        impacted = failureflags.data(flag, [{"guid": "1", "rate": 1, "effect": {"data": {"status": 500}}}])
+        assert impacted == True
+        assert flag.data == {"status": 500, "body": "ok"}
+
+    def test_dataUnmatchedPathIsSkipped(self):
+        flag = failureflags.FailureFlag("name", {}, data={"status": 200})
+        impacted = failureflags.data(flag, [{"guid": "1", "rate": 1, "effect": {
+            "data": [{"op": "replace", "path": "/body/status", "value": 1}]}}])
+        assert impacted == False
+        assert flag.data == {"status": 200}
+
+    @patch('failureflags.FailureFlag.fetch')
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_dataIsPatchedAfreshOnEveryInvoke(self, mock_fetch):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        mock_fetch.return_value = [{"guid": "1", "rate": 1, "effect": {
+            "data": [{"op": "replace", "path": "/items/-", "value": "injected"}]}}]
+        original = {"items": [1]}
+        flag = failureflags.FailureFlag("name", {}, data=original)
+        for _ in range(3):
+            assert flag.invoke()[1] is True
+            assert flag.data == {"items": [1, "injected"]}
+        assert original == {"items": [1]}
+        # without experiments the caller's data is left as it was passed
+        mock_fetch.return_value = []
+        flag.invoke()
+        assert flag.data is original
+        flag.data = {"items": []}
+        mock_fetch.return_value = [{"guid": "1", "rate": 1, "effect": {"data": {"status": 503}}}]
+        flag.invoke()
+        assert flag.data == {"items": [], "status": 503}
+
     ##################################################
     # Testing the delayedDataOrError behavior
     ##################################################
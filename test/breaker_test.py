@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+import failureflags
+from failureflags.transport import CircuitBreaker, breaker
+from failureflags.testing import SidecarSimulator
+
+debug = logging.getLogger("failureflags")
+debug.addHandler(logging.StreamHandler())
+debug.setLevel(logging.DEBUG)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch('failureflags.breaker.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_tripsAfterThreshold(self):
+        cb = CircuitBreaker(threshold=3, backoff=1)
+        for _ in range(2):
+            assert cb.allow()
+            cb.failure()
+        assert cb.state == "closed"
+        cb.failure()
+        assert cb.state == "open"
+        assert not cb.allow()
+        assert cb.stats()["trips"] == 1
+        assert cb.stats()["shortCircuits"] == 1
+
+    def test_successResetsConsecutiveFailures(self):
+        cb = CircuitBreaker(threshold=2)
+        cb.failure()
+        cb.success()
+        cb.failure()
+        assert cb.state == "closed"
+
+    def test_singleProbeAfterBackoff(self):
+        cb = CircuitBreaker(threshold=1, backoff=1)
+        cb.failure()
+        self.clock.now += 1
+        assert cb.allow(), "the first caller after the backoff should probe"
+        assert not cb.allow(), "only one probe may be in flight"
+        cb.success()
+        assert cb.state == "closed"
+        assert cb.allow()
+
+    def test_failedProbeDoublesBackoff(self):
+        cb = CircuitBreaker(threshold=1, backoff=1, maxBackoff=3)
+        cb.failure()
+        self.clock.now += 1
+        assert cb.allow()
+        cb.failure()
+        assert cb.state == "open"
+        self.clock.now += 1
+        assert not cb.allow()
+        self.clock.now += 1
+        assert cb.allow()
+        cb.failure()
+        self.clock.now += 3
+        assert cb.allow(), "backoff is capped at maxBackoff"
+        assert cb.stats()["trips"] == 3
+
+    def test_lostProbeIsReplaced(self):
+        cb = CircuitBreaker(threshold=1, backoff=1)
+        cb.failure()
+        self.clock.now += 1
+        assert cb.allow()
+        # the probe never reports back
+        self.clock.now += .5
+        assert not cb.allow()
+        self.clock.now += .5
+        assert cb.allow(), "another probe is let through after the backoff"
+        cb.success()
+        assert cb.state == "closed"
+
+class TestFetchWithBreaker(unittest.TestCase):
+
+    def setUp(self):
+        breaker.reset()
+
+    def tearDown(self):
+        breaker.reset()
+        breaker.backoff = breaker._currentBackoff = 1
+        failureflags._batchSupported = True
+
+    @patch('failureflags.urlopen')
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_openBreakerShortCircuitsInvoke(self, mock_urlopen):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        mock_urlopen.side_effect = ConnectionRefusedError("sidecar is not running")
+        flag = failureflags.FailureFlag("down", {})
+        for _ in range(breaker.threshold):
+            assert flag.invoke() == (False, False, [])
+        assert mock_urlopen.call_count == breaker.threshold
+        assert failureflags.breaker_stats()["state"] == "open"
+
+        for _ in range(100):
+            assert flag.invoke() == (False, False, [])
+        assert mock_urlopen.call_count == breaker.threshold, "an open breaker must not contact the sidecar"
+        assert failureflags.breaker_stats()["shortCircuits"] == 100
+
+    def tripped(self, sidecar):
+        breaker.backoff = breaker._currentBackoff = .05
+        sidecar.program(drop=True)
+        flag = failureflags.FailureFlag("probe", {}, timeout=1, endpoint=sidecar.endpoint)
+        for _ in range(breaker.threshold):
+            with self.assertRaises(Exception):
+                flag.fetch()
+        assert breaker.state == "open"
+        sidecar.reset()
+        time.sleep(.05)
+        return flag
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_fetchManyFallbackClosesBreaker(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator([{"guid": "1"}]) as sidecar:
+            sidecar.batch = False
+            flag = self.tripped(sidecar)
+            failureflags._batchSupported = False
+            assert failureflags.fetch_many([flag]) == [[{"guid": "1"}]]
+            assert breaker.state == "closed"
+            assert flag.fetch() == [{"guid": "1"}]
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_cancelledProbeReopensBreaker(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator([{"guid": "1"}]) as sidecar:
+            flag = self.tripped(sidecar)
+            sidecar.program(latency=.5)
+            async def probe():
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncio.wait_for(flag.afetch(), .01)
+            asyncio.run(probe())
+            assert breaker.state == "open"
+            sidecar.reset()
+            time.sleep(.1)
+            assert flag.fetch() == [{"guid": "1"}]
+            assert breaker.state == "closed"
+
+if __name__ == '__main__':
+    unittest.main()
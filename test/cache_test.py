@@ -0,0 +1,169 @@
+import logging
+import os
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+
+import failureflags
+from failureflags.cache import ExperimentCache, SamplingGate, cacheKey
+from failureflags.plan import compileExperiments
+from failureflags.testing import SidecarSimulator
+
+debug = logging.getLogger("failureflags")
+debug.addHandler(logging.StreamHandler())
+debug.setLevel(logging.DEBUG)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestExperimentCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch('failureflags.cache.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hitsAndMisses(self):
+        cache = ExperimentCache(ttl=10)
+        fetcher = MagicMock(return_value=[{"guid": "1"}])
+        assert cache.get("k", fetcher) == [{"guid": "1"}]
+        assert cache.get("k", fetcher) == [{"guid": "1"}]
+        assert fetcher.call_count == 1
+        stats = cache.stats()
+        assert stats["hits"] == 1 and stats["misses"] == 1, stats
+
+    def test_staleWhileRevalidate(self):
+        cache = ExperimentCache(ttl=10)
+        cache.get("k", MagicMock(return_value=["old"]))
+        self.clock.now += 11
+        refreshed = threading.Event()
+        def fetcher():
+            refreshed.set()
+            return ["new"]
+        assert cache.get("k", fetcher) == ["old"], "stale value must be served while refreshing"
+        assert refreshed.wait(1)
+        for _ in range(100):
+            if cache.get("k", fetcher) == ["new"]:
+                break
+            threading.Event().wait(0.01)
+        assert cache.get("k", fetcher) == ["new"]
+        assert cache.stats()["refreshes"] == 1
+
+    def test_failedRefreshDropsEntry(self):
+        cache = ExperimentCache(ttl=10)
+        cache.get("k", MagicMock(return_value=["old"]))
+        self.clock.now += 11
+        failing = MagicMock(side_effect=Exception("sidecar down"))
+        assert cache.get("k", failing) == ["old"]
+        for _ in range(100):
+            if len(cache) == 0:
+                break
+            threading.Event().wait(0.01)
+        assert len(cache) == 0, "a failed refresh must not keep serving old experiments"
+
+    def test_noRefreshFetchesSynchronously(self):
+        cache = ExperimentCache(ttl=10, refresh=False)
+        cache.get("k", MagicMock(return_value=["old"]))
+        self.clock.now += 11
+        assert cache.get("k", MagicMock(return_value=["new"])) == ["new"]
+        assert cache.stats()["misses"] == 2
+
+    def test_lruEviction(self):
+        cache = ExperimentCache(ttl=10, maxsize=2)
+        cache.get("a", MagicMock(return_value=["a"]))
+        cache.get("b", MagicMock(return_value=["b"]))
+        cache.get("a", MagicMock())
+        cache.get("c", MagicMock(return_value=["c"]))
+        fetcher = MagicMock(return_value=["b2"])
+        assert cache.get("a", MagicMock()) == ["a"]
+        assert cache.get("b", fetcher) == ["b2"], "least recently used entry should have been evicted"
+        assert cache.stats()["evictions"] == 2
+
+    def test_cacheKeyIgnoresLabelOrder(self):
+        assert cacheKey("n", {"a": "1", "b": "2"}) == cacheKey("n", {"b": "2", "a": "1"})
+        assert cacheKey("n", {"a": "1"}) != cacheKey("m", {"a": "1"})
+
+class TestInvokeWithCache(unittest.TestCase):
+
+    def tearDown(self):
+        failureflags.disable_cache()
+
+    @patch('failureflags.urlopen')
+    @patch('failureflags.time.sleep')
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_invokeUsesCache(self, mock_sleep, mock_urlopen):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        response_bytes = b'[{"guid": "1", "rate": 1, "effect": {"latency": 10}}]'
+        url_cm = MagicMock()
+        url_cm.status = 200
+        url_cm.read = MagicMock(return_value=response_bytes)
+        url_cm.headers.get = MagicMock(side_effect=lambda key, default=None: {
+            "Content-Type": "application/json",
+            "Content-Length": str(len(response_bytes))
+        }.get(key, default))
+        url_cm.__enter__.return_value = url_cm
+        mock_urlopen.return_value = url_cm
+
+        failureflags.enable_cache(ttl=60)
+        for _ in range(3):
+            active, impacted, experiments = failureflags.FailureFlag("cached", {"a": "1"}).invoke()
+            assert active and impacted
+            assert len(experiments) == 1
+        assert mock_urlopen.call_count == 1
+        stats = failureflags.cache_stats()
+        assert stats["misses"] == 1 and stats["hits"] == 2, stats
+
+class TestSamplingGate(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch('failureflags.cache.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        failureflags.breaker.reset()
+
+    def tearDown(self):
+        failureflags.disable_sampling_gate()
+
+    def test_admit(self):
+        gate = SamplingGate(ttl=10)
+        assert gate.admit("k", .9) is None, "unknown flags must be fetched"
+        gate.put("k", compileExperiments([{"guid": "1", "rate": .25}, {"guid": "2", "rate": .5}]))
+        assert gate.admit("k", .4) is None
+        assert len(gate.admit("k", .5)) == 2
+        self.clock.now += 10
+        assert gate.admit("k", .9) is None, "expired experiments must be fetched again"
+        assert gate.stats()["skipped"] == 1
+
+    @patch('failureflags.time.sleep')
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_invokeSkipsFetchesThatCannotImpact(self, mock_sleep):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        experiments = [{"guid": "1", "rate": .1, "effect": {"latency": 10}}]
+        failureflags.enable_sampling_gate(ttl=10)
+        with SidecarSimulator(experiments) as sidecar:
+            flag = failureflags.FailureFlag("sampled", {}, timeout=1, endpoint=sidecar.endpoint)
+            with patch('failureflags.random', side_effect=[.5, .5, .5, .05]):
+                assert flag.invoke() == (True, False, experiments)
+                assert len(sidecar.requests) == 1
+                # known experiments, the dice cannot beat their rate
+                assert flag.invoke() == (True, False, experiments)
+                assert flag.invoke() == (True, False, experiments)
+                assert len(sidecar.requests) == 1
+                # a roll below the rate revalidates with the sidecar and applies the same roll
+                sidecar.experiments = experiments + [{"guid": "2", "rate": .01}]
+                active, impacted, fetched = flag.invoke()
+                assert active and impacted and len(fetched) == 2
+                assert len(sidecar.requests) == 2
+        mock_sleep.assert_called_once_with(.01)
+        assert failureflags.sampling_gate_stats()["skipped"] == 2
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import importlib
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+import failureflags
+from failureflags import codec
+
+def sidecarResponse(body, contentType="application/json"):
+    url_cm = MagicMock()
+    url_cm.status = 200
+    url_cm.read = MagicMock(return_value=body)
+    url_cm.headers = {"Content-Type": contentType, "Content-Length": str(len(body))}
+    url_cm.__enter__.return_value = url_cm
+    return url_cm
+
+class TestCodec(unittest.TestCase):
+
+    def test_jsonRoundTrip(self):
+        body = codec.jsonCodec.encode({"name": "x", "labels": {"a": "b", 1: "c"}})
+        assert isinstance(body, bytes)
+        assert codec.jsonCodec.decode(b' {"a": [1, "\xc3\xa9"]}\n') == {"a": [1, "é"]}
+        assert codec.jsonCodec.decode(body)["labels"] == {"a": "b", "1": "c"}
+
+    def test_standardLibraryFallback(self):
+        with patch.dict(sys.modules, {"orjson": None, "msgpack": None}):
+            fallback = importlib.reload(codec)
+            try:
+                assert fallback.orjson is None and fallback.ACCEPT == "application/json"
+                assert fallback.jsonCodec.decode(fallback.jsonCodec.encode({"a": [1]})) == {"a": [1]}
+                assert fallback.decoderFor("application/msgpack") is None
+            finally:
+                importlib.reload(codec)
+
+    @patch('failureflags.urlopen')
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_requestBodyIsReused(self, mock_urlopen):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        mock_urlopen.return_value = sidecarResponse(b"[]")
+        flag = failureflags.FailureFlag("codec", {"a": "1"})
+        flag.fetch()
+        flag.fetch()
+        first, second = (c.args[0] for c in mock_urlopen.call_args_list)
+        assert first.data is second.data
+        assert first.get_header("Accept") == codec.ACCEPT
+        assert codec.jsonCodec.decode(first.data)["labels"]["a"] == "1"
+
+        flag.labels["a"] = "2"
+        flag.fetch()
+        assert codec.jsonCodec.decode(mock_urlopen.call_args.args[0].data)["labels"]["a"] == "2"
+
+        # mutable label values are encoded on every call
+        flag.labels["a"] = ["x"]
+        flag.fetch()
+        flag.labels["a"].append("y")
+        flag.fetch()
+        assert codec.jsonCodec.decode(mock_urlopen.call_args.args[0].data)["labels"]["a"] == ["x", "y"]
+
+    @patch('failureflags.urlopen')
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_negotiatedEncodingIsDecoded(self, mock_urlopen):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        binary = codec.Codec("application/x-test", None, lambda body: [{"guid": body.decode("ascii")}])
+        mock_urlopen.return_value = sidecarResponse(b"binary", "application/x-test")
+        flag = failureflags.FailureFlag("codec", {})
+        assert flag.fetch() == []
+        with patch.dict(codec._decoders, {"application/x-test": binary}):
+            assert flag.fetch() == [{"guid": "binary"}]
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 import logging
 
+import failureflags
 from failureflags import FailureFlag
 import urllib.request
 import os
@@ -17,6 +18,8 @@ class TestInvoke(unittest.TestCase):
     @patch('failureflags.time.sleep')
     @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
     def test_e2eEnabledWithLatency(self, mock_sleep, mock_urlopen):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
         response_bytes = b"""[{
             "guid": "6884c0df-ed70-4bc8-84c0-dfed703bc8a7",
             "failureFlagName": "targetLatencyNumber",
@@ -15,6 +15,8 @@ class TestFetch(unittest.TestCase):
     @patch('failureflags.urlopen')
     @patch.dict(os.environ, clear=True)
     def test_inert(self, mock_urlopen):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
         url_cm = MagicMock()
         url_cm.status = 200
         url_cm.read = MagicMock(side_effect=Exception("should not be used"), return_value="[{}]")
@@ -32,6 +34,8 @@ class TestFetch(unittest.TestCase):
     @patch('failureflags.urlopen')
     @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
     def test_fetchWrapsSingleExperimentWithList(self, mock_urlopen):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
         url_cm = MagicMock()
         url_cm.status = 200
         url_cm.read = MagicMock(return_value=b"{}")  # Return bytes instead of a string
@@ -56,6 +60,8 @@ class TestFetch(unittest.TestCase):
     @patch('failureflags.urlopen')
     @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
     def test_fetchHandlesNon200CodeSilently(self, mock_urlopen):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
         url_cm = MagicMock()
         url_cm.status = 400
         url_cm.read = MagicMock(return_value="[{}]")
@@ -76,6 +82,8 @@ class TestFetch(unittest.TestCase):
     @patch('failureflags.urlopen')
     @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
     def test_fetchHandlesEmptyBody(self, mock_urlopen):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
         url_cm = MagicMock()
         url_cm.status = 200
         url_cm.read = MagicMock(return_value="")
@@ -94,6 +102,8 @@ class TestFetch(unittest.TestCase):
     @patch('failureflags.urlopen')
     @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
     def test_fetchHandlesInvalidContentType(self, mock_urlopen):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
         url_cm = MagicMock()
         url_cm.status = 200
         url_cm.read = MagicMock(side_effect=Exception("read() should not be called"))  # Raise exception if called
@@ -112,6 +122,8 @@ class TestFetch(unittest.TestCase):
     @patch('failureflags.urlopen')
     @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
     def test_fetchHandlesInvalidContentLength(self, mock_urlopen):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
         url_cm = MagicMock()
         url_cm.status = 200
         url_cm.read = MagicMock(return_value="[{}]")
@@ -0,0 +1,112 @@
+import logging
+import os
+import unittest
+from unittest.mock import patch
+
+import failureflags
+from failureflags.hooks import Hooks, HistogramHooks, Histogram, errorCause
+from failureflags.testing import SidecarSimulator
+
+debug = logging.getLogger("failureflags")
+debug.addHandler(logging.StreamHandler())
+debug.setLevel(logging.DEBUG)
+
+class RecordingHooks(Hooks):
+
+    def __init__(self):
+        self.events = []
+
+    def fetchStarted(self, flag):
+        self.events.append(("fetchStarted", flag.name))
+
+    def fetchFinished(self, flag, duration, status):
+        assert duration >= 0
+        self.events.append(("fetchFinished", flag.name, status))
+
+    def fetchFailed(self, flag, duration, cause):
+        self.events.append(("fetchFailed", flag.name, cause))
+
+    def experimentsReturned(self, flag, experiments, source):
+        self.events.append(("experimentsReturned", flag.name, len(experiments), source))
+
+    def diceRolled(self, flag, dice, impacting):
+        self.events.append(("diceRolled", flag.name, len(impacting)))
+
+    def effectApplied(self, flag, effect, duration):
+        self.events.append(("effectApplied", flag.name, effect, duration))
+
+class TestHooks(unittest.TestCase):
+
+    def setUp(self):
+        failureflags.breaker.reset()
+
+    def tearDown(self):
+        failureflags.set_hooks(None)
+        failureflags.breaker.reset()
+
+    @patch('failureflags.time.sleep')
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_invokeEmitsEvents(self, mock_sleep):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        hooks = failureflags.set_hooks(RecordingHooks())
+        experiments = [{"guid": "1", "rate": 1, "effect": {"latency": 25}}]
+        with SidecarSimulator(experiments) as sidecar:
+            failureflags.FailureFlag("hooked", {}, timeout=1, endpoint=sidecar.endpoint).invoke()
+        assert hooks.events == [
+            ("fetchStarted", "hooked"),
+            ("fetchFinished", "hooked", 200),
+            ("experimentsReturned", "hooked", 1, "fetch"),
+            ("diceRolled", "hooked", 1),
+            ("effectApplied", "hooked", "latency", .025),
+        ]
+
+    @patch('failureflags.urlopen')
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_swallowedErrorsAreReported(self, mock_urlopen):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        hooks = failureflags.set_hooks(RecordingHooks())
+        mock_urlopen.side_effect = ConnectionRefusedError("sidecar is not running")
+        flag = failureflags.FailureFlag("down", {})
+        for _ in range(failureflags.breaker.threshold + 1):
+            assert flag.invoke() == (False, False, [])
+        failures = [e for e in hooks.events if e[0] == "fetchFailed"]
+        assert failures[0] == ("fetchFailed", "down", "refused")
+        assert failures[-1] == ("fetchFailed", "down", "circuit-open")
+
+    def test_errorCause(self):
+        assert errorCause(TimeoutError()) == "timeout"
+        assert errorCause(ConnectionResetError()) == "connection"
+        assert errorCause(ValueError("bad json")) == "decode"
+        assert errorCause(KeyError("x")) == "KeyError"
+
+class TestHistogramHooks(unittest.TestCase):
+
+    def test_histogramBuckets(self):
+        histogram = Histogram((.1, 1))
+        for value in (.05, .1, .5, 3):
+            histogram.observe(value)
+        assert histogram.cumulative() == [(.1, 2), (1, 3), ("+Inf", 4)]
+        assert histogram.count == 4
+
+    def test_exposition(self):
+        hooks = HistogramHooks(buckets=(.01, .1))
+        flag = failureflags.FailureFlag("db", {})
+        hooks.fetchFinished(flag, .002, 200)
+        hooks.fetchFinished(flag, .05, 200)
+        hooks.fetchFailed(flag, .001, "timeout")
+        hooks.experimentsReturned(flag, [{}, {}], "cache")
+        hooks.diceRolled(flag, .3, [{}])
+        hooks.effectApplied(flag, "latency", .5)
+        text = hooks.exposition()
+        assert 'failureflags_fetch_errors_total{flag="db",cause="timeout"} 1' in text
+        assert 'failureflags_experiments_total{flag="db",source="cache"} 2' in text
+        assert 'failureflags_impacted_total{flag="db"} 1' in text
+        assert 'failureflags_fetch_duration_seconds_bucket{flag="db",status="200",le="0.01"} 1' in text
+        assert 'failureflags_fetch_duration_seconds_bucket{flag="db",status="200",le="+Inf"} 2' in text
+        assert 'failureflags_fetch_duration_seconds_count{flag="db",status="200"} 2' in text
+        assert 'failureflags_effect_duration_seconds_sum{flag="db",effect="latency"} 0.5' in text
+
+if __name__ == '__main__':
+    unittest.main()
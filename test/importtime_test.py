@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import failureflags
+
+# What an inert `import failureflags` may cost on top of `logging`, as a multiple of what
+# `logging` costs in the same `python -X importtime` run. Relative to `logging` the budget
+# holds on fast and slow machines alike. Override with FAILURE_FLAGS_IMPORT_BUDGET.
+IMPORT_BUDGET = float(os.environ.get("FAILURE_FLAGS_IMPORT_BUDGET", 2))
+
+# Modules an inert import must not load, they are imported on the first enabled fetch
+DEFERRED = ("urllib.request", "http.client", "email", "ssl", "json", "orjson", "socket",
+            "failureflags.transport", "failureflags.codec", "failureflags.subscription")
+
+def python(code, **env):
+    environ = {k: v for k, v in os.environ.items() if not k.startswith("FAILURE_FLAGS_") and k != "PYTHONDONTWRITEBYTECODE"}
+    environ.update(env)
+    return subprocess.run([sys.executable, *code], env=environ, capture_output=True, text=True, check=True)
+
+class TestImportTime(unittest.TestCase):
+
+    def test_inertImportDefersTransport(self):
+        loaded = python(["-c", "import sys, failureflags; print(' '.join(sys.modules))"]).stdout.split()
+        assert [name for name in DEFERRED if name in loaded] == []
+
+    def test_enabledInvokeLoadsTransport(self):
+        code = ("import sys, failureflags; failureflags.FailureFlag('x', {}).invoke(); "
+                "print('urllib.request' in sys.modules, 'failureflags.codec' in sys.modules)")
+        assert python(["-c", code]).stdout.split() == ["False", "False"]
+        assert python(["-c", code], FAILURE_FLAGS_ENABLED="1", FAILURE_FLAGS_ENDPOINT="http://127.0.0.1:9").stdout.split() == ["True", "True"]
+
+    def test_lazyNamesResolve(self):
+        assert failureflags.urlopen is failureflags.transport.urlopen
+        assert failureflags.codec.jsonCodec is not None
+        with self.assertRaises(AttributeError):
+            failureflags.missing
+
+    def test_importTimeBudget(self):
+        # the first run writes bytecode, the run with the lowest ratio is measured
+        python(["-c", "import failureflags"])
+        ratios = []
+        for _ in range(5):
+            stderr = python(["-X", "importtime", "-c", "import failureflags"]).stderr
+            cumulative = {}
+            for line in stderr.splitlines()[1:]:
+                _, total, name = line.split("|")
+                cumulative[name.strip()] = int(total)
+            logging = cumulative["logging"]
+            ratios.append((cumulative["failureflags"] - logging) / logging)
+        assert min(ratios) <= IMPORT_BUDGET, f"import failureflags took {min(ratios):.1f}x the time of logging on top of it, budget {IMPORT_BUDGET}x"
+
+if __name__ == '__main__':
+    unittest.main()
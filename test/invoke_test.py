@@ -16,6 +16,8 @@ class TestInvoke(unittest.TestCase):
     @patch('failureflags.time.sleep')
     @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
     def test_e2eEnabledWithLatency(self, mock_sleep, mock_urlopen):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
         response_bytes = b"""[{
             "guid": "6884c0df-ed70-4bc8-84c0-dfed703bc8a7",
             "failureFlagName": "targetLatencyNumber",
@@ -56,6 +58,8 @@ class TestInvoke(unittest.TestCase):
     @patch('failureflags.time.sleep')
     @patch.dict(os.environ, clear=True)
     def test_e2eInert(self, mock_sleep, mock_urlopen):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
         url_cm = MagicMock()
         url_cm.status = 200
         url_cm.read = MagicMock(return_value="""[{
@@ -88,6 +92,8 @@ class TestInvoke(unittest.TestCase):
     @patch('failureflags.time.sleep')
     @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
     def test_customBehaviorWithDelegateToDefault(self, mock_sleep, mock_urlopen):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
         response_bytes = b"""[{
             "guid": "6884c0df-ed70-4bc8-84c0-dfed703bc8a7",
             "failureFlagName": "works",
@@ -0,0 +1,98 @@
+import asyncio
+import os
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import failureflags
+from failureflags.hooks import HistogramHooks
+from failureflags.limits import LatencyLimiter, deadline, remaining
+
+def latencyExperiment(ms):
+    return [{"guid": "1", "rate": 1, "effect": {"latency": ms}}]
+
+class TestLatencyLimits(unittest.TestCase):
+
+    def tearDown(self):
+        failureflags.disable_latency_limits()
+        failureflags.set_hooks(None)
+
+    def test_concurrency(self):
+        limiter = LatencyLimiter(concurrency=2)
+        assert limiter.admit(1) is None and limiter.admit(1) is None
+        assert limiter.admit(1) == "concurrency"
+        limiter.release()
+        assert limiter.admit(1) is None
+        assert limiter.stats()["skipped"]["concurrency"] == 1 and limiter.stats()["sleeping"] == 2
+
+    def test_budget(self):
+        limiter = LatencyLimiter(budget=1)
+        assert limiter.admit(.6) is None
+        limiter.release()
+        assert limiter.admit(.6) == "budget"
+        with patch("failureflags.limits.time.monotonic", return_value=time.monotonic() + .5):
+            assert limiter.admit(.6) is None
+        assert limiter.stats()["injected"] == 1.2
+
+    def test_deadline(self):
+        assert remaining() is None
+        with deadline(10):
+            assert 9 < remaining() <= 10
+            with deadline(20):
+                assert remaining() <= 10
+            with deadline(1):
+                assert remaining() <= 1
+        assert remaining() is None
+
+    @patch('failureflags.time.sleep')
+    def test_concurrentSleepersAreCapped(self, mock_sleep):
+        limiter = failureflags.enable_latency_limits(concurrency=1)
+        hooks = failureflags.set_hooks(HistogramHooks())
+        flag = failureflags.FailureFlag("limited", {})
+        sleeping = threading.Event()
+        proceed = threading.Event()
+        def sleep(seconds):
+            sleeping.set()
+            proceed.wait(5)
+        mock_sleep.side_effect = sleep
+        first = threading.Thread(target=failureflags.latency, args=(flag, latencyExperiment(5000)))
+        first.start()
+        assert sleeping.wait(5)
+        assert failureflags.latency(flag, latencyExperiment(5000)) is False
+        proceed.set()
+        first.join()
+        assert failureflags.latency_limit_stats() == {"sleeping": 0, "admitted": 1, "injected": 5.0, "clipped": 0,
+                                                      "skipped": {"concurrency": 1, "budget": 0, "deadline": 0}}
+        assert 'failureflags_effect_skipped_total{flag="limited",effect="latency",reason="concurrency"} 1' in hooks.exposition()
+        assert limiter.sleeping == 0
+
+    @patch('failureflags.time.sleep')
+    def test_deadlineClipsAndSkips(self, mock_sleep):
+        limiter = failureflags.enable_latency_limits()
+        flag = failureflags.FailureFlag("deadline", {})
+        with failureflags.latency_deadline(.5):
+            assert failureflags.latency(flag, latencyExperiment(2000))
+        assert 0 < mock_sleep.call_args.args[0] <= .5
+        mock_sleep.reset_mock()
+        with failureflags.latency_deadline(-1):
+            assert failureflags.latency(flag, latencyExperiment(2000)) is False
+        mock_sleep.assert_not_called()
+        assert limiter.stats()["clipped"] == 1 and limiter.stats()["skipped"]["deadline"] == 1
+
+    def test_alatencyHonorsLimits(self):
+        failureflags.enable_latency_limits(budget=.01)
+        flag = failureflags.FailureFlag("async", {})
+        async def run():
+            return await failureflags.alatency(flag, latencyExperiment(5)), await failureflags.alatency(flag, latencyExperiment(10))
+        assert asyncio.run(run()) == (True, False)
+        assert failureflags.latency_limit_stats()["skipped"]["budget"] == 1
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_LATENCY_CONCURRENCY": "4", "FAILURE_FLAGS_LATENCY_BUDGET": "nope"})
+    def test_fromEnvironment(self):
+        from failureflags.limits import fromEnvironment
+        limiter = fromEnvironment()
+        assert limiter.concurrency == 4 and limiter.budget is None
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import failureflags
+from failureflags.local import FileLoader, LocalExperiments, definitions
+from failureflags.testing import SidecarSimulator
+
+debug = logging.getLogger("failureflags")
+debug.addHandler(logging.StreamHandler())
+debug.setLevel(logging.DEBUG)
+
+DEFINITIONS = [
+    {"guid": "1", "failureFlagName": "db", "rate": 1, "selector": {"table": ["users", "orders"]},
+     "effect": {"latency": 10}},
+    {"failureFlagName": "http", "rate": 1, "selector": {}, "effect": {"exception": "boom"}},
+]
+
+class TestLocalMode(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "experiments.json")
+        with open(self.path, "w") as f:
+            json.dump({"experiments": DEFINITIONS}, f)
+
+    def tearDown(self):
+        failureflags.disable_local_mode()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_definitions(self):
+        experiments = definitions(DEFINITIONS)
+        assert [e["guid"] for e in experiments] == ["1", "local-1"]
+        assert "guid" not in DEFINITIONS[1]
+        with self.assertRaises(ValueError):
+            definitions({"experiments": "nope"})
+
+    @patch('failureflags.urlopen')
+    @patch('failureflags.time.sleep')
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_invokeAndFetchFromFile(self, mock_sleep, mock_urlopen):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        failureflags.enable_local_mode(path=self.path, refresh=None)
+        active, impacted, experiments = failureflags.FailureFlag("db", {"table": "users"}).invoke()
+        assert active and impacted and experiments[0]["guid"] == "1"
+        assert failureflags.FailureFlag("db", {"table": "sessions"}).fetch() == []
+        with self.assertRaises(ValueError):
+            failureflags.FailureFlag("http", {"route": "/"}).invoke()
+        assert failureflags.fetch_many([failureflags.FailureFlag("db", {"table": "orders"})])[0][0]["guid"] == "1"
+        mock_urlopen.assert_not_called()
+        mock_sleep.assert_called_once_with(.01)
+
+    def test_reloadsChangedFile(self):
+        local = LocalExperiments(FileLoader(self.path), refresh=0)
+        assert local.load()
+        assert len(local.table) == 2
+        with open(self.path, "w") as f:
+            json.dump(DEFINITIONS[:1], f)
+        deadline = time.monotonic() + 2
+        while len(local.table) != 1 and time.monotonic() < deadline:
+            local.ready
+            time.sleep(0.01)
+        assert len(local.table) == 1
+
+    def test_failedLoadClearsTable(self):
+        local = LocalExperiments(FileLoader(self.path), refresh=None)
+        assert local.load()
+        os.unlink(self.path)
+        assert not local.load()
+        assert not local.ready and len(local.table) == 0
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_loadsFromSidecar(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator(definitions(DEFINITIONS)) as sidecar:
+            with patch('failureflags.SIDECAR_ENDPOINT', sidecar.endpoint):
+                local = failureflags.enable_local_mode(refresh=None)
+            assert local.ready
+            for _ in range(3):
+                assert failureflags.FailureFlag("db", {"table": "orders"}).fetch()[0]["guid"] == "1"
+        assert [path for path, _ in sidecar.requests] == ["/experiments"]
+
+if __name__ == '__main__':
+    unittest.main()
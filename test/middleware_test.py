@@ -0,0 +1,104 @@
+import asyncio
+import os
+import unittest
+from unittest.mock import patch
+
+import failureflags
+from failureflags.middleware import WSGIMiddleware, ASGIMiddleware
+from failureflags.testing import SidecarSimulator
+
+EXPERIMENT = {"guid": "1", "rate": 1, "effect": {}}
+
+def environ(path="/checkout"):
+    return {"REQUEST_METHOD": "GET", "PATH_INFO": path}
+
+class TestMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        failureflags.breaker.reset()
+        failureflags._batchSupported = True
+
+    def tearDown(self):
+        failureflags.breaker.reset()
+        failureflags._batchSupported = True
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_wsgiSnapshot(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator([]) as sidecar:
+            sidecar.program("db", {"path": "/checkout"}, experiments=[EXPERIMENT])
+            db = failureflags.FailureFlag("db", {}, timeout=1, endpoint=sidecar.endpoint)
+            cache = failureflags.FailureFlag("cache", {}, timeout=1, endpoint=sidecar.endpoint)
+            outcomes = []
+            def app(environ, start_response):
+                outcomes.append(db.invoke()[0])
+                # the experiment ends halfway through the request
+                sidecar.program("db", experiments=[])
+                outcomes.append(db.invoke()[0])
+                outcomes.append(cache.invoke()[0])
+                start_response("200 OK", [])
+                yield b"streamed"
+                outcomes.append(db.invoke()[0])
+            middleware = WSGIMiddleware(app, flags=[db, cache])
+            assert list(middleware(environ(), lambda status, headers: None)) == [b"streamed"]
+            assert outcomes == [True, True, False, True]
+            # one batch for the snapshot, no fetch while handling the request
+            assert [path for path, _ in sidecar.requests] == ["/experiments"]
+            assert sidecar.requests[0][1]["flags"][0]["labels"]["path"] == "/checkout"
+            # outside of a request flags are fetched as usual
+            assert db.invoke()[0] is False and len(sidecar.requests) == 2
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_unresolvedSnapshotFallsBack(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator([EXPERIMENT]) as sidecar:
+            sidecar.program("db", drop=True)
+            db = failureflags.FailureFlag("db", {}, timeout=1, endpoint=sidecar.endpoint)
+            other = failureflags.FailureFlag("other", {}, timeout=1, endpoint=sidecar.endpoint)
+            with failureflags.experiment_snapshot([db, other]):
+                assert other.invoke()[0] is True
+            assert [path for path, _ in sidecar.requests] == ["/experiments", "/experiment"]
+
+    def test_disabledIsPassThrough(self):
+        app = lambda environ, start_response: [b"ok"]
+        assert WSGIMiddleware(app, flags=["db"])(environ(), None) == [b"ok"]
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_asgiSnapshot(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator([]) as sidecar:
+            sidecar.program("db", {"method": "POST"}, experiments=[EXPERIMENT])
+            db = failureflags.FailureFlag("db", {}, timeout=1, endpoint=sidecar.endpoint)
+            outcomes = []
+            async def app(scope, receive, send):
+                outcomes.append((await db.ainvoke())[0])
+                outcomes.append((await db.ainvoke())[0])
+            middleware = ASGIMiddleware(app, flags=[db])
+            async def main():
+                await middleware({"type": "http", "method": "POST", "path": "/"}, None, None)
+                await middleware({"type": "http", "method": "GET", "path": "/"}, None, None)
+                await middleware({"type": "lifespan"}, None, None)
+            asyncio.run(main())
+        assert outcomes == [True, True, False, False, False, False]
+        assert [path for path, _ in sidecar.requests] == ["/experiments", "/experiments", "/experiment", "/experiment"]
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_registeredFlagsByDefault(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        self.addCleanup(failureflags.disable_cache)
+        self.addCleanup(failureflags.unregister)
+        with SidecarSimulator([EXPERIMENT]) as sidecar:
+            db = failureflags.FailureFlag.get("middleware-db", {}, timeout=1, endpoint=sidecar.endpoint)
+            failureflags.register([db], wait=5)
+            sidecar.requests.clear()
+            def app(environ, start_response):
+                return [str(db.invoke()[0]).encode()]
+            assert WSGIMiddleware(app)(environ(), None).__next__() == b"True"
+            assert [path for path, _ in sidecar.requests] == ["/experiments"]
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+from failureflags.patch import Patch, applyPatches, compilePatches, parsePointer
+
+class TestPatch(unittest.TestCase):
+
+    def test_parsePointer(self):
+        assert parsePointer("") == ()
+        assert parsePointer("/a/b") == ("a", "b")
+        assert parsePointer("/a~1b/c~0d") == ("a/b", "c~d")
+        assert parsePointer("status") == ("status",)
+
+    def test_compile(self):
+        patches = compilePatches([
+            {"op": "replace", "path": "/a", "value": 1},
+            {"op": "delete", "path": "/b"},
+            {"op": "replace", "path": "/c"},
+            {"op": "delete", "path": ""},
+            {"op": "move", "path": "/d", "value": 1},
+            "not an operation",
+        ])
+        assert [(p.op, p.path) for p in patches] == [("replace", ("a",)), ("delete", ("b",))]
+        assert compilePatches([]) is None
+        assert compilePatches("status") is None
+        assert compilePatches({"a": 1})[0].op == "merge"
+
+    def test_lists(self):
+        document = {"items": [{"id": 1}, {"id": 2}]}
+        patched, applied = applyPatches(document, compilePatches([
+            {"op": "replace", "path": "/items/0/id", "value": 9},
+            {"op": "replace", "path": "/items/-", "value": {"id": 3}},
+            {"op": "delete", "path": "/items/1"},
+        ]))
+        assert applied
+        assert patched == {"items": [{"id": 9}, {"id": 3}]}
+        assert document == {"items": [{"id": 1}, {"id": 2}]}
+        assert applyPatches(document, compilePatches([{"op": "delete", "path": "/items/5"}])) == (document, False)
+        assert applyPatches(document, compilePatches([{"op": "delete", "path": "/items/01"}])) == (document, False)
+
+    def test_mergePatch(self):
+        document = {"a": {"b": 1, "c": {"d": 2}}, "e": 3}
+        patched, _ = applyPatches(document, compilePatches({"a": {"b": None, "f": [1]}, "e": {"g": 1}}))
+        assert patched == {"a": {"c": {"d": 2}, "f": [1]}, "e": {"g": 1}}
+        assert patched["a"]["c"] is document["a"]["c"]
+
+    def test_missingLastKeyIsCreated(self):
+        document = {"a": {}}
+        patched, applied = applyPatches(document, compilePatches([
+            {"op": "replace", "path": "/a/b", "value": 1},
+            {"op": "merge", "path": "/a/c", "value": {"d": 2}},
+        ]))
+        assert applied and patched == {"a": {"b": 1, "c": {"d": 2}}}
+        assert applyPatches(document, compilePatches([{"op": "replace", "path": "/x/y", "value": 1}])) == (document, False)
+        assert applyPatches(document, compilePatches([{"op": "merge", "path": "/x/y", "value": 1}])) == (document, False)
+
+    def test_unchangedMergeIsNotApplied(self):
+        document = {"status": 200, "body": {"items": [1], "error": None}}
+        for value in ({"status": 200}, {"body": {"items": [1]}}, {"missing": None}, {}):
+            patched, applied = applyPatches(document, compilePatches(value))
+            assert not applied and patched is document, value
+        assert applyPatches({"on": 1}, compilePatches({"on": True})) == ({"on": True}, True)
+        assert applyPatches({"a": 1}, compilePatches({"a": {}})) == ({"a": {}}, True)
+
+    def test_valuesAreNotShared(self):
+        patches = compilePatches([{"op": "replace", "path": "/body", "value": {"error": "x"}}])
+        first, _ = applyPatches({}, patches)
+        first["body"]["error"] = "changed by the caller"
+        second, _ = applyPatches({}, patches)
+        assert second == {"body": {"error": "x"}}
+
+    def test_replaceWholeDocument(self):
+        assert applyPatches("anything", (Patch("replace", (), "new"),)) == ("new", True)
+        assert applyPatches(None, (Patch("replace", ("a",), 1),)) == (None, False)
+
+if __name__ == '__main__':
+    unittest.main()
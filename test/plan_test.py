@@ -0,0 +1,145 @@
+import importlib
+import logging
+import os
+import unittest
+from unittest.mock import patch, MagicMock
+
+import failureflags
+from failureflags import plan as planmodule
+from failureflags.plan import CompiledExperiments, EffectPlan, Unresolvable, compileExperiment, compileExperiments
+
+debug = logging.getLogger("failureflags")
+debug.addHandler(logging.StreamHandler())
+debug.setLevel(logging.DEBUG)
+
+def experiment(effect, rate=1):
+    return {"guid": "6884c0df-ed70-4bc8-84c0-dfed703bc8a7", "failureFlagName": "name",
+            "rate": rate, "selector": {}, "effect": effect}
+
+class TestCompile(unittest.TestCase):
+
+    def test_latencyForms(self):
+        assert compileExperiment(experiment({"latency": 1500})).latency == 1.5
+        assert compileExperiment(experiment({"latency": "250"})).latency == .25
+        assert compileExperiment(experiment({"latency": "nope"})).latency is None
+        plan = compileExperiment(experiment({"latency": {"ms": 100, "jitter": 50}}))
+        assert plan.latency == .1 and plan.jitter == .05
+        assert compileExperiment(experiment({"latency": {}})).latency == 0
+        assert compileExperiment(experiment({})).latency is None
+
+    def test_rate(self):
+        assert compileExperiment(experiment({}, rate=.5)).rate == .5
+        assert compileExperiment(experiment({}, rate=2)).rate is None
+        assert compileExperiment(experiment({}, rate="1")).rate is None
+        assert compileExperiment(experiment({}, rate=True)).rate is None
+        assert compileExperiment({"effect": {}}).rate is None
+        assert compileExperiments([experiment({}, rate=.2), experiment({}, rate=.7), {"effect": {}}]).maxRate == .7
+        assert compileExperiments([]).maxRate == 0
+
+    def test_exceptionFactories(self):
+        plan = compileExperiment(experiment({"exception": "boom"}))
+        error = plan.exception()
+        assert type(error) is ValueError and error.args[0] == "boom"
+        plan = compileExperiment(experiment({"exception": {"module": "http.client", "className": "ImproperConnectionState"}}))
+        error = plan.exception()
+        assert error.__class__.__name__ == "ImproperConnectionState"
+        assert error.args[0] == "Error injected via Gremlin Failure Flags (default message)"
+        plan = compileExperiment(experiment({"exception": {"module": "not.a.module", "className": "X"}}))
+        assert type(plan.exception) is Unresolvable
+        assert compileExperiment(experiment({"exception": {}})).exception is None
+        assert compileExperiment(experiment({"exception": {"className": ""}})).exception is None
+
+    def test_plansAreImmutable(self):
+        plan = compileExperiment(experiment({"latency": 10}))
+        with self.assertRaises(AttributeError):
+            plan.rate = 0
+        with self.assertRaises(AttributeError):
+            plan.extra = 1
+
+    def test_nonDictExperiments(self):
+        compiled = compileExperiments(["nope", None, experiment({"latency": 10})])
+        assert len(compiled) == 3
+        assert [p.latency for p in compiled.plans] == [None, None, .01]
+
+    def test_impactingKeepsPlans(self):
+        compiled = compileExperiments([experiment({"latency": 10}, rate=.2), experiment({"latency": 20}, rate=.8)])
+        selected = compiled.impacting(.5)
+        assert type(selected) is CompiledExperiments
+        assert [e["effect"]["latency"] for e in selected] == [20]
+        assert selected.plans[0] is compiled.plans[1]
+        assert compileExperiments(selected) is selected
+
+    @patch('failureflags.time.sleep')
+    def test_behaviorChainDoesNotRecompile(self, mock_sleep):
+        compiled = compileExperiments([experiment({"latency": 10, "exception": "boom"})])
+        with patch('failureflags.plan.compileExperiment') as mock_compile:
+            with self.assertRaises(ValueError):
+                failureflags.delayedDataOrError(failureflags.FailureFlag("name", {}), compiled.impacting(0))
+            mock_compile.assert_not_called()
+        mock_sleep.assert_called_with(.01)
+
+    @patch('failureflags.urlopen')
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_invokeToleratesMissingRate(self, mock_urlopen):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        response_bytes = b'[{"guid": "1", "effect": {"latency": 10}}]'
+        url_cm = MagicMock()
+        url_cm.status = 200
+        url_cm.read = MagicMock(return_value=response_bytes)
+        url_cm.headers.get = MagicMock(side_effect=lambda key, default=None: {
+            "Content-Type": "application/json",
+            "Content-Length": str(len(response_bytes))
+        }.get(key, default))
+        url_cm.__enter__.return_value = url_cm
+        mock_urlopen.return_value = url_cm
+        active, impacted, experiments = failureflags.FailureFlag("name", {}).invoke()
+        assert active and not impacted
+        assert type(experiments) is list and len(experiments) == 1
+
+class TestExceptionResolution(unittest.TestCase):
+
+    def setUp(self):
+        planmodule.setExceptionAllowlist(None)
+
+    def tearDown(self):
+        planmodule.setExceptionAllowlist(None)
+
+    def test_resolutionIsMemoized(self):
+        with patch('failureflags.plan.importlib.import_module', side_effect=importlib.import_module) as mock_import:
+            for _ in range(10):
+                assert planmodule.resolveExceptionClass("http.client", "RemoteDisconnected").__name__ == "RemoteDisconnected"
+        assert mock_import.call_count == 1
+
+    def test_failuresAreMemoized(self):
+        with patch('failureflags.plan.importlib.import_module', side_effect=ImportError("nope")) as mock_import:
+            for _ in range(10):
+                assert type(planmodule.resolveExceptionClass("missing.module", "Error")) is Unresolvable
+        assert mock_import.call_count == 1
+
+    def test_onlyExceptionClassesResolve(self):
+        assert type(planmodule.resolveExceptionClass("os", "system")) is Unresolvable
+        assert type(planmodule.resolveExceptionClass("builtins", "print")) is Unresolvable
+
+    def test_allowlist(self):
+        failureflags.set_exception_allowlist(["http"])
+        assert planmodule.resolveExceptionClass("http.client", "ImproperConnectionState").__name__ == "ImproperConnectionState"
+        assert planmodule.resolveExceptionClass("builtins", "TimeoutError") is TimeoutError
+        assert type(planmodule.resolveExceptionClass("json", "JSONDecodeError")) is Unresolvable
+        failureflags.set_exception_allowlist(None)
+        assert planmodule.resolveExceptionClass("json", "JSONDecodeError").__name__ == "JSONDecodeError"
+
+    def test_cacheIsBounded(self):
+        with patch('failureflags.plan.RESOLVE_CACHE_SIZE', 4):
+            for i in range(10):
+                planmodule.resolveExceptionClass(f"missing{i}", "Error")
+            assert len(planmodule._resolved) == 4
+
+    def test_disallowedExceptionEffectIsSkipped(self):
+        failureflags.set_exception_allowlist(["http"])
+        impacted = failureflags.exception(failureflags.FailureFlag("name", {}, debug=True),
+                                          [experiment({"exception": {"module": "json", "className": "JSONDecodeError"}})])
+        assert impacted == False
+
+if __name__ == '__main__':
+    unittest.main()
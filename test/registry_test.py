@@ -0,0 +1,50 @@
+import os
+import unittest
+from unittest.mock import patch
+
+import failureflags
+
+class TestRegistry(unittest.TestCase):
+
+    def tearDown(self):
+        failureflags._registry.clear()
+        failureflags.reload_config()
+
+    def test_getInternsFlags(self):
+        labels = {"a": "1", "b": "2"}
+        flag = failureflags.FailureFlag.get("interned", labels, timeout=.5)
+        assert failureflags.FailureFlag.get("interned", {"b": "2", "a": "1"}) is flag
+        assert failureflags.FailureFlag.get("interned", {"a": "1"}) is not flag
+        assert flag.timeout == .5
+        # the registry keeps its own copy of the labels
+        assert flag.labels == labels and flag.labels is not labels
+
+    def test_registryIsBounded(self):
+        with patch('failureflags.REGISTRY_SIZE', 2):
+            flags = [failureflags.FailureFlag.get("bounded", {"i": str(i)}) for i in range(3)]
+            assert failureflags.FailureFlag.get("bounded", {"i": "1"}) is flags[1]
+            assert failureflags.FailureFlag.get("bounded", {"i": "2"}) is not flags[2]
+        assert len(failureflags._registry) == 2
+
+    def test_flagsUseSlots(self):
+        flag = failureflags.FailureFlag("slots", {})
+        with self.assertRaises(AttributeError):
+            flag.unknown = True
+
+    @patch('failureflags.urlopen')
+    def test_enabledIsResolvedByReloadConfig(self, mock_urlopen):
+        flag = failureflags.FailureFlag.get("reload", {})
+        with patch.dict(os.environ, clear=True):
+            failureflags.reload_config()
+            with patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"}):
+                # not seen until the configuration is reloaded
+                assert flag.invoke() == (False, False, [])
+                assert not flag.enabled
+                failureflags.reload_config()
+                assert flag.enabled
+            failureflags.reload_config()
+            assert not flag.enabled
+        mock_urlopen.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import asyncio
+import os
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import failureflags
+from failureflags import aio
+from failureflags.scope import current
+from failureflags.testing import SidecarSimulator
+
+EXPERIMENT = {"guid": "1", "rate": 1, "effect": {}}
+
+class TestScopedLabels(unittest.TestCase):
+
+    def setUp(self):
+        failureflags.breaker.reset()
+
+    def tearDown(self):
+        failureflags.disable_cache()
+        failureflags.breaker.reset()
+
+    def test_nestedScopes(self):
+        assert current() is None
+        with failureflags.scoped_labels({"route": "/a"}, tenant="t1"):
+            with failureflags.scoped_labels(route="/b"):
+                assert current().labels == {"route": "/b", "tenant": "t1"}
+            assert current().labels == {"route": "/a", "tenant": "t1"}
+        assert current() is None
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_labelsAreMergedAtFetchTime(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator([]) as sidecar:
+            sidecar.program("db", {"tenant": "t1", "table": "users"}, experiments=[EXPERIMENT])
+            flag = failureflags.FailureFlag("db", {"table": "users"}, timeout=1, endpoint=sidecar.endpoint)
+            assert flag.fetch() == []
+            with failureflags.scoped_labels(tenant="t1", table="orders"):
+                assert flag.fetch() == [EXPERIMENT]
+            with failureflags.scoped_labels(tenant="t2"):
+                assert flag.fetch() == []
+            labels = [body["labels"] for _, body in sidecar.requests]
+        # the flag's own labels take precedence and are never modified
+        assert flag.labels == {"table": "users"}
+        assert labels[1] == {"tenant": "t1", "table": "users", "failure-flags-sdk-version": f"python-{failureflags.VERSION}"}
+        assert labels[2]["tenant"] == "t2" and "tenant" not in labels[0]
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_cacheIsKeyedByScope(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        failureflags.enable_cache(ttl=60)
+        with SidecarSimulator([]) as sidecar:
+            sidecar.program("db", {"tenant": "t1"}, experiments=[EXPERIMENT])
+            flag = failureflags.FailureFlag("db", {}, timeout=1, endpoint=sidecar.endpoint)
+            for _ in range(2):
+                with failureflags.scoped_labels(tenant="t1"):
+                    assert flag.invoke()[0] is True
+                with failureflags.scoped_labels(tenant="t2"):
+                    assert flag.invoke()[0] is False
+                assert flag.invoke()[0] is False
+            assert len(sidecar.requests) == 3
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_cacheRefreshKeepsScope(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        cache = failureflags.enable_cache(ttl=.05)
+        with SidecarSimulator([]) as sidecar:
+            sidecar.program("db", {"tenant": "acme"}, experiments=[EXPERIMENT])
+            flag = failureflags.FailureFlag("db", {}, timeout=1, endpoint=sidecar.endpoint)
+            with failureflags.scoped_labels(tenant="acme"):
+                assert flag.invoke()[2] == [EXPERIMENT]
+                stale = cache._entries[flag._cacheKey()]
+                time.sleep(.06)
+                # served stale while refreshing in the background
+                assert flag.invoke()[2] == [EXPERIMENT]
+                deadline = time.monotonic() + 2
+                while cache._entries.get(flag._cacheKey()) is stale and time.monotonic() < deadline:
+                    time.sleep(.01)
+                assert flag.invoke()[2] == [EXPERIMENT]
+            assert [body["labels"].get("tenant") for _, body in sidecar.requests] == ["acme", "acme"]
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_scopesAreIsolated(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator([]) as sidecar:
+            sidecar.program("db", {"tenant": "t1"}, experiments=[EXPERIMENT])
+            flag = failureflags.FailureFlag("db", {}, timeout=1, endpoint=sidecar.endpoint)
+            results = {}
+            def run(tenant):
+                with failureflags.scoped_labels(tenant=tenant):
+                    results[tenant] = [flag.fetch() for _ in range(10)]
+            threads = [threading.Thread(target=run, args=(tenant,)) for tenant in ("t1", "t2")]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert results == {"t1": [[EXPERIMENT]] * 10, "t2": [[]] * 10}
+
+            async def task(tenant):
+                with failureflags.scoped_labels(tenant=tenant):
+                    await asyncio.sleep(0)
+                    return await aio.afetch(flag)
+            async def main():
+                return await asyncio.gather(task("t1"), task("t2"), aio.afetch(flag))
+            assert asyncio.run(main()) == [[EXPERIMENT], [], []]
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import failureflags
+from failureflags.shared import SharedExperiments, SharedSnapshot
+
+DEFINITIONS = [
+    {"guid": "1", "failureFlagName": "db", "rate": 1, "selector": {"table": ["users"]},
+     "effect": {"latency": 10}},
+]
+
+class TestSharedSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "snapshot")
+
+    def tearDown(self):
+        failureflags.disable_local_mode()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_writeAndRead(self):
+        writer = SharedSnapshot(self.path, size=4096)
+        reader = SharedSnapshot(self.path, size=4096)
+        assert reader.read()[2] is None
+        writer.write(b"[1,2]")
+        version, writtenAt, payload = reader.read()
+        assert payload == b"[1,2]" and version % 2 == 0 and version == reader.version()
+        assert time.time() - writtenAt < 5
+        writer.write(b"x" * 5000)
+        assert reader.read()[2] is None and reader.version() > version
+
+    def test_readRetriesWhileWriting(self):
+        snapshot = SharedSnapshot(self.path, size=4096)
+        snapshot.write(b"[]")
+        # simulate a writer that died between the two sequence updates
+        snapshot._map[8:16] = (snapshot.version() + 1).to_bytes(8, "little")
+        with patch("failureflags.shared.time.sleep") as mock_sleep:
+            with self.assertRaises(TimeoutError):
+                snapshot.read()
+        assert mock_sleep.called
+
+    def test_onlyOneRefresher(self):
+        loads = []
+        def loader():
+            loads.append(1)
+            return DEFINITIONS
+        first = SharedExperiments(SharedSnapshot(self.path, 4096), loader, refresh=60)
+        second = SharedExperiments(SharedSnapshot(self.path, 4096), loader, refresh=60)
+        self.addCleanup(first.stop)
+        self.addCleanup(second.stop)
+        assert first.load() and first.refresher
+        assert second.load() and not second.refresher
+        assert len(loads) == 1
+        assert second.match("db", {"table": "users"})[0]["guid"] == "1"
+
+        # the table is only parsed again when the version changes
+        table = second.table._state
+        assert second.ready and second.table._state is table
+        first.publish()
+        assert second.ready and second.table._state is not table
+
+        # a failed load marks the snapshot unavailable everywhere
+        first.loader = lambda: 1/0
+        first.publish()
+        assert not second.ready and len(second.table) == 0
+
+        # the refresher role moves on when the refresher gives it up
+        first.stop()
+        second.loader = loader
+        second._nextElection = 0
+        second.ready
+        assert second.refresher
+        assert second._published.wait(1) and second.ready
+
+    def test_takeoverNeverLoadsFromReady(self):
+        def slowLoader():
+            time.sleep(.5)
+            return DEFINITIONS
+        first = SharedExperiments(SharedSnapshot(self.path, 4096), lambda: DEFINITIONS, refresh=60)
+        second = SharedExperiments(SharedSnapshot(self.path, 4096), slowLoader, refresh=60)
+        self.addCleanup(first.stop)
+        self.addCleanup(second.stop)
+        assert first.load() and second.load() and not second.refresher
+        first.stop()
+        second._nextElection = 0
+        started = time.monotonic()
+        assert second.ready, "the last snapshot is still served while the new refresher loads"
+        assert time.monotonic() - started < .1
+        assert second.refresher and second._published.wait(2)
+
+    def test_staleSnapshotIsIgnored(self):
+        shared = SharedExperiments(SharedSnapshot(self.path, 4096), lambda: DEFINITIONS, refresh=60, maxAge=0.05)
+        self.addCleanup(shared.stop)
+        assert shared.load()
+        time.sleep(.1)
+        assert not shared.ready
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires fork()")
+    def test_forkedWorkerReadsParentSnapshot(self):
+        shared = SharedExperiments(SharedSnapshot(self.path, 4096), lambda: DEFINITIONS, refresh=60)
+        self.addCleanup(shared.stop)
+        assert shared.load() and shared.refresher
+        pid = os.fork()
+        if pid == 0:
+            # the parent still holds the refresher lock
+            ok = shared.ready and not shared.refresher and len(shared.match("db", {"table": "users"})) == 1
+            os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        assert os.WEXITSTATUS(status) == 0
+        assert shared.refresher
+
+    @patch('failureflags.urlopen')
+    @patch('failureflags.time.sleep')
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_invokeFromSharedSnapshot(self, mock_sleep, mock_urlopen):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with patch("failureflags._loadDefinitions", return_value=DEFINITIONS):
+            failureflags.enable_shared_snapshot(path=self.path, refresh=60, size=4096)
+        active, impacted, experiments = failureflags.FailureFlag("db", {"table": "users"}).invoke()
+        assert active and impacted and experiments[0]["guid"] == "1"
+        mock_urlopen.assert_not_called()
+        mock_sleep.assert_called_once_with(.01)
+
+if __name__ == '__main__':
+    unittest.main()
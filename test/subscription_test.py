@@ -0,0 +1,123 @@
+import logging
+import os
+import time
+import unittest
+from unittest.mock import patch
+
+import failureflags
+from failureflags.selector import ExperimentTable, matches
+from failureflags.subscription import events
+from failureflags.testing import SidecarSimulator
+
+debug = logging.getLogger("failureflags")
+debug.addHandler(logging.StreamHandler())
+debug.setLevel(logging.DEBUG)
+
+def experiment(guid, name="flag", selector=None, latency=10):
+    return {"guid": guid, "failureFlagName": name, "rate": 1,
+            "selector": selector or {}, "effect": {"latency": latency}}
+
+def eventually(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+class TestSelector(unittest.TestCase):
+
+    def test_matches(self):
+        e = experiment("1", selector={"a": ["1", "2"], "b": "3"})
+        assert matches(e, "flag", {"a": "2", "b": "3", "c": "x"})
+        assert not matches(e, "flag", {"a": "4", "b": "3"})
+        assert not matches(e, "flag", {"a": "1"})
+        assert not matches(e, "other", {"a": "1", "b": "3"})
+
+    def test_tableAddRemove(self):
+        table = ExperimentTable([experiment("1"), experiment("2", name="other")])
+        assert len(table.match("flag", {})) == 1
+        table.add(experiment("3"))
+        assert len(table.match("flag", {})) == 2
+        table.remove("1")
+        assert [e["guid"] for e in table.match("flag", {})] == ["3"]
+        assert table.match("missing", {}) == []
+
+    def test_indexAgreesWithMatches(self):
+        candidates = [
+            experiment("1", selector={"a": ["1", "2"], "b": "3"}),
+            experiment("2", selector={"a": "1"}),
+            experiment("3"),
+            experiment("4", selector={"c": [["unhashable"]]}),
+            experiment("5", selector={"a": ["1", "1"]}),
+            experiment("6", name="other", selector={"a": "1"}),
+        ]
+        table = ExperimentTable(candidates)
+        for labels in ({}, {"a": "1"}, {"a": "2", "b": "3"}, {"a": "1", "b": "3", "c": ["unhashable"]},
+                       {"a": ["unhashable"]}, {"b": "3"}):
+            expected = [e["guid"] for e in candidates if matches(e, "flag", labels)]
+            assert [e["guid"] for e in table.match("flag", labels)] == expected, labels
+
+    def test_matchIsMemoizedUntilTheTableChanges(self):
+        table = ExperimentTable([experiment("1", selector={"a": "1"})])
+        first = table.match("flag", {"a": "1"})
+        assert table.match("flag", {"a": "1"}) is first
+        table.add(experiment("2"))
+        assert [e["guid"] for e in table.match("flag", {"a": "1"})] == ["1", "2"]
+
+    def test_eventParsing(self):
+        lines = [b": keepalive\n", b"event: add\n", b"data: {\"guid\": \"1\"}\n", b"\n",
+                 b"data: {}\n", b"\n"]
+        assert list(events(lines)) == [("add", '{"guid": "1"}'), ("message", "{}")]
+
+class TestSubscription(unittest.TestCase):
+
+    def tearDown(self):
+        failureflags.unsubscribe()
+
+    @patch('failureflags.urlopen')
+    @patch('failureflags.time.sleep')
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_invokeReadsTableWithoutIO(self, mock_sleep, mock_urlopen):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator() as sidecar:
+            sidecar.publish("reset", [experiment("1", selector={"route": ["/a"]}, latency=5000)])
+            subscription = failureflags.subscribe(sidecar.streamUrl, wait=2)
+            assert subscription.ready
+
+            active, impacted, experiments = failureflags.FailureFlag("flag", {"route": "/a"}).invoke()
+            assert active and impacted
+            mock_sleep.assert_called_with(5)
+            active, impacted, experiments = failureflags.FailureFlag("flag", {"route": "/b"}).invoke()
+            assert not active
+            mock_urlopen.assert_not_called()
+
+            sidecar.publish("add", experiment("2", selector={"route": ["/b"]}))
+            assert eventually(lambda: len(subscription.table) == 2)
+            active, _, _ = failureflags.FailureFlag("flag", {"route": "/b"}).invoke()
+            assert active
+
+            sidecar.publish("remove", {"guid": "1"})
+            assert eventually(lambda: len(subscription.table) == 1)
+            active, _, _ = failureflags.FailureFlag("flag", {"route": "/a"}).invoke()
+            assert not active
+            mock_urlopen.assert_not_called()
+
+    def test_disconnectClearsTableAndReconnects(self):
+        with SidecarSimulator() as sidecar:
+            sidecar.publish("reset", [experiment("1")])
+            subscription = failureflags.Subscription(sidecar.streamUrl, retryMin=0.05).start()
+            try:
+                assert subscription.wait(2)
+                sidecar.disconnect()
+                assert eventually(lambda: not subscription.ready)
+                assert len(subscription.table) == 0, "a broken stream must not keep stale experiments"
+                sidecar.publish("reset", [experiment("1"), experiment("2")])
+                assert eventually(lambda: subscription.ready and len(subscription.table) == 2)
+                assert subscription.connects == 2
+            finally:
+                subscription.stop()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import asyncio
+import contextlib
+import io
+import os
+import time
+import unittest
+from unittest.mock import patch
+
+import failureflags
+from failureflags.testing import SidecarSimulator, LoadReport, runLoad, arunLoad
+
+EXPERIMENT = {"guid": "1", "rate": 1, "effect": {"latency": 10}}
+
+class TestSidecarSimulator(unittest.TestCase):
+
+    def setUp(self):
+        failureflags.breaker.reset()
+
+    def tearDown(self):
+        failureflags.breaker.reset()
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_experimentsPerFlagAndLabels(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator() as sidecar:
+            sidecar.program("db", {"table": "users"}, experiments=[EXPERIMENT])
+            flag = lambda name, labels: failureflags.FailureFlag(name, labels, timeout=1, endpoint=sidecar.endpoint)
+            assert flag("db", {"table": "users", "op": "read"}).fetch() == [EXPERIMENT]
+            assert flag("db", {"table": "orders"}).fetch() == []
+            assert flag("http", {"table": "users"}).fetch() == []
+            assert failureflags.fetch_many([flag("db", {"table": "users"}), flag("db", {})]) == [[EXPERIMENT], []]
+            assert sidecar.ruleFor("db", {"table": "users"}).hits == 2
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_latency(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator([EXPERIMENT]) as sidecar:
+            sidecar.program("slow", latency=.05)
+            slow = failureflags.FailureFlag("slow", {}, timeout=1, endpoint=sidecar.endpoint)
+            started = time.perf_counter()
+            assert slow.fetch() == [EXPERIMENT]
+            assert time.perf_counter() - started >= .05
+            with self.assertRaises(TimeoutError):
+                failureflags.FailureFlag("slow", {}, timeout=.01, endpoint=sidecar.endpoint).fetch()
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_malformedResponsesAreRejected(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator([EXPERIMENT]) as sidecar:
+            flag = lambda name: failureflags.FailureFlag(name, {}, timeout=1, endpoint=sidecar.endpoint)
+            sidecar.program("error", status=503)
+            sidecar.program("type", contentType="text/plain")
+            sidecar.program("nolength", contentLength=None)
+            sidecar.program("body", body=b"not json")
+            assert flag("error").fetch() == []
+            assert flag("type").fetch() == []
+            assert flag("nolength").fetch() == []
+            with self.assertRaises(ValueError):
+                flag("body").fetch()
+            assert flag("fine").fetch() == [EXPERIMENT]
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_droppedConnections(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator([EXPERIMENT]) as sidecar:
+            sidecar.program("dropped", drop=True)
+            with self.assertRaises(ConnectionError):
+                failureflags.FailureFlag("dropped", {}, timeout=1, endpoint=sidecar.endpoint).fetch()
+            # invoke() fails safe
+            assert failureflags.FailureFlag("dropped", {}, timeout=1, endpoint=sidecar.endpoint).invoke() == (False, False, [])
+            sidecar.reset()
+            assert failureflags.FailureFlag("dropped", {}, timeout=1, endpoint=sidecar.endpoint).fetch() == [EXPERIMENT]
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_clientHangUpsAreQuiet(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr), SidecarSimulator([EXPERIMENT]) as sidecar:
+            sidecar.program("slow", latency=.1)
+            for _ in range(3):
+                with self.assertRaises(Exception):
+                    failureflags.FailureFlag("slow", {}, timeout=.01, endpoint=sidecar.endpoint).fetch()
+            time.sleep(.2)
+        assert "Traceback" not in stderr.getvalue()
+
+    @patch('failureflags.time.sleep')
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_runLoad(self, mock_sleep):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator([EXPERIMENT]) as sidecar:
+            flags = lambda i: [failureflags.FailureFlag("load", {"worker": str(i)}, timeout=1, endpoint=sidecar.endpoint)]
+            report = runLoad(flags, threads=4, calls=25)
+        assert report.calls == 100 and report.impacted == 100 and report.errors == 0
+        assert report.throughput > 0 and 0 < report.p50 <= report.p99 <= report.max
+        assert len(sidecar.requests) == 100
+        assert "100 calls by 4 workers" in str(report)
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_arunLoad(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator([]) as sidecar:
+            sidecar.program("errors", experiments=[{"guid": "1", "rate": 1, "effect": {"exception": "boom"}}])
+            flag = failureflags.FailureFlag("errors", {}, timeout=1, endpoint=sidecar.endpoint)
+            report = asyncio.run(arunLoad(flag, coroutines=3, calls=10))
+        assert report.calls == 30 and report.errors == 30
+        assert report.asDict()["workers"] == 3
+
+    def test_emptyReport(self):
+        report = LoadReport([], 0, 0, 0, 1)
+        assert report.throughput == 0 and report.p99 == 0
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import asyncio
+import os
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import failureflags
+from failureflags.timeouts import AdaptiveTimeout
+from failureflags.testing import SidecarSimulator
+from hooks_test import RecordingHooks
+
+class RecordingTimeoutHooks(RecordingHooks):
+
+    def timeoutChosen(self, flag, timeout):
+        self.events.append(("timeoutChosen", flag.name, timeout))
+
+    def requestHedged(self, flag, delay):
+        self.events.append(("requestHedged", flag.name, delay))
+
+def slowFirstRequest(delay=.3):
+    calls = []
+    lock = threading.Lock()
+    def experiments(name, labels):
+        with lock:
+            calls.append(name)
+            first = len(calls) == 1
+        if first:
+            time.sleep(delay)
+        return [{"guid": "1", "rate": 0, "effect": {}}]
+    return experiments, calls
+
+class TestAdaptiveTimeout(unittest.TestCase):
+
+    def setUp(self):
+        failureflags.breaker.reset()
+
+    def tearDown(self):
+        failureflags.disable_adaptive_timeout()
+        failureflags.set_hooks(None)
+        failureflags.breaker.reset()
+
+    def test_ceilingUntilWarm(self):
+        adaptive = AdaptiveTimeout(floor=.001, ceiling=.05, warmup=20)
+        for _ in range(19):
+            adaptive.observe(.0002)
+        assert adaptive.timeout() == .05
+        adaptive.observe(.0002)
+        assert adaptive.timeout() == .001
+
+    def test_followsRoundTripWithinBounds(self):
+        adaptive = AdaptiveTimeout(floor=.001, ceiling=.05, headroom=2, warmup=1)
+        for _ in range(64):
+            adaptive.observe(.004)
+        assert abs(adaptive.timeout() - .008) < 1e-9
+        for _ in range(256):
+            adaptive.observe(1.0)
+        assert adaptive.timeout() == .05
+        stats = adaptive.stats()
+        assert stats["observed"] == 320 and stats["percentile"] == 1.0
+
+    def test_timeoutsRaiseTheEstimate(self):
+        adaptive = AdaptiveTimeout(floor=.001, ceiling=.05, headroom=1, warmup=1)
+        for _ in range(32):
+            adaptive.observe(.001)
+        for _ in range(32):
+            adaptive.timedOut(adaptive.timeout())
+        assert adaptive.timeout() > .001
+        assert adaptive.stats()["timeouts"] == 32
+
+    def test_hedgeDelay(self):
+        adaptive = AdaptiveTimeout(floor=.001, ceiling=.05, hedge=True, warmup=1)
+        assert adaptive.hedgeDelay() is None
+        for i in range(100):
+            adaptive.observe(.001 + i * .0001)
+        assert .001 <= adaptive.hedgeDelay() < adaptive.timeout()
+        assert AdaptiveTimeout(hedge=False).hedgeDelay() is None
+        with self.assertRaises(ValueError):
+            AdaptiveTimeout(floor=.1, ceiling=.01)
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_fetchUsesAdaptiveTimeout(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        hooks = failureflags.set_hooks(RecordingTimeoutHooks())
+        adaptive = failureflags.enable_adaptive_timeout(floor=.5, ceiling=1)
+        with SidecarSimulator([]) as sidecar:
+            flag = failureflags.FailureFlag("adaptive", {}, timeout=.000001, endpoint=sidecar.endpoint)
+            assert flag.fetch() == []
+        assert ("timeoutChosen", "adaptive", 1) in hooks.events
+        assert failureflags.adaptive_timeout_stats()["observed"] == 1
+        assert adaptive.ewma > 0
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_fetchIsNotHedged(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        hooks = failureflags.set_hooks(RecordingTimeoutHooks())
+        adaptive = failureflags.enable_adaptive_timeout(floor=.02, ceiling=.2, hedge=True, headroom=20, warmup=1)
+        adaptive.observe(.01)
+        assert adaptive.hedgeDelay() == .02 and adaptive.timeout() == .2
+        with SidecarSimulator([{"guid": "1", "rate": 0, "effect": {}}]) as sidecar:
+            # slower than the hedge delay, well within the timeout
+            sidecar.program("slow", latency=.05)
+            result = failureflags.FailureFlag("slow", {}, endpoint=sidecar.endpoint).fetch()
+        assert result[0]["guid"] == "1"
+        assert len(sidecar.requests) == 1
+        assert not any(event[0] == "requestHedged" for event in hooks.events)
+        assert adaptive.stats()["hedges"] == 0 and adaptive.stats()["timeouts"] == 0
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_afetchIsHedged(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        adaptive = failureflags.enable_adaptive_timeout(floor=.02, ceiling=2, hedge=True, headroom=50, warmup=1)
+        adaptive.observe(.01)
+        experiments, calls = slowFirstRequest()
+        with SidecarSimulator(experiments) as sidecar:
+            flag = failureflags.FailureFlag("hedged", {}, endpoint=sidecar.endpoint)
+            started = time.perf_counter()
+            result = asyncio.run(flag.afetch())
+            elapsed = time.perf_counter() - started
+        assert result[0]["guid"] == "1"
+        assert len(calls) == 2 and elapsed < .3
+        assert adaptive.stats()["hedges"] == 1
+
+if __name__ == '__main__':
+    unittest.main()
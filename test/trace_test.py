@@ -0,0 +1,108 @@
+import asyncio
+import io
+import json
+import os
+import signal
+import threading
+import unittest
+from unittest.mock import patch
+
+import failureflags
+from failureflags.trace import DecisionTrace, installSignalHandler
+
+class TestDecisionTrace(unittest.TestCase):
+
+    def tearDown(self):
+        failureflags.disable_decision_trace()
+
+    def test_ringBufferKeepsTheLastDecisions(self):
+        trace = DecisionTrace(3)
+        for i in range(5):
+            trace.record(f"flag{i}", ("flag", ()), "fetch", .001, [], .5, (), False)
+        assert [d["flag"] for d in trace.decisions()] == ["flag2", "flag3", "flag4"]
+        trace.clear()
+        assert trace.decisions() == []
+        with self.assertRaises(ValueError):
+            DecisionTrace(0)
+
+    def test_concurrentRecording(self):
+        trace = DecisionTrace(64)
+        def record():
+            for _ in range(1000):
+                trace.record("x", ("x", ()), "cache", 0, [], .5, (), False)
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(trace.decisions()) == 64
+        seqs = [d.seq for d in trace._slots]
+        assert len(set(seqs)) == 64 and all(seq % 64 == i for i, seq in enumerate(seqs))
+
+    @patch('failureflags.FailureFlag.fetch')
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_invokeDecisions(self, mock_fetch):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        failureflags.enable_decision_trace(size=8)
+        mock_fetch.return_value = [{"guid": "1", "rate": 1, "effect": {"exception": "boom"}},
+                                   {"guid": "2", "rate": 0, "effect": {"latency": 10}}]
+        flag = failureflags.FailureFlag("traced", {"a": "1"})
+        with self.assertRaises(Exception):
+            flag.invoke()
+        mock_fetch.return_value = []
+        with failureflags.scoped_labels(tenant="t1"):
+            assert flag.invoke() == (False, False, [])
+        mock_fetch.side_effect = ConnectionRefusedError()
+        flag.invoke()
+        first, second, third = failureflags.decision_trace()
+        assert first["flag"] == "traced" and first["source"] == "fetch" and first["error"] is None
+        assert first["experiments"] == ["1", "2"] and first["impacting"] == ["1"]
+        assert first["effects"] == ["exception"] and first["impacted"] is True and first["duration"] >= 0
+        assert second["experiments"] == [] and second["impacted"] is False
+        assert second["fingerprint"] != first["fingerprint"]
+        assert third["error"] == "refused" and third["source"] is None
+        failureflags.disable_decision_trace()
+        assert failureflags.decision_trace() is None
+
+    @patch('failureflags.aio.afetch')
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_ainvokeDecisions(self, mock_afetch):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        failureflags.enable_decision_trace()
+        async def afetch(ff):
+            return [{"guid": "1", "rate": 1, "effect": {}}]
+        mock_afetch.side_effect = afetch
+        asyncio.run(failureflags.FailureFlag("async", {}).ainvoke())
+        decision, = failureflags.decision_trace()
+        assert decision["impacting"] == ["1"] and decision["effects"] == []
+
+    @unittest.skipUnless(hasattr(signal, "SIGUSR1"), "requires SIGUSR1")
+    def test_dumpOnSignal(self):
+        trace = DecisionTrace(4)
+        trace.record("signalled", ("signalled", ()), "local", 0, [{"guid": "1"}], .25, (), False)
+        stream = io.StringIO()
+        previous = installSignalHandler(trace, signal.SIGUSR1, stream)
+        self.addCleanup(signal.signal, signal.SIGUSR1, previous)
+        os.kill(os.getpid(), signal.SIGUSR1)
+        decision = json.loads(stream.getvalue())
+        assert decision["flag"] == "signalled" and decision["experiments"] == ["1"] and decision["dice"] == .25
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_TRACE_SIZE": "16", "FAILURE_FLAGS_TRACE_SIGNAL": "NOPE"})
+    def test_fromEnvironment(self):
+        from failureflags.trace import fromEnvironment
+        assert fromEnvironment().size == 16
+
+    @patch('failureflags.FailureFlag.fetch')
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_debugMessagesAreFormatted(self, mock_fetch):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        mock_fetch.side_effect = ValueError("boom")
+        with self.assertLogs("failureflags", "DEBUG") as logs:
+            failureflags.FailureFlag("logged", {}, debug=True).invoke()
+        assert "received error while fetching experiments: boom" in logs.output[0]
+
+if __name__ == '__main__':
+    unittest.main()
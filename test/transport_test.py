@@ -0,0 +1,164 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+from urllib.request import Request
+
+import failureflags
+from failureflags import transport
+from failureflags.testing import SidecarSimulator
+
+def post(url, body=b"{}"):
+    return Request(url, headers={"Content-Type": "application/json", "Content-Length": len(body)}, data=body)
+
+class TestConnectionPool(unittest.TestCase):
+
+    def test_reusesConnections(self):
+        with SidecarSimulator([{"guid": "1"}]) as sidecar:
+            pool = transport.ConnectionPool("127.0.0.1", sidecar.port)
+            for _ in range(5):
+                with pool.urlopen(post(sidecar.url), timeout=1) as response:
+                    assert response.status == 200
+                    assert response.read() == b'[{"guid": "1"}]'
+            stats = pool.stats()
+            assert stats["opened"] == 1, stats
+            assert stats["reused"] == 4, stats
+            assert stats["idle"] == 1, stats
+            pool.clear()
+
+    def test_unreadResponseIsNotReused(self):
+        with SidecarSimulator() as sidecar:
+            pool = transport.ConnectionPool("127.0.0.1", sidecar.port)
+            with pool.urlopen(post(sidecar.url), timeout=1) as response:
+                pass
+            with pool.urlopen(post(sidecar.url), timeout=1) as response:
+                response.read()
+            stats = pool.stats()
+            assert stats["opened"] == 2, stats
+            assert stats["discarded"] == 1, stats
+
+    def test_connectionCloseHeaderIsHonored(self):
+        with SidecarSimulator() as sidecar:
+            sidecar.closeConnections = True
+            pool = transport.ConnectionPool("127.0.0.1", sidecar.port)
+            for _ in range(3):
+                with pool.urlopen(post(sidecar.url), timeout=1) as response:
+                    response.read()
+            stats = pool.stats()
+            assert stats["opened"] == 3, stats
+            assert stats["reused"] == 0, stats
+
+    def test_reconnectsWhenSidecarClosesIdleConnection(self):
+        with SidecarSimulator(idleTimeout=0.05) as sidecar:
+            pool = transport.ConnectionPool("127.0.0.1", sidecar.port)
+            with pool.urlopen(post(sidecar.url), timeout=1) as response:
+                response.read()
+            time.sleep(0.2)
+            with pool.urlopen(post(sidecar.url), timeout=1) as response:
+                assert response.status == 200
+                response.read()
+            stats = pool.stats()
+            assert stats["opened"] == 2, stats
+            assert len(sidecar.requests) == 2
+            pool.clear()
+
+    def test_poolIsBounded(self):
+        with SidecarSimulator() as sidecar:
+            pool = transport.ConnectionPool("127.0.0.1", sidecar.port, maxsize=2)
+            responses = [pool.urlopen(post(sidecar.url), timeout=1) for _ in range(4)]
+            for response in responses:
+                response.read()
+                response.close()
+            stats = pool.stats()
+            assert stats["opened"] == 4, stats
+            assert stats["idle"] == 2, stats
+            assert stats["discarded"] == 2, stats
+            pool.clear()
+
+    def test_idleConnectionsAreDroppedAfterFork(self):
+        with SidecarSimulator() as sidecar:
+            pool = transport.ConnectionPool("127.0.0.1", sidecar.port)
+            with pool.urlopen(post(sidecar.url), timeout=1) as response:
+                response.read()
+            inherited = pool._idle[0]
+            with patch("failureflags.transport.os.getpid", return_value=os.getpid() + 1):
+                with pool.urlopen(post(sidecar.url), timeout=1) as response:
+                    response.read()
+                assert pool._idle[0] is not inherited
+            assert pool.stats()["opened"] == 2
+            inherited.close()
+            pool.clear()
+
+    def test_poolForIPv6Endpoint(self):
+        assert transport.address("http://[::1]:5032/experiment") == (None, "::1", 5032, "/experiment")
+        with patch("failureflags.transport.poolFor") as mock_poolFor:
+            transport.urlopen(post("http://[::1]:5032/experiment"), timeout=1)
+            transport.urlopen(post("http://[::1]/experiment"), timeout=1)
+        assert [c.args for c in mock_poolFor.call_args_list] == [("::1", 5032), ("::1", 80)]
+
+class TestUnixDomainSocket(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.socketPath = os.path.join(self.dir, "sidecar.sock")
+        failureflags.breaker.reset()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_sidecarURL(self):
+        assert transport.sidecarURL("http://localhost:5032", "/experiment") == "http://localhost:5032/experiment"
+        assert transport.sidecarURL("unix:///run/ff.sock", "/experiment") == "http+unix://%2Frun%2Fff.sock/experiment"
+        assert transport.sidecarURL("/run/ff.sock", "/experiment") == "http+unix://%2Frun%2Fff.sock/experiment"
+        assert transport.address("http+unix://%2Frun%2Fff.sock/experiment") == ("/run/ff.sock", None, None, "/experiment")
+        assert transport.address("http://localhost:5032/experiment") == (None, "localhost", 5032, "/experiment")
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_fetchOverUnixSocket(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator([{"guid": "1", "rate": 1, "effect": {}}], unixSocket=self.socketPath) as sidecar:
+            flag = failureflags.FailureFlag("uds", {"a": "1"}, timeout=1, endpoint=sidecar.endpoint)
+            for _ in range(3):
+                experiments = flag.fetch()
+                assert experiments == [{"guid": "1", "rate": 1, "effect": {}}]
+            pool = transport.poolFor("localhost", None, self.socketPath)
+            assert pool.stats()["opened"] == 1
+            assert pool.stats()["reused"] == 2
+            pool.clear()
+        assert sidecar.requests[0][1]["name"] == "uds"
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_unixSocketResponsesAreValidated(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator([{"guid": "1"}], unixSocket=self.socketPath) as sidecar:
+            sidecar.batch = False
+            flag = failureflags.FailureFlag("uds", {}, timeout=1, endpoint=sidecar.endpoint)
+            request = Request(transport.sidecarURL(sidecar.endpoint, "/experiments"),
+                              headers={"Content-Type": "application/json", "Content-Length": 2}, data=b"{}")
+            with transport.urlopen(request, timeout=1) as response:
+                assert response.status == 404
+                assert failureflags.readExperiments(flag, response) == []
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_environmentSelectsUnixSocket(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator([{"guid": "1"}], unixSocket=self.socketPath) as sidecar:
+            with patch('failureflags.SIDECAR_ENDPOINT', sidecar.endpoint):
+                assert failureflags.FailureFlag("uds", {}, timeout=1).fetch() == [{"guid": "1"}]
+
+    @patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE"})
+    def test_afetchOverUnixSocket(self):
+        failureflags.reload_config()
+        self.addCleanup(failureflags.reload_config)
+        with SidecarSimulator([{"guid": "1"}], unixSocket=self.socketPath) as sidecar:
+            flag = failureflags.FailureFlag("uds", {}, timeout=1, endpoint=sidecar.endpoint)
+            assert asyncio.run(flag.afetch()) == [{"guid": "1"}]
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import failureflags
+from failureflags.warm import loadManifest
+from failureflags.testing import SidecarSimulator
+
+EXPERIMENTS = [{"guid": "1", "rate": 0, "effect": {}}]
+
+class TestRegister(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        failureflags.unregister()
+        failureflags.disable_cache()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_loadManifest(self):
+        path = os.path.join(self.dir, "flags.json")
+        with open(path, "w") as f:
+            json.dump({"flags": [{"name": "http-ingress"}, {"name": "db", "labels": {"table": "users"}}]}, f)
+        assert loadManifest(path) == [("http-ingress", {}), ("db", {"table": "users"})]
+        with open(path, "w") as f:
+            json.dump([{"labels": {}}], f)
+        with self.assertRaises(ValueError):
+            loadManifest(path)
+
+    def test_disabled(self):
+        with patch.dict(os.environ, {}, clear=True):
+            failureflags.reload_config()
+            self.addCleanup(failureflags.reload_config)
+            assert failureflags.register(["warm"]) is None
+            assert failureflags.cache_stats() is None
+
+    def test_prefetchesDeclaredFlags(self):
+        with SidecarSimulator(EXPERIMENTS) as sidecar:
+            with patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE", "FAILURE_FLAGS_ENDPOINT": sidecar.endpoint}):
+                failureflags.reload_config()
+                self.addCleanup(failureflags.reload_config)
+                warmer = failureflags.register(["warm-a", ("warm-b", {"x": "1"}), {"name": "warm-a"}], wait=5)
+                assert warmer.rounds >= 1 and len(warmer.flags) == 2
+                assert [path for path, _ in sidecar.requests] == ["/experiments"]
+                assert failureflags.cache_stats()["size"] == 2
+
+                active, impacted, experiments = failureflags.FailureFlag("warm-b", {"x": "1"}, timeout=1).invoke()
+                assert active and not impacted and experiments[0]["guid"] == "1"
+                assert len(sidecar.requests) == 1
+
+    def test_keepsFlagsWarm(self):
+        with SidecarSimulator(EXPERIMENTS) as sidecar:
+            with patch.dict(os.environ, {"FAILURE_FLAGS_ENABLED": "TRUE", "FAILURE_FLAGS_ENDPOINT": sidecar.endpoint}):
+                failureflags.reload_config()
+                self.addCleanup(failureflags.reload_config)
+                warmer = failureflags.register(["warm-c"], interval=.02, wait=5)
+                deadline = time.monotonic() + 5
+                while warmer.rounds < 3 and time.monotonic() < deadline:
+                    time.sleep(.01)
+                assert warmer.rounds >= 3 and warmer.failures == 0
+                failureflags.unregister()
+                rounds = warmer.rounds
+                time.sleep(.1)
+                assert warmer.rounds <= rounds + 1
+
+if __name__ == '__main__':
+    unittest.main()